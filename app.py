@@ -1,55 +1,382 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
-import os, uuid, cv2
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, abort, g, stream_with_context
+import os, uuid, base64, json, threading, time, tempfile, hmac
 from werkzeug.utils import secure_filename
-from core import process_query
-from internal.brain_model import classify_image
-from internal.brain_tumor_mask import predict_mask
+from internal.cache import BlobCache
+from internal.model_registry import registry
+from internal import preload
+import internal.metrics as metrics
 import logging, sys
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
+# Worker role: "all", "chat" (no imaging models) or "imaging" (no chat engines)
+ROLE = os.environ.get("HEALTHBOT_ROLE", "all")
+CHAT_ENABLED = ROLE in ("all", "chat")
+IMAGING_ENABLED = ROLE in ("all", "imaging")
+
+if CHAT_ENABLED:
+    from core import process_query, process_query_stream, process_queries, reload_knowledge, knowledge_stats
+    from internal.sessions import new_session_id, valid_session_id
+if IMAGING_ENABLED:
+    # Models register lazily: nothing heavy is loaded by these imports
+    import numpy as np
+    from internal.brain_model import submit_classify, class_probabilities, classifier_scheduler, weights_path, \
+        CLASS_NAMES, IMG_HEIGHT, IMG_WIDTH, BRAIN_CLASSIFIER_BACKEND, classifier_calibration
+    from internal.brain_tumor_mask import submit_mask, submit_mask_mode, segment_volume, segmenter_scheduler, \
+        tile_scheduler, weights_file, SEG_BACKEND, SEG_INPUT_SIZE, SEG_MODE, SEG_MODES, SEG_TILE_OVERLAP, \
+        seg_calibration
+    from internal.image_io import decode_image, encode_png, Volume, MaskStackWriter
+    from internal.inference import InferenceExecutor, Overloaded
+    from internal.prediction_cache import PredictionCache
+
 app = Flask(__name__)
 
-# Ensure upload folder exists
+def require_role(enabled):
+    if not enabled:
+        abort(404)
+
+# Admin routes require "X-Admin-Token: <token>"; without HEALTHBOT_ADMIN_TOKEN they are disabled
+ADMIN_TOKEN = os.environ.get("HEALTHBOT_ADMIN_TOKEN")
+
+def require_admin():
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        abort(403)
+
+# Per-request stage breakdown, returned as a Server-Timing header when
+# HEALTHBOT_TIMING_HEADER=1 or the client sends "X-Debug-Timing: 1"
+TIMING_HEADER = os.environ.get("HEALTHBOT_TIMING_HEADER", "0") == "1"
+
+@app.before_request
+def _start_timing():
+    if metrics.ENABLED:
+        g.metrics_token = metrics.begin_request()
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def _finish_timing(response):
+    if metrics.ENABLED and "metrics_token" in g:
+        total = time.perf_counter() - g.request_start
+        timings = metrics.end_request(g.metrics_token)
+        metrics.observe(f"http_{request.endpoint or 'unknown'}", total)
+        if TIMING_HEADER or request.headers.get("X-Debug-Timing") == "1":
+            timings["total"] = total
+            response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+if os.environ.get("HEALTHBOT_WARMUP", "0") == "1":
+    # Load this role's models in the background; requests may arrive meanwhile
+    threading.Thread(target=registry.warm_up, name="model-warmup", daemon=True).start()
+
+# Uploads and masks stay in memory; set SAVE_UPLOADS=1 to also keep them on disk
 UPLOAD_FOLDER = "internal/storage/uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+SAVE_UPLOADS = os.environ.get("SAVE_UPLOADS", "0") == "1"
+if SAVE_UPLOADS:
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+# Recently generated masks, served from /masks/<id>.png
+mask_cache = BlobCache(int(os.environ.get("MASK_CACHE_BYTES", 64 * 1024 * 1024)))
+
+if IMAGING_ENABLED:
+    # /brain/segment results keyed by upload bytes + weights + preprocessing;
+    # PREDICTION_CACHE_DIR adds a disk tier shared by workers and restarts
+    prediction_cache = PredictionCache(
+        weight_files=[weights_path, str(weights_file)],
+        settings={
+            "classifier_input": [IMG_HEIGHT, IMG_WIDTH],
+            "class_names": CLASS_NAMES,
+            "classifier_backend": BRAIN_CLASSIFIER_BACKEND,
+            "classifier_calibration": classifier_calibration(),
+            "seg_backend": SEG_BACKEND,
+            "seg_calibration": seg_calibration(),
+            "seg_input": SEG_INPUT_SIZE,
+            "seg_tile_overlap": SEG_TILE_OVERLAP,
+        },
+        max_bytes=int(os.environ.get("PREDICTION_CACHE_BYTES", 128 * 1024 * 1024)),
+        disk_dir=os.environ.get("PREDICTION_CACHE_DIR") or None,
+        disk_max_bytes=int(os.environ.get("PREDICTION_CACHE_DISK_BYTES", 1024 * 1024 * 1024)),
+        enabled=os.environ.get("PREDICTION_CACHE", "1") == "1",
+    )
+    metrics.register_gauge("cache_hit_ratio", lambda: prediction_cache.stats()["hit_ratio"], cache="predictions")
+    # Both models per upload, in parallel; 503 once INFERENCE_MAX_PENDING uploads are in flight
+    inference = InferenceExecutor(submit_classify, submit_mask,
+                                  max_pending=int(os.environ.get("INFERENCE_MAX_PENDING", 32)))
+
+def segment_upload(data, mode):
+    """Runs both models on an upload: the entry stored in prediction_cache."""
+    # Decode once; both models preprocess from the same array
+    with metrics.stage("image_decode"):
+        img = decode_image(data)
+    predictions, mask = inference.run(img, segment=lambda img: submit_mask_mode(img, mode))
+    pred, probabilities = class_probabilities(predictions)
+    with metrics.stage("mask_encode"):
+        mask_png = encode_png(mask)
+    return {"prediction": pred, "probabilities": probabilities, "mask_png": mask_png}
 
 @app.route("/")
 def index():
     return render_template("index.html")  # из templates/
 
+# Streaming /chat: {"stream": true} or an Accept header of application/x-ndjson
+# (one JSON event per line) or text/event-stream (SSE). Events: ack, chunk..., done
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def stream_format(data, accept: str):
+    """"sse", "ndjson" or None for a plain JSON response."""
+    if "text/event-stream" in accept:
+        return "sse"
+    if data.get("stream") or "application/x-ndjson" in accept:
+        return "ndjson"
+    return None
+
+def with_session(events, session_id):
+    for event in events:
+        if event["type"] == "ack":
+            event["session_id"] = session_id
+        yield event
+
+def format_event(event, fmt) -> str:
+    payload = json.dumps(event, ensure_ascii=False)
+    return f"event: {event['type']}\ndata: {payload}\n\n" if fmt == "sse" else payload + "\n"
+
+STREAM_MIMETYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
 @app.route("/chat", methods=["POST"])
 def chat():
+    require_role(CHAT_ENABLED)
     data = request.get_json(force=True)
     txt = data.get("message", "").strip()
     if not txt:
         return jsonify({"error": "message is required"}), 400
-    return jsonify(process_query(txt))
+    # Unknown or malformed ids start a fresh session; the client keeps the returned one
+    session_id = data.get("session_id")
+    if not valid_session_id(session_id):
+        session_id = new_session_id()
+    fmt = stream_format(data, request.headers.get("Accept", ""))
+    if fmt:
+        events = with_session(process_query_stream(txt, session_id=session_id), session_id)
+        return Response(stream_with_context(format_event(event, fmt) for event in events),
+                        mimetype=STREAM_MIMETYPES[fmt], headers=STREAM_HEADERS)
+    result = process_query(txt, session_id=session_id)
+    result["session_id"] = session_id
+    return jsonify(result)
+
+# Bulk runs (QA, triage analytics): {"messages": [...]} -> one JSON line per message
+CHAT_BATCH_MAX = int(os.environ.get("CHAT_BATCH_MAX", 10000))
+
+@app.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    require_role(CHAT_ENABLED)
+    data = request.get_json(force=True)
+    messages = data.get("messages") if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        return jsonify({"error": "messages must be a list of strings"}), 400
+    if len(messages) > CHAT_BATCH_MAX:
+        return jsonify({"error": f"at most {CHAT_BATCH_MAX} messages per batch"}), 413
+    # Without a session id the batch runs in a throwaway session
+    session_id = data.get("session_id")
+    if session_id is not None and not valid_session_id(session_id):
+        return jsonify({"error": "invalid session_id"}), 400
+    results = process_queries([m.strip() for m in messages], session_id)
+    lines = (json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
 
 @app.route("/brain/segment", methods=["POST"])
 def brain_segment():
+    require_role(IMAGING_ENABLED)
     if "image" not in request.files:
         return jsonify({"error": "Missing 'image'"}), 400
     f = request.files["image"]
     if not f.filename:
         return jsonify({"error": "No file selected"}), 400
-    ext = os.path.splitext(f.filename)[1]
-    fn = f"{uuid.uuid4().hex}{ext}"
-    path = os.path.join(UPLOAD_FOLDER, secure_filename(fn))
-    f.save(path)
+    # resize: one 256x256 pass; tiled: overlapping tiles at native resolution
+    mode = request.args.get("mode", SEG_MODE)
+    if mode not in SEG_MODES:
+        return jsonify({"error": f"Unknown mode {mode!r}, expected one of {list(SEG_MODES)}"}), 400
+    data = f.read()
     try:
-        pred = classify_image(path)
-        mask = predict_mask(path)
-        mask_fn = fn.replace(ext, "_mask.jpg")
-        mask_path = os.path.join(UPLOAD_FOLDER, mask_fn)
-        cv2.imwrite(mask_path, mask)
-        return jsonify({
-            "prediction": pred,
-            "mask_image_url": f"/uploads/{mask_fn}"
-        })
+        # Content-addressed: identical uploads share the id and skip both models
+        mask_id = prediction_cache.key(data, mode) if prediction_cache.enabled else uuid.uuid4().hex
+        entry, cached = prediction_cache.get_or_compute(mask_id, lambda: segment_upload(data, mode))
+        mask_png = entry["mask_png"]
+        mask_cache.put(mask_id, mask_png)
+        result = {
+            "prediction": entry["prediction"],
+            "probabilities": entry["probabilities"],
+            "mask_image_url": f"/masks/{mask_id}.png",
+            "cached": cached,
+        }
+        if request.args.get("inline") == "1":
+            result["mask_image"] = "data:image/png;base64," + base64.b64encode(mask_png).decode("ascii")
+        if SAVE_UPLOADS:
+            with metrics.stage("upload_save"):
+                ext = os.path.splitext(f.filename)[1]
+                mask_path = os.path.join(UPLOAD_FOLDER, f"{mask_id}_mask.png")
+                if not (cached and os.path.exists(mask_path)):
+                    with open(os.path.join(UPLOAD_FOLDER, secure_filename(f"{mask_id}{ext}")), "wb") as out:
+                        out.write(data)
+                    with open(mask_path, "wb") as out:
+                        out.write(mask_png)
+        return jsonify(result)
+    except Overloaded as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def parse_spacing(value):
+    """"row,col[,slice]" voxel spacing in mm -> tuple of floats, or None."""
+    if not value:
+        return None
+    spacing = tuple(float(part) for part in value.split(","))
+    if len(spacing) not in (2, 3) or min(spacing) <= 0:
+        raise ValueError("spacing must be 'row_mm,col_mm[,slice_mm]' with positive values")
+    return spacing
+
+@app.route("/brain/segment/volume", methods=["POST"])
+def brain_segment_volume():
+    """
+    Segments every slice of a multi-slice scan (.npy or multi-page TIFF).
+    Returns per-slice and total tumour areas and a mask stack (.npz).
+    """
+    require_role(IMAGING_ENABLED)
+    if "volume" not in request.files:
+        return jsonify({"error": "Missing 'volume'"}), 400
+    mode = request.form.get("mode", SEG_MODE)
+    if mode not in SEG_MODES:
+        return jsonify({"error": f"Unknown mode {mode!r}, expected one of {list(SEG_MODES)}"}), 400
+    try:
+        spacing = parse_spacing(request.form.get("spacing"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Spooled to a temp file so slices can be read a batch at a time
+    fd, path = tempfile.mkstemp(prefix="volume-")
+    os.close(fd)
+    try:
+        request.files["volume"].save(path)
+        volume = Volume(path)
+        stack = MaskStackWriter(volume.slices, volume.height, volume.width)
+        per_slice = []
+        with inference.admit(timed=False), metrics.stage("segment_volume"):
+            for index, mask in enumerate(segment_volume(volume, mode)):
+                stack.write(mask)
+                pixels = int(np.count_nonzero(mask))
+                entry = {"slice": index, "tumor_pixels": pixels, "tumor_fraction": pixels / mask.size}
+                if spacing:
+                    entry["tumor_area_mm2"] = pixels * spacing[0] * spacing[1]
+                per_slice.append(entry)
+        with metrics.stage("mask_encode"):
+            stack_id = uuid.uuid4().hex
+            mask_cache.put(stack_id, stack.close())
+        total = sum(entry["tumor_pixels"] for entry in per_slice)
+        result = {
+            "mode": mode,
+            "shape": [volume.slices, volume.height, volume.width],
+            "slices": per_slice,
+            "tumor_slices": sum(1 for entry in per_slice if entry["tumor_pixels"]),
+            "tumor_pixels": total,
+            "largest_slice": max(per_slice, key=lambda entry: entry["tumor_pixels"])["slice"] if total else None,
+            "mask_stack_url": f"/masks/{stack_id}.npz",
+        }
+        if spacing and len(spacing) == 3:
+            result["tumor_volume_mm3"] = total * spacing[0] * spacing[1] * spacing[2]
+        return jsonify(result)
+    except Overloaded as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        os.remove(path)
+
+@app.route("/masks/<mask_id>.npz")
+def get_mask_stack(mask_id):
+    stack = mask_cache.get(mask_id)
+    if stack is None:
+        abort(404)
+    return Response(stack, mimetype="application/octet-stream",
+                    headers={"Cache-Control": "private, max-age=3600",
+                             "Content-Disposition": f"attachment; filename={mask_id}.npz"})
+
+@app.route("/masks/<mask_id>.png")
+def get_mask(mask_id):
+    mask_png = mask_cache.get(mask_id)
+    if mask_png is None:
+        if SAVE_UPLOADS:
+            return send_from_directory(UPLOAD_FOLDER, secure_filename(f"{mask_id}_mask.png"))
+        abort(404)
+    return Response(mask_png, mimetype="image/png", headers={"Cache-Control": "private, max-age=3600"})
+
+@app.route("/brain/batching")
+def brain_batching_stats():
+    require_role(IMAGING_ENABLED)
+    return jsonify({
+        "classifier": classifier_scheduler.stats(),
+        "segmenter": segmenter_scheduler.stats(),
+        "segmenter_tiles": tile_scheduler.stats(),
+        "executor": inference.stats(),
+    })
+
+@app.route("/brain/cache")
+def brain_cache_stats():
+    require_role(IMAGING_ENABLED)
+    return jsonify({"predictions": prediction_cache.stats(), "masks": mask_cache.stats()})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/health/cache")
+def cache_health():
+    require_role(CHAT_ENABLED)
+    from internal.response_cache import response_cache
+    from internal.wiki_client import wiki_client
+    return jsonify({"responses": response_cache.stats(), "wiki": wiki_client.cache_stats()})
+
+@app.route("/health/knowledge")
+def knowledge_health():
+    require_role(CHAT_ENABLED)
+    return jsonify(knowledge_stats())
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    # Rebuilds in the background of this worker only; other workers pick
+    # file changes up by polling (KNOWLEDGE_RELOAD_INTERVAL)
+    require_role(CHAT_ENABLED)
+    require_admin()
+    data = request.get_json(silent=True) or {}
+    try:
+        result = reload_knowledge(data.get("sources"), wait=bool(data.get("wait")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 200 if data.get("wait") else 202
+
+@app.route("/health/models")
+def model_status():
+    return jsonify({"role": ROLE, "models": registry.status()})
+
+# Unique vs shared memory of this worker; with pre-fork serving (gunicorn.conf.py)
+# the preloaded models and index count as shared
+@app.route("/health/memory")
+def memory_health():
+    return jsonify({
+        "pid": os.getpid(),
+        "role": ROLE,
+        "preloaded": preload.preloaded,
+        "shared_tensor_bytes": preload.shared_tensor_bytes,
+        "memory": preload.memory_usage(),
+    })
+
+for kind in ("uss", "pss", "shared", "rss"):
+    metrics.register_gauge("process_memory_bytes", lambda kind=kind: preload.memory_usage()[kind], kind=kind)
+
+@app.route("/health/models/warmup", methods=["POST"])
+def model_warmup():
+    require_admin()
+    return jsonify({"role": ROLE, "models": registry.warm_up()})
+
 @app.route("/uploads/<filename>")
 def get_uploaded_file(filename):
     return send_from_directory(UPLOAD_FOLDER, filename)
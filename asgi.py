@@ -0,0 +1,89 @@
+"""
+ASGI entry point: /chat runs natively on asyncio (core.process_query_async,
+or core.process_query_stream_async for streaming requests), every other
+route is served by the Flask app through WsgiToAsgi.
+
+    uvicorn asgi:application --workers 2
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+"""
+
+import json
+from asgiref.wsgi import WsgiToAsgi
+from app import app as flask_app, stream_format, format_event, STREAM_HEADERS, STREAM_MIMETYPES
+from core import process_query_async, process_query_stream_async
+from internal.sessions import new_session_id, valid_session_id
+from internal.wiki_client import async_wiki_client
+
+flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status: int, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_stream(send, fmt, events, session_id):
+    headers = [(b"content-type", f"{STREAM_MIMETYPES[fmt]}; charset=utf-8".encode())]
+    headers += [(name.lower().encode(), value.encode()) for name, value in STREAM_HEADERS.items()]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    async for event in events:
+        if event["type"] == "ack":
+            event["session_id"] = session_id
+        await send({"type": "http.response.body", "body": format_event(event, fmt).encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_wiki_client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def chat(scope, receive, send):
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        return await _send_json(send, 400, {"error": "invalid JSON"})
+    txt = str(data.get("message", "")).strip() if isinstance(data, dict) else ""
+    if not txt:
+        return await _send_json(send, 400, {"error": "message is required"})
+    session_id = data.get("session_id")
+    if not valid_session_id(session_id):
+        session_id = new_session_id()
+    accept = dict(scope["headers"]).get(b"accept", b"").decode("latin-1")
+    fmt = stream_format(data, accept)
+    if fmt:
+        return await _send_stream(send, fmt, process_query_stream_async(txt, session_id=session_id), session_id)
+    result = await process_query_async(txt, session_id=session_id)
+    result["session_id"] = session_id
+    await _send_json(send, 200, result)
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] == "http" and scope["path"] == "/chat" and scope["method"] == "POST":
+        return await chat(scope, receive, send)
+    await flask_asgi(scope, receive, send)
@@ -0,0 +1,96 @@
+"""
+AIML kernel boot: raw XML bootstrap vs the precompiled brain file.
+
+Synthetic AIML files with the given numbers of categories (one topic per
+category, a mix of literal and wildcard patterns, some <srai>) are booted
+both ways, for a pool of --kernels kernels as the chat session pool does;
+the one-off compile cost is reported separately. Responses of both kernels
+are compared on a sample of inputs.
+
+Run from the repository root:
+    python -m benchmarks.bench_aiml_brain --categories 20 2000 20000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import aiml
+
+from internal.aiml_brain import clear_loaded, compile_brain, load_kernel
+
+
+def synthetic_aiml(path, n):
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<aiml version="1.0.1">\n')
+        for i in range(n):
+            topic = f"TOPIC{i}"
+            if i % 3 == 0:
+                f.write(f"<category><pattern>WHAT IS {topic}</pattern><template>#1${topic}</template></category>\n")
+            elif i % 3 == 1:
+                f.write(f"<category><pattern>HOW TO TREAT {topic} *</pattern><template>#4${topic} <star/></template></category>\n")
+            else:
+                f.write(f"<category><pattern>TELL ME ABOUT {topic}</pattern>"
+                        f"<template><srai>WHAT IS TOPIC{i - 2}</srai></template></category>\n")
+        f.write("</aiml>\n")
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def raw_bootstrap(path):
+    kernel = aiml.Kernel()
+    kernel.verbose(False)
+    kernel.setTextEncoding(None)
+    kernel.bootstrap(learnFiles=path)
+    return kernel
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--categories", type=int, nargs="+", default=[20, 2000, 20000])
+    parser.add_argument("--kernels", type=int, default=4, help="kernels booted per measurement")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aiml-brain-bench-")
+    try:
+        for n in args.categories:
+            source = os.path.join(workdir, f"bench-{n}.aiml")
+            brain_dir = os.path.join(workdir, f"brain-{n}")
+            synthetic_aiml(source, n)
+
+            def raw_pool():
+                return [raw_bootstrap(source) for _ in range(args.kernels)]
+
+            def brain_pool():
+                clear_loaded()
+                return [load_kernel([source], brain_dir) for _ in range(args.kernels)]
+
+            raw, raw_kernels = best_of(raw_pool, args.repeat)
+            start = time.perf_counter()
+            compile_brain([source], brain_dir)
+            compiled = time.perf_counter() - start
+            loaded, brain_kernels = best_of(brain_pool, args.repeat)
+            raw_kernel, brain_kernel = raw_kernels[0], brain_kernels[-1]
+
+            step = 3 * max(1, n // 150)
+            probes = [f"what is topic{i}" for i in range(0, n, step)]
+            probes += [f"how to treat topic{i} quickly" for i in range(1, n, step)]
+            assert all(raw_kernel.respond(p) == brain_kernel.respond(p) for p in probes)
+            size = sum(os.path.getsize(os.path.join(brain_dir, f)) for f in os.listdir(brain_dir))
+            print(f"{n:>6d} categories x{args.kernels}  bootstrap {raw * 1e3:9.1f} ms  brain load {loaded * 1e3:8.1f} ms  "
+                  f"({raw / loaded:5.1f}x)  compile {compiled * 1e3:9.1f} ms  brain {size / 1024:8.1f} KiB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Brain imaging: micro-batched vs per-request inference on CPU.
+
+Submits preprocessed random images from N concurrent threads to a
+BatchScheduler wrapping the Keras classifier and the UNet segmenter, and
+reports images/sec for each concurrency level. max_batch_size=1 is the
+unbatched baseline.
+
+Run from the repository root:
+    python -m benchmarks.bench_brain_batching --concurrency 1 4 16 --max-batch 1 8 16
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from internal.batching import BatchScheduler
+from internal.brain_model import IMG_HEIGHT, IMG_WIDTH, predict_batch
+from internal.brain_tumor_mask import predict_mask_batch
+
+
+def throughput(scheduler, samples, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(scheduler.predict, samples))
+        elapsed = time.perf_counter() - start
+    return len(samples) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 8, 16])
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--images", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    models = {
+        "classifier": (predict_batch, rng.random((args.images, IMG_HEIGHT, IMG_WIDTH, 3), dtype=np.float32)),
+        "segmenter": (predict_mask_batch, rng.random((args.images, 1, 256, 256), dtype=np.float32)),
+    }
+    for name, (run_batch, samples) in models.items():
+        run_batch(samples[:2])  # warm-up
+        for max_batch in args.max_batch:
+            for concurrency in args.concurrency:
+                scheduler = BatchScheduler(name, run_batch, max_batch, args.max_wait_ms)
+                rate = throughput(scheduler, list(samples), concurrency)
+                stats = scheduler.stats()
+                print(f"{name:10s} max_batch={max_batch:3d} concurrency={concurrency:3d}  "
+                      f"{rate:7.1f} img/s  avg batch {stats['avg_batch_size']:5.2f}  "
+                      f"max queue {stats['max_queue_depth']}")
+
+
+if __name__ == "__main__":
+    main()
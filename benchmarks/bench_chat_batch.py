@@ -0,0 +1,83 @@
+"""
+Batch chat API: core.process_queries vs one process_query call per message.
+
+A synthetic log of --messages user messages is built from the Q&A CSV
+(questions as asked, lower-cased, truncated), fever descriptions, KB checks
+and small talk, with repeats like a real history. Both paths run with the
+response cache off, so the engines do all the work; every batch answer is
+compared with the single-call answer. Wikipedia commands are answered from
+the snapshot store only (WIKI_OFFLINE=1), so the network is not measured.
+Finally /chat/batch is called through the Flask test client to check the
+NDJSON stream.
+
+Run from the repository root:
+    python -m benchmarks.bench_chat_batch --messages 5000
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+os.environ["RESPONSE_CACHE"] = "0"
+os.environ.setdefault("WIKI_OFFLINE", "1")
+
+import pandas as pd
+
+import core
+from app import app
+
+EXTRA = ["hello", "how are you", "i have fever 38 and heart rate 90", "i have fever 39.5 and heart rate 120",
+         "i have a mild fever", "check that cough is a symptom of flu", "what is cough a symptom of",
+         "tell me something about sleeping well"]
+
+
+def synthetic_log(csv_path, n, seed=0):
+    rng = random.Random(seed)
+    questions = list(pd.read_csv(csv_path)["question"])
+    log = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.6:
+            question = rng.choice(questions)
+            words = question.lower().rstrip("?").split()
+            log.append(" ".join(words[:rng.randint(max(1, len(words) - 3), len(words))]))
+        else:
+            log.append(rng.choice(EXTRA))
+    return log
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", default=core.QNA_FILE)
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+
+    messages = synthetic_log(args.csv, args.messages)
+    core.init_once()
+    print(f"{len(messages)} messages, {len(set(messages))} distinct")
+
+    start = time.perf_counter()
+    single = [core.process_query(m, session_id="bench-single")["answer"] for m in messages]
+    single_time = time.perf_counter() - start
+    print(f"process_query per message  {single_time:7.2f} s  {len(messages) / single_time:8.0f} msg/s")
+
+    start = time.perf_counter()
+    batch = [result["answer"] for result in core.process_queries(messages)]
+    batch_time = time.perf_counter() - start
+    same = sum(a == b for a, b in zip(single, batch)) / len(messages)
+    print(f"process_queries            {batch_time:7.2f} s  {len(messages) / batch_time:8.0f} msg/s  "
+          f"x{single_time / batch_time:.1f}  identical answers {same:.2%}")
+
+    start = time.perf_counter()
+    response = app.test_client().post("/chat/batch", json={"messages": messages})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    http_time = time.perf_counter() - start
+    in_order = [line["index"] for line in lines] == list(range(len(messages)))
+    print(f"/chat/batch (NDJSON)       {http_time:7.2f} s  {len(messages) / http_time:8.0f} msg/s  "
+          f"status {response.status_code}  {len(lines)} lines in order: {in_order}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Brain classifier: top-1 agreement, latency and RSS of each inference backend.
+
+Every backend runs in a fresh interpreter (BRAIN_CLASSIFIER_BACKEND=<name>)
+so its RSS only counts what it loads: TensorFlow for keras, the TFLite
+interpreter (standalone when installed and the model is already converted)
+for tflite / tflite-int8. Each process classifies the same fixture set and
+reports its predictions, single-image latency, batched throughput and RSS.
+Predictions are compared with the Keras model: top-1 agreement (the run
+fails below --min-agreement) and the largest probability difference.
+Run once beforehand to convert the TFLite models (cached in
+internal/storage/classifier_cache), so conversion is not measured.
+
+Run from the repository root:
+    python -m benchmarks.bench_classifier_backends --fixtures path/to/scans --images 200
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from internal.classifier_backends import BACKENDS
+
+
+def load_fixtures(path, limit):
+    from internal.brain_model import preprocess_array
+
+    if path:
+        images = []
+        for name in sorted(os.listdir(path))[:limit]:
+            img = cv2.imread(os.path.join(path, name))
+            if img is not None:
+                images.append(preprocess_array(img)[0])
+        return np.stack(images)
+    # Smooth random blobs stand in for scans when no fixtures are given
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (limit, 24, 24, 3), dtype=np.uint8)
+    return np.stack([preprocess_array(cv2.resize(n, (300, 300)))[0] for n in noise])
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+
+
+def probe(args):
+    """Runs in the child: load the configured backend and measure it."""
+    from internal.brain_model import BRAIN_CLASSIFIER_BACKEND, predict_batch
+
+    samples = load_fixtures(args.fixtures, args.images)
+    before = rss_mb()
+    start = time.perf_counter()
+    predict_batch(samples[:1])
+    load = time.perf_counter() - start
+    latencies = []
+    for sample in samples:
+        start = time.perf_counter()
+        predict_batch(sample[None])
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    probabilities = np.concatenate([predict_batch(samples[i:i + args.batch])
+                                    for i in range(0, len(samples), args.batch)])
+    batched = time.perf_counter() - start
+    print(json.dumps({
+        "backend": BRAIN_CLASSIFIER_BACKEND,
+        "load_s": load,
+        "p50_ms": float(np.percentile(latencies, 50) * 1e3),
+        "p95_ms": float(np.percentile(latencies, 95) * 1e3),
+        "images_per_s": len(samples) / batched,
+        "rss_mb": rss_mb(),
+        "model_rss_mb": rss_mb() - before,
+        "heavy_modules": sorted(m for m in ("tensorflow", "tflite_runtime", "ai_edge_litert") if m in sys.modules),
+        "probabilities": probabilities.tolist(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fixtures", help="directory of scans (default: synthetic images)")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--min-agreement", type=float, default=0.98,
+                        help="exit non-zero if any backend agrees with Keras on fewer top-1 predictions")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.probe:
+        return probe(args)
+
+    results = {}
+    for backend in ["keras"] + [b for b in args.backends if b != "keras"]:
+        command = [sys.executable, "-m", "benchmarks.bench_classifier_backends", "--probe",
+                   "--images", str(args.images), "--batch", str(args.batch)]
+        if args.fixtures:
+            command += ["--fixtures", args.fixtures]
+        env = dict(os.environ, BRAIN_CLASSIFIER_BACKEND=backend)
+        # tflite-int8 is calibrated on the fixtures, like bench_seg_backends; synthetic ones are noise anyway
+        if args.fixtures:
+            env.setdefault("CLASSIFIER_CALIBRATION_DIR", args.fixtures)
+        else:
+            env.setdefault("CLASSIFIER_RANDOM_CALIBRATION", "1")
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+        results[backend] = json.loads(output.strip().splitlines()[-1])
+
+    reference = np.array(results["keras"]["probabilities"])
+    failed = []
+    for backend, result in results.items():
+        probabilities = np.array(result["probabilities"])
+        agreement = (probabilities.argmax(1) == reference.argmax(1)).mean()
+        print(f"{backend:12s} top-1 agreement {agreement:7.2%}  max |dp| {np.abs(probabilities - reference).max():.4f}  "
+              f"p50 {result['p50_ms']:6.2f} ms  p95 {result['p95_ms']:6.2f} ms  "
+              f"{result['images_per_s']:7.1f} img/s (batch {args.batch})  load {result['load_s']:5.2f} s  "
+              f"RSS {result['rss_mb']:6.0f} MB (model +{result['model_rss_mb']:.0f})  {result['heavy_modules']}")
+        if agreement < args.min_agreement:
+            failed.append(backend)
+    if failed:
+        sys.exit(f"top-1 agreement below {args.min_agreement:.0%}: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
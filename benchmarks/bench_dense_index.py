@@ -0,0 +1,64 @@
+"""
+Dense retrieval tier: IVF recall and latency against brute-force search.
+
+Synthetic L2-normalised embeddings (a mixture of topic clusters, like LSA
+vectors of a Q&A corpus) are indexed with IvfIndex, float32 and int8.
+Queries are noisy copies of random entries. Recall@k is measured against
+exact float32 search for several nprobe values, with per-query latency.
+
+Run from the repository root:
+    python -m benchmarks.bench_dense_index --sizes 10000 100000 1000000
+"""
+
+import argparse
+import time
+import numpy as np
+
+from internal.dense_index import DENSE_DIM, IvfIndex
+
+
+def synthetic_vectors(n, dim, topics, rng):
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, topics, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=DENSE_DIM)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n in args.sizes:
+        vectors = synthetic_vectors(n, args.dim, max(10, n // 500), rng)
+        picks = rng.integers(0, n, args.queries)
+        # Noise of norm ~0.3 around unit vectors: a paraphrase of an indexed question
+        queries = vectors[picks] + (0.3 / np.sqrt(args.dim)) * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        exact = IvfIndex.build(vectors, nlist=1, quantize=False)
+        start = time.perf_counter()
+        truth = [{doc for doc, _ in exact.brute_force(q, args.k)} for q in queries]
+        brute = (time.perf_counter() - start) / args.queries
+        print(f"{n:>8d} vectors  brute force {brute * 1e3:8.3f} ms/query")
+
+        for quantize in (False, True):
+            start = time.perf_counter()
+            index = IvfIndex.build(vectors, quantize=quantize)
+            build = time.perf_counter() - start
+            for nprobe in args.nprobe:
+                start = time.perf_counter()
+                found = [index.search(q, args.k, nprobe) for q in queries]
+                latency = (time.perf_counter() - start) / args.queries
+                recall = np.mean([len(truth[i] & {doc for doc, _ in f}) / args.k for i, f in enumerate(found)])
+                print(f"          {'int8' if quantize else 'float32':7s} nlist {len(index.centroids):5d}  "
+                      f"nprobe {nprobe:3d}  recall@{args.k} {recall:6.3f}  {latency * 1e3:8.3f} ms/query  "
+                      f"(build {build:6.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
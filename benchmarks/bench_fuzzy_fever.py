@@ -0,0 +1,84 @@
+"""
+Fuzzy fever: compiled lookup engine vs per-request skfuzzy simulation.
+
+Checks that the precomputed concern surface matches ControlSystemSimulation
+on every input the chat can produce, then times both paths.
+
+Run from the repository root:
+    python -m benchmarks.bench_fuzzy_fever
+"""
+
+import argparse
+import time
+import numpy as np
+from skfuzzy import control as ctrl
+
+from internal.fuzzy_fever import build_fever_control_system, fever_engine
+
+CHAT_TEMPERATURES = (36.5, 37.5, 38.5, 40.0)
+
+
+def reference_concern(sim, temperature, heart_rate):
+    sim.input['temperature'] = temperature
+    sim.input['heart_rate'] = heart_rate
+    try:
+        sim.compute()
+        return sim.output['concern']
+    except (KeyError, ValueError):
+        # skfuzzy cannot defuzzify when no rule fires
+        return np.nan
+
+
+def check_equivalence(tolerance):
+    sim = ctrl.ControlSystemSimulation(build_fever_control_system(), cache=False)
+    pairs = [(t, hr) for t in CHAT_TEMPERATURES for hr in range(40, 181)]
+    pairs += [(float(t), 80.0) for t in fever_engine.temperature_universe]
+    worst = 0.0
+    for temperature, heart_rate in pairs:
+        expected = reference_concern(sim, temperature, heart_rate)
+        actual = float(fever_engine.concern_batch(temperature, heart_rate))
+        if np.isnan(expected) or np.isnan(actual):
+            assert np.isnan(expected) and np.isnan(actual), (temperature, heart_rate, expected, actual)
+            continue
+        worst = max(worst, abs(expected - actual))
+    assert worst <= tolerance, f"max abs difference {worst} > {tolerance}"
+    print(f"equivalence: {len(pairs)} pairs, max abs difference {worst:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=100_000)
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    fever_engine.surface
+    print(f"surface build: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    check_equivalence(args.tolerance)
+
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        sim = ctrl.ControlSystemSimulation(build_fever_control_system())
+        reference_concern(sim, 37.5, 60 + i % 40)
+    legacy = (time.perf_counter() - start) / args.repeat
+    print(f"skfuzzy rebuild + compute: {legacy * 1e3:.3f} ms/query")
+
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        fever_engine.concern(37.5, 60 + i % 40)
+    lookup = (time.perf_counter() - start) / args.repeat
+    print(f"engine lookup:             {lookup * 1e3:.3f} ms/query ({legacy / lookup:.0f}x)")
+
+    rng = np.random.default_rng(0)
+    temps = rng.choice(CHAT_TEMPERATURES, args.batch)
+    hrs = rng.integers(40, 181, args.batch)
+    start = time.perf_counter()
+    fever_engine.concern_batch(temps, hrs)
+    elapsed = time.perf_counter() - start
+    print(f"engine batch of {args.batch}: {elapsed * 1e3:.1f} ms ({elapsed / args.batch * 1e6:.2f} us/pair)")
+
+
+if __name__ == "__main__":
+    main()
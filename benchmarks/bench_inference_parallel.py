@@ -0,0 +1,101 @@
+"""
+/brain/segment end to end: parallel vs serial classifier + segmenter.
+
+--uploads random scans (PNG) are posted through the Flask test client from
+1, 4 and 16 concurrent clients, once with the serial path (classify, then
+segment) and once with both models submitted together. The prediction
+cache is off so every upload runs both models. Reports median / p95
+latency and uploads/sec. Both runs use the same per-runtime thread split
+(printed first); run with INFERENCE_PARALLEL=0 to give each runtime every
+core, as the serial path did before.
+Finally --burst uploads are sent at once to an executor limited to
+--max-pending to show the 503 + Retry-After backpressure.
+--random-weights runs untrained models, for checkouts without the weights
+files (latency is the same, the predictions are meaningless).
+
+Run from the repository root:
+    python -m benchmarks.bench_inference_parallel --concurrency 1 4 16 --uploads 64
+"""
+
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["PREDICTION_CACHE"] = "0"
+
+import numpy as np
+
+import app as app_module
+from internal.brain_model import submit_classify
+from internal.brain_tumor_mask import submit_mask
+from internal.model_registry import registry
+from internal.image_io import encode_png
+from internal.inference import InferenceExecutor
+
+
+def post(png):
+    start = time.perf_counter()
+    response = app_module.app.test_client().post(
+        "/brain/segment", data={"image": (io.BytesIO(png), "scan.png")}, content_type="multipart/form-data")
+    return time.perf_counter() - start, response.status_code, response.headers.get("Retry-After")
+
+
+def load(uploads, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(post, uploads))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--uploads", type=int, default=64)
+    parser.add_argument("--burst", type=int, default=32)
+    parser.add_argument("--max-pending", type=int, default=4)
+    parser.add_argument("--random-weights", action="store_true",
+                        help="use untrained models when the weights files are unavailable")
+    args = parser.parse_args()
+
+    if args.random_weights:
+        import torch
+        from internal import brain_model, brain_tumor_mask, classifier_backends, seg_backends
+        from internal.unet import UNet
+
+        torch.manual_seed(0)
+        registry.register("brain_classifier", lambda: classifier_backends.build_backend(
+            brain_model.build_brain_model, "keras", threads=brain_model.CLASSIFIER_THREADS))
+        registry.register("tumor_segmenter", lambda: seg_backends.build_backend(
+            UNet().eval(), brain_tumor_mask.SEG_BACKEND, threads=brain_tumor_mask.SEG_THREADS,
+            random_calibration=True))
+
+    rng = np.random.default_rng(0)
+    uploads = [encode_png(rng.integers(0, 256, (512, 512, 3), dtype=np.uint8)) for _ in range(args.uploads)]
+    print("threads", app_module.inference.stats()["threads"])
+    _, status, _ = post(uploads[0])  # model loading and warm-up are not measured
+    assert status == 200, registry.status()
+
+    for parallel in (False, True):
+        app_module.inference = InferenceExecutor(submit_classify, submit_mask, max_pending=args.uploads,
+                                                 parallel=parallel)
+        for concurrency in args.concurrency:
+            results, elapsed = load(uploads, concurrency)
+            assert all(status == 200 for _, status, _ in results), results
+            ms = np.array([latency for latency, _, _ in results]) * 1e3
+            print(f"{'parallel' if parallel else 'serial':8s} concurrency={concurrency:3d}  "
+                  f"p50 {np.percentile(ms, 50):8.1f} ms  p95 {np.percentile(ms, 95):8.1f} ms  "
+                  f"{len(uploads) / elapsed:6.1f} uploads/s")
+
+    app_module.inference = InferenceExecutor(submit_classify, submit_mask, max_pending=args.max_pending)
+    results, _ = load(uploads[:args.burst], args.burst)
+    rejected = [retry_after for _, status, retry_after in results if status == 503]
+    print(f"burst of {args.burst} with max_pending={args.max_pending}: "
+          f"{len(results) - len(rejected)} served, {len(rejected)} rejected with 503 "
+          f"(Retry-After {sorted(set(rejected))})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Knowledge base inference: materialisation, incremental adds and pattern queries.
+
+A synthetic KB is generated per size: Symptom facts over a disease taxonomy
+(Subtype chains a few levels deep) plus Good/Bad facts, with the rules from
+internal/storage/kb_rules.kb. For each size the full materialisation at
+start-up is timed, then single adds (each pushed through the rules
+semi-naively) and pattern queries, reported as p50/p99.
+
+Run from the repository root:
+    python -m benchmarks.bench_kb_inference --sizes 10000 100000 300000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from nltk.sem import Expression
+
+from internal.kb_inference import InferenceEngine, load_rules
+from internal.kb_methods import MAX_QUERY_ANSWERS
+from internal.kb_store import KnowledgeBase
+
+
+def synthetic_kb(n, branching=4, depth=3, seed=0):
+    """Disease taxonomy of `depth` levels under a few roots, and n facts in total."""
+    rng = random.Random(seed)
+    levels = [[f"Disease{i}" for i in range(max(1, n // 2000))]]
+    facts = []
+    for _ in range(depth):
+        children = []
+        for parent in levels[-1]:
+            for _ in range(branching):
+                child = f"Disease{len(facts) + len(children) + 100000}"
+                children.append(child)
+                facts.append(f"Subtype({child},{parent})")
+        levels.append(children)
+    diseases = [d for level in levels for d in level]
+    i = 0
+    while len(facts) < n:
+        if i % 10 == 0:
+            facts.append(f"Bad(Habit{i})")
+        else:
+            facts.append(f"Symptom(Sign{rng.randrange(n // 5 + 1)},{rng.choice(diseases)})")
+        i += 1
+    return facts, diseases
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 300000])
+    parser.add_argument("--adds", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rules = load_rules()
+    workdir = tempfile.mkdtemp(prefix="kb-infer-bench-")
+    try:
+        for n in args.sizes:
+            facts, diseases = synthetic_kb(n)
+            path = os.path.join(workdir, f"kb-{n}.kb")
+            with open(path, "w") as f:
+                f.write("\n".join(facts) + "\n")
+
+            start = time.perf_counter()
+            engine = InferenceEngine(KnowledgeBase(path), rules)
+            materialise = time.perf_counter() - start
+
+            rng = random.Random(1)
+            add_times = []
+            for i in range(args.adds):
+                expr = Expression.fromstring(f"Symptom(NewSign{i},{rng.choice(diseases[:len(diseases) // 4])})")
+                start = time.perf_counter()
+                engine.add(expr)
+                add_times.append(time.perf_counter() - start)
+
+            query_times = []
+            for i in range(args.queries):
+                pattern = (("Symptom", ("?x", rng.choice(diseases))) if i % 2 == 0
+                           else ("Symptom", (f"Sign{rng.randrange(n // 5 + 1)}", "?d")))
+                start = time.perf_counter()
+                engine.query(pattern, limit=MAX_QUERY_ANSWERS + 1)
+                query_times.append(time.perf_counter() - start)
+
+            add50, add99 = percentiles(add_times)
+            q50, q99 = percentiles(query_times)
+            print(f"{n:>7d} facts  derived {engine.stats()['derived']:>8d}  materialise {materialise:6.2f} s  "
+                  f"add p50 {add50 * 1e3:6.2f} ms p99 {add99 * 1e3:6.2f} ms  "
+                  f"query p50 {q50 * 1e3:6.3f} ms p99 {q99 * 1e3:6.3f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
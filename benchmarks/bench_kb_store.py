@@ -0,0 +1,105 @@
+"""
+Knowledge base: indexed append-only store vs the original list + full rewrite.
+
+For each KB size a synthetic kb_file is generated (Good/Bad/Symptom facts),
+then load time, membership lookups, adds and a pattern query are timed.
+The legacy list is only measured up to --legacy-max facts, since every
+lookup is a linear scan and every add rewrites the file.
+
+Run from the repository root:
+    python -m benchmarks.bench_kb_store --sizes 1000 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from nltk.sem import Expression
+
+from internal.kb_store import KnowledgeBase
+
+
+def synthetic_facts(n, seed=0):
+    rng = random.Random(seed)
+    diseases = [f"Disease{i}" for i in range(max(1, n // 50))]
+    facts = []
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.1:
+            facts.append(f"Good(Food{i})")
+        elif kind < 0.2:
+            facts.append(f"Bad(Habit{i})")
+        else:
+            facts.append(f"Symptom(Sign{i},{rng.choice(diseases)})")
+    return facts
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_store(path, facts, lookups, adds):
+    start = time.perf_counter()
+    kb = KnowledgeBase(path)
+    load = time.perf_counter() - start
+    probes = [Expression.fromstring(facts[i * 7919 % len(facts)]) for i in range(lookups)]
+    hit = timed(lambda i: probes[i] in kb, lookups)
+    add = timed(lambda i: kb.add(Expression.fromstring(f"Symptom(New{i},Disease0)")), adds)
+    query = timed(lambda i: kb.facts("Symptom", None, "Disease0"), 10)
+    return load, hit, add, query
+
+
+def bench_legacy(path, facts, lookups, adds):
+    start = time.perf_counter()
+    with open(path) as f:
+        kb = [Expression.fromstring(line.strip()) for line in f if line.strip()]
+    load = time.perf_counter() - start
+    probes = [Expression.fromstring(facts[i * 7919 % len(facts)]) for i in range(lookups)]
+    hit = timed(lambda i: probes[i] in kb, lookups)
+
+    def add(i):
+        expr = Expression.fromstring(f"Symptom(New{i},Disease0)")
+        if expr not in kb:
+            kb.append(expr)
+            with open(path, "w") as f:
+                for e in kb:
+                    f.write(str(e) + "\n")
+    add = timed(add, adds)
+    target = Expression.fromstring("Disease0")
+    query = timed(lambda i: [e for e in kb if str(e).startswith("Symptom(") and e.args[1] == target], 10)
+    return load, hit, add, query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--adds", type=int, default=50)
+    parser.add_argument("--legacy-max", type=int, default=100000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kb-bench-")
+    try:
+        for n in args.sizes:
+            facts = synthetic_facts(n)
+            runs = [("store", bench_store)]
+            if n <= args.legacy_max:
+                runs.append(("legacy", bench_legacy))
+            for name, bench in runs:
+                path = os.path.join(workdir, f"{name}-{n}.kb")
+                with open(path, "w") as f:
+                    f.write("\n".join(facts) + "\n")
+                load, hit, add, query = bench(path, facts, args.lookups, args.adds)
+                print(f"{n:>8d} {name:6s}  load {load:7.2f} s  lookup {hit * 1e6:10.1f} us  "
+                      f"add {add * 1e3:9.3f} ms  query {query * 1e3:9.3f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Prediction cache: /brain/segment latency for new vs repeated uploads.
+
+--images random scans are encoded as PNG uploads and posted through the
+Flask test client:
+  - cold: every upload is new, both models run
+  - memory: the same uploads again, answered from the in-memory tier
+  - disk: a fresh cache over the same PREDICTION_CACHE_DIR (as after a
+    restart or in another worker), answered from the disk tier
+  - retries: --concurrency identical new uploads at once; the models run
+    once and the other requests wait for that result
+Cached answers are compared with the cold ones.
+
+Run from the repository root:
+    python -m benchmarks.bench_prediction_cache --images 20 --concurrency 8
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["PREDICTION_CACHE_DIR"] = tempfile.mkdtemp(prefix="prediction-cache-")
+
+import numpy as np
+
+import app as app_module
+from internal.image_io import encode_png
+from internal.prediction_cache import PredictionCache
+
+
+def post(http, png):
+    start = time.perf_counter()
+    response = http.post("/brain/segment", data={"image": (io.BytesIO(png), "scan.png")},
+                         content_type="multipart/form-data")
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return elapsed, response.get_json()
+
+
+def run(label, http, uploads):
+    samples = [post(http, png) for png in uploads]
+    ms = np.array([elapsed for elapsed, _ in samples]) * 1e3
+    cached = sum(result["cached"] for _, result in samples)
+    print(f"{label:7s} {len(ms):4d} uploads  p50 {np.percentile(ms, 50):8.2f} ms  "
+          f"max {ms.max():8.2f} ms  cached {cached}/{len(ms)}")
+    return [result for _, result in samples]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    uploads = [encode_png(rng.integers(0, 256, (256, 256), dtype=np.uint8)) for _ in range(args.images + 1)]
+    http = app_module.app.test_client()
+    post(http, uploads[-1])  # model loading and warm-up are not measured
+
+    cold = run("cold", http, uploads[:-1])
+    memory = run("memory", http, uploads[:-1])
+    old = app_module.prediction_cache
+    app_module.prediction_cache = PredictionCache(old.weight_files, old.settings, disk_dir=old.disk_dir)
+    disk = run("disk", http, uploads[:-1])
+
+    strip = lambda results: [(r["prediction"], r["probabilities"], r["mask_image_url"]) for r in results]
+    print(f"identical to cold: memory {strip(memory) == strip(cold)}  disk {strip(disk) == strip(cold)}")
+
+    retry = encode_png(rng.integers(0, 256, (256, 256), dtype=np.uint8))
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda _: post(app_module.app.test_client(), retry), range(args.concurrency)))
+    cached = sum(result["cached"] for _, result in results)
+    print(f"retries {args.concurrency} identical concurrent uploads: models ran {args.concurrency - cached}x")
+    print(app_module.prediction_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Pre-fork serving: per-worker unique (USS) vs shared memory under gunicorn.
+
+Starts gunicorn with gunicorn.conf.py and --workers workers twice, with
+HEALTHBOT_PRELOAD=1 (models and chat knowledge loaded once in the master)
+and HEALTHBOT_PRELOAD=0 (every worker loads its own). After every worker has
+answered chat and imaging requests, the memory of each worker process is
+read from /proc/<pid>/smaps_rollup and summarised (PSS adds up to the real
+total), with how many workers would fit in --node-gb at the measured USS.
+
+Run from the repository root:
+    python -m benchmarks.bench_preload_memory --workers 4 --requests 40
+"""
+
+import argparse
+import io
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import requests
+
+from internal.image_io import encode_png
+from internal.preload import memory_usage
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == pid:
+                found.append(int(entry))
+    return sorted(found)
+
+
+def wait_ready(url, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + "/health/models", timeout=5).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    raise RuntimeError("gunicorn did not come up")
+
+
+def measure(preload, args):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, HEALTHBOT_PRELOAD="1" if preload else "0", GUNICORN_WORKERS=str(args.workers),
+               GUNICORN_BIND=f"127.0.0.1:{port}", PREDICTION_CACHE="0", WIKI_OFFLINE="1")
+    master = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url)
+        rng = np.random.default_rng(0)
+        # Enough requests that every worker loads and runs both models
+        for i in range(args.requests):
+            requests.post(url + "/chat", json={"message": "how much water should i drink"}, timeout=60)
+            png = encode_png(rng.integers(0, 256, (256, 256), dtype=np.uint8))
+            requests.post(url + "/brain/segment", files={"image": (f"{i}.png", io.BytesIO(png))}, timeout=120)
+        workers = children(master.pid)
+        return memory_usage(master.pid), {pid: memory_usage(pid) for pid in workers}
+    finally:
+        master.terminate()
+        master.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--node-gb", type=float, default=8.0)
+    args = parser.parse_args()
+
+    mb = 2 ** 20
+    for preload in (False, True):
+        master, workers = measure(preload, args)
+        print(f"preload={int(preload)}  master uss {master['uss'] / mb:7.1f} MB")
+        for pid, usage in workers.items():
+            print(f"  worker {pid:7d}  uss {usage['uss'] / mb:7.1f} MB  shared {usage['shared'] / mb:7.1f} MB  "
+                  f"pss {usage['pss'] / mb:7.1f} MB  rss {usage['rss'] / mb:7.1f} MB")
+        uss = np.mean([usage["uss"] for usage in workers.values()])
+        total = master["pss"] + sum(usage["pss"] for usage in workers.values())
+        print(f"  total pss {total / mb:7.1f} MB  "
+              f"~{int((args.node_gb * 2 ** 30 - master['pss']) // uss)} workers fit in {args.node_gb:g} GB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Knowledge hot reload: /chat under load while the sources are rebuilt.
+
+--threads clients hammer POST /chat (AIML small talk, TF-IDF fallback, KB
+checks and queries, fuzzy fever) through the Flask test client, each with
+its own session. Meanwhile the sources are reloaded --reloads times,
+alternating between POST /admin/reload (every part, forced) and touching the
+source files so the poller picks them up. Afterwards it checks that:
+  - every response succeeded and had an answer
+  - the versions each client saw never went backwards
+  - every reload bumped the versions, and sessions kept their predicates
+Latency is reported separately for requests that overlapped a reload.
+Source file contents are never modified; their mtimes are restored.
+
+Run from the repository root:
+    python -m benchmarks.bench_reload --threads 8 --reloads 10
+"""
+
+import argparse
+import os
+import threading
+import time
+
+os.environ.setdefault("KNOWLEDGE_RELOAD_INTERVAL", "0.2")
+os.environ.setdefault("HEALTHBOT_ADMIN_TOKEN", "bench-reload")
+
+import numpy as np
+
+import core
+from app import app
+
+MESSAGES = ["hello", "how are you", "how much water should i drink", "how can i lower my blood pressure",
+            "check that cough is a symptom of flu", "what is cough a symptom of", "i have fever 38 and heart rate 90",
+            "tell me something about sleeping well"]
+
+
+def client(t, stop, samples, errors, seen):
+    http = app.test_client()
+    session_id = f"bench{t}"
+    last = {}
+    sent = 0
+    while not stop.is_set():
+        message = MESSAGES[(t + sent) % len(MESSAGES)]
+        start = time.perf_counter()
+        response = http.post("/chat", json={"message": message, "session_id": session_id})
+        end = time.perf_counter()
+        sent += 1
+        data = response.get_json(silent=True) or {}
+        if response.status_code != 200 or not data.get("answer"):
+            errors.append((t, message, response.status_code, data))
+            continue
+        versions = data["versions"]
+        if any(versions[name] < last.get(name, 0) for name in versions):
+            errors.append((t, message, "versions went backwards", last, versions))
+        last = versions
+        samples.append((start, end))
+    seen[t] = (session_id, sent, MESSAGES[(t + sent - 1) % len(MESSAGES)])
+
+
+def touch(paths):
+    now = time.time_ns()
+    for path in paths:
+        os.utime(path, ns=(now, now))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--reloads", type=int, default=10)
+    parser.add_argument("--pause", type=float, default=0.5, help="seconds between reloads")
+    args = parser.parse_args()
+
+    core.init_once()
+    knowledge = core.knowledge
+    paths = [path for source in knowledge.sources.values() for path in source.paths]
+    mtimes = {path: (os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns) for path in paths}
+    before = dict(knowledge.state.versions)
+    admin = app.test_client()
+
+    stop = threading.Event()
+    samples, errors, seen, windows = [], [], {}, []
+    clients = [threading.Thread(target=client, args=(t, stop, samples, errors, seen)) for t in range(args.threads)]
+    for c in clients:
+        c.start()
+    try:
+        time.sleep(args.pause)
+        for i in range(args.reloads):
+            start = time.perf_counter()
+            if i % 2 == 0:
+                response = admin.post("/admin/reload", json={"sources": sorted(knowledge.sources), "wait": True},
+                                      headers={"X-Admin-Token": os.environ["HEALTHBOT_ADMIN_TOKEN"]})
+                assert response.status_code == 200, response.get_data(as_text=True)
+                mode = "admin"
+            else:
+                versions = dict(knowledge.state.versions)
+                touch(paths)
+                while knowledge.state.versions == versions or knowledge.stats()["reloading"]:
+                    time.sleep(0.01)
+                mode = "poll"
+            windows.append((start, time.perf_counter()))
+            print(f"reload {i + 1:3d} ({mode:5s}) {windows[-1][1] - start:7.3f} s  versions {knowledge.state.versions}")
+            time.sleep(args.pause)
+    finally:
+        stop.set()
+        for c in clients:
+            c.join()
+        for path, (atime, mtime) in mtimes.items():
+            os.utime(path, ns=(atime, mtime))
+
+    during = [end - start for start, end in samples if any(start < w_end and end > w_start for w_start, w_end in windows)]
+    outside = [end - start for start, end in samples if not any(start < w_end and end > w_start for w_start, w_end in windows)]
+    for label, latencies in (("outside reloads", outside), ("during reloads", during)):
+        if latencies:
+            ms = np.array(latencies) * 1e3
+            print(f"{label:16s} {len(ms):7d} requests  p50 {np.percentile(ms, 50):7.2f} ms  "
+                  f"p99 {np.percentile(ms, 99):7.2f} ms  max {ms.max():8.2f} ms")
+
+    pool = knowledge.state["aiml"]
+    for session_id, sent, last_message in seen.values():
+        history = pool.session_data(session_id).get("_inputHistory", [])
+        if not history or history[-1] != last_message:
+            errors.append((session_id, "session history lost", history[-3:], last_message))
+    expected = {name: version + args.reloads for name, version in before.items()}
+    if knowledge.state.versions != expected:
+        errors.append(("versions", knowledge.state.versions, "expected", expected))
+    print(f"{len(samples)} requests, {len(errors)} errors, {knowledge.stats()['failures']} failed rebuilds")
+    for error in errors[:10]:
+        print("  ", error)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+UNet segmenter: accuracy and speed of each CPU inference backend.
+
+Masks from every backend are compared with the float32 eager masks on a
+fixture set (Dice and IoU, averaged over images), then single-image latency
+and batched throughput are measured.
+
+Run from the repository root:
+    python -m benchmarks.bench_seg_backends --fixtures path/to/scans --threads 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+import torch
+
+from internal.brain_tumor_mask import _preprocess_seg_array, load_unet, weights_file
+from internal.seg_backends import BACKENDS, build_backend
+from internal.unet import UNet
+
+
+def load_fixtures(path, limit):
+    if path:
+        images = []
+        for name in sorted(os.listdir(path))[:limit]:
+            img = cv2.imread(os.path.join(path, name), cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                images.append(_preprocess_seg_array(img))
+        return np.stack(images)
+    # Smooth random blobs stand in for scans when no fixtures are given
+    rng = np.random.default_rng(0)
+    noise = rng.random((limit, 32, 32), dtype=np.float32)
+    return np.stack([cv2.resize(n, (256, 256))[None] for n in noise])
+
+
+def dice_iou(pred, ref):
+    pred, ref = pred > 0, ref > 0
+    inter = np.logical_and(pred, ref).sum()
+    total = pred.sum() + ref.sum()
+    union = np.logical_or(pred, ref).sum()
+    dice = 2 * inter / total if total else 1.0
+    iou = inter / union if union else 1.0
+    return dice, iou
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fixtures", help="directory of scans (default: synthetic images)")
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--random-weights", action="store_true",
+                        help="use an untrained UNet when the weights file is unavailable")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures, args.images)
+    cache_dir = tempfile.mkdtemp(prefix="seg-bench-")
+
+    def fresh_model():
+        if args.random_weights:
+            torch.manual_seed(0)
+            return UNet().eval()
+        return load_unet()
+
+    reference = build_backend(fresh_model(), "eager")
+    ref_logits = np.concatenate([reference(fixtures[i:i + 1]) for i in range(len(fixtures))])
+
+    for name in args.backends:
+        start = time.perf_counter()
+        backend = build_backend(
+            fresh_model(), name,
+            weights_file=None if args.random_weights else str(weights_file),
+            threads=args.threads, channels_last=args.channels_last,
+            calibration=fixtures if name == "int8" else None,
+            cache_dir=cache_dir,
+        )
+        build = time.perf_counter() - start
+
+        logits = np.concatenate([backend(fixtures[i:i + 1]) for i in range(len(fixtures))])
+        scores = [dice_iou(logits[i], ref_logits[i]) for i in range(len(fixtures))]
+        dice, iou = np.mean(scores, axis=0)
+
+        backend(fixtures[:1])  # warm-up
+        start = time.perf_counter()
+        for i in range(len(fixtures)):
+            backend(fixtures[i:i + 1])
+        latency = (time.perf_counter() - start) / len(fixtures)
+
+        start = time.perf_counter()
+        for i in range(0, len(fixtures), args.batch):
+            backend(fixtures[i:i + args.batch])
+        throughput = len(fixtures) / (time.perf_counter() - start)
+
+        print(f"{name:12s} build {build:6.1f} s  dice {dice:.4f}  iou {iou:.4f}  "
+              f"latency {latency * 1000:8.1f} ms  throughput {throughput:6.1f} img/s (batch {args.batch})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Tiled and volume segmentation: cost of native resolution and memory use.
+
+  - single images of each --sizes side: the resize path (one 256x256 pass)
+    vs tiled mode (overlapping 256x256 tiles, blended), with the number of
+    tiles, latency and the Dice agreement of the two masks
+  - a --slices x --side x --side int16 volume written to a temporary .npy
+    and streamed through segment_volume; peak traced memory is reported
+    next to the volume size to show that only one batch of slices is held
+
+Run from the repository root:
+    python -m benchmarks.bench_seg_tiling --sizes 256 512 1024 2048 --slices 64 --side 512
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from internal.brain_tumor_mask import (SEG_INPUT_SIZE, SEG_TILE_OVERLAP, SEG_VOLUME_BATCH, segment_volume,
+                                       submit_mask_mode, tile_starts)
+from internal.image_io import MaskStackWriter, Volume
+
+
+def synthetic_scan(side, rng):
+    """Noise with a few bright blobs, so masks are not empty."""
+    img = rng.normal(60, 20, (side, side)).clip(0, 255).astype(np.uint8)
+    for _ in range(3):
+        centre = tuple(int(v) for v in rng.integers(side // 8, side - side // 8, 2))
+        cv2.circle(img, centre, int(rng.integers(side // 20, side // 8)), 200, -1)
+    return img
+
+
+def dice(a, b):
+    a, b = a > 0, b > 0
+    total = a.sum() + b.sum()
+    return 2 * (a & b).sum() / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024, 2048])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--slices", type=int, default=64)
+    parser.add_argument("--side", type=int, default=512)
+    parser.add_argument("--mode", default="resize", choices=["resize", "tiled"], help="volume mode")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    submit_mask_mode(synthetic_scan(SEG_INPUT_SIZE, rng), "resize").result()  # model loading
+
+    print(f"tile {SEG_INPUT_SIZE}, overlap {SEG_TILE_OVERLAP}")
+    for side in args.sizes:
+        img = synthetic_scan(side, rng)
+        timings, masks = {}, {}
+        for mode in ("resize", "tiled"):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                masks[mode] = submit_mask_mode(img, mode).result()
+            timings[mode] = (time.perf_counter() - start) / args.repeat
+        tiles = len(tile_starts(max(side, SEG_INPUT_SIZE), SEG_INPUT_SIZE, SEG_TILE_OVERLAP)) ** 2
+        upsampled = cv2.resize(masks["resize"], (side, side), interpolation=cv2.INTER_NEAREST)
+        print(f"  {side:5d}px  resize {timings['resize'] * 1e3:8.1f} ms  tiled {timings['tiled'] * 1e3:8.1f} ms "
+              f"({tiles:3d} tiles)  dice {dice(upsampled, masks['tiled']):.3f}")
+
+    path = os.path.join(tempfile.mkdtemp(prefix="volume-bench-"), "volume.npy")
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.int16, shape=(args.slices, args.side, args.side))
+    for i in range(args.slices):
+        out[i] = synthetic_scan(args.side, rng).astype(np.int16) * 8
+    out.flush()
+    del out
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    volume = Volume(path)
+    stack = MaskStackWriter(volume.slices, volume.height, volume.width)
+    for mask in segment_volume(volume, args.mode):
+        stack.write(mask)
+    size = len(stack.close())
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"volume {args.slices}x{args.side}x{args.side} int16 ({os.path.getsize(path) / 2**20:.0f} MB), "
+          f"mode {args.mode}, batch {SEG_VOLUME_BATCH}: {args.slices / elapsed:6.1f} slices/s, "
+          f"peak traced {peak / 2**20:.1f} MB, mask stack {size / 2**20:.2f} MB")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+AIML session pool: responses/sec with many threads and sessions.
+
+Each thread sends messages for its own slice of sessions through a
+SessionPool, for every combination of thread count and kernel count. The
+single-kernel row is the old global-kernel setup (one lock for everyone).
+After each run the pool is checked for leaked or mixed-up session state.
+
+Run from the repository root:
+    python -m benchmarks.bench_sessions --threads 1 4 8 --kernels 1 4 --sessions 2000
+"""
+
+import argparse
+import threading
+import time
+
+from core import make_kernel
+from internal.sessions import SessionPool
+
+MESSAGES = ["hello", "how are you", "hi", "what is flu", "i know that cough is a symptom of flu",
+            "check that cough is a symptom of flu", "i have fever 38 and heart rate 90", "bye"]
+
+
+def run(threads, kernels, sessions, messages, max_sessions):
+    pool = SessionPool(make_kernel, kernels=kernels, max_sessions=max_sessions)
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(t):
+        barrier.wait()
+        for i in range(messages):
+            session = f"s{(t + i * threads) % sessions}"
+            pool.respond(MESSAGES[i % len(MESSAGES)], session)
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    stats = pool.stats()
+    # Every live session must only hold messages it was sent
+    for session in list(pool._sessions)[:50]:
+        history = pool.session_data(session).get("_inputHistory", [])
+        assert all(m in MESSAGES for m in history), (session, history)
+    return threads * messages / elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--kernels", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=2000, help="messages per thread")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    args = parser.parse_args()
+
+    for kernels in args.kernels:
+        for threads in args.threads:
+            rps, stats = run(threads, kernels, args.sessions, args.messages, args.max_sessions)
+            print(f"kernels {kernels:2d}  threads {threads:2d}  {rps:8.0f} responses/s  "
+                  f"live sessions {stats['sessions']:5d}  evictions {stats['evictions']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Import time and memory of `import app` for each worker role.
+
+Every measurement runs in a fresh interpreter so nothing is shared between
+roles. With --warmup the role's models are also loaded, which shows what
+a worker pays once it actually serves imaging requests.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup --roles chat imaging all --warmup
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROBE = r"""
+import json, resource, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+warm = None
+if WARMUP:
+    start = time.perf_counter()
+    app.registry.warm_up()
+    warm = time.perf_counter() - start
+with open("/proc/self/statm") as f:
+    rss_pages = int(f.read().split()[1])
+print(json.dumps({
+    "import_s": imported,
+    "warmup_s": warm,
+    "rss_mb": rss_pages * resource.getpagesize() / 2**20,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": sorted(m for m in ("tensorflow", "torch") if m in __import__("sys").modules),
+    "models": app.registry.status(),
+}))
+"""
+
+
+def measure(role, warmup):
+    env = dict(os.environ, HEALTHBOT_ROLE=role, HEALTHBOT_WARMUP="0")
+    code = PROBE.replace("WARMUP", str(bool(warmup)))
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--roles", nargs="+", default=["chat", "imaging", "all"])
+    parser.add_argument("--warmup", action="store_true")
+    args = parser.parse_args()
+
+    for role in args.roles:
+        r = measure(role, args.warmup)
+        line = (f"{role:8s} import {r['import_s']:6.2f} s  rss {r['rss_mb']:7.1f} MB  "
+                f"peak {r['max_rss_mb']:7.1f} MB  frameworks {r['heavy_modules'] or '-'}")
+        if r["warmup_s"] is not None:
+            line += f"  warm-up {r['warmup_s']:6.2f} s"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
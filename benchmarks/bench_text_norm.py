@@ -0,0 +1,87 @@
+"""
+TF-IDF text normalisation: original per-call pipeline vs text_norm.
+
+A synthetic corpus of --questions questions is built from the Q&A CSV
+vocabulary (with casing, punctuation, contractions and Unicode quotes mixed
+in). It is normalised by the original preprocess_input code and by
+text_norm.normalise_many with each tokenizer, with and without a process
+pool. The regex tokenizer is checked against NLTK's Treebank tokenizer on
+every question; outputs of every variant are compared with the original.
+
+Run from the repository root:
+    python -m benchmarks.bench_text_norm --questions 100000 --workers 4
+"""
+
+import argparse
+import random
+import string
+import time
+import nltk
+import pandas as pd
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import NLTKWordTokenizer
+
+import internal.text_norm as text_norm
+from internal.text_norm import normalise_many, regex_tokenize
+
+EXTRA = ["I", "cannot", "sleep", "gonna", "wanna", "don't", "it's", "“really”", "‘bad’", "38.5°C",
+         "COVID-19", "e.coli", "50mg", "kids'", "what's", "—", "ok?!"]
+
+
+def synthetic_corpus(csv_path, n, seed=0):
+    rng = random.Random(seed)
+    words = " ".join(pd.read_csv(csv_path)["question"]).split() + EXTRA
+    corpus = []
+    for _ in range(n):
+        question = " ".join(rng.choice(words) for _ in range(rng.randint(4, 14)))
+        corpus.append(question.capitalize() + rng.choice(["?", "?", ".", "!", ""]))
+    return corpus
+
+
+def legacy_preprocess(lemmatizer, text):
+    """TfidfManager.preprocess_input as it was: table, tokenizer and lemmas rebuilt per call."""
+    text = text.lower()
+    text = text.translate(str.maketrans("", "", string.punctuation))
+    tokens = nltk.word_tokenize(text)
+    return " ".join(lemmatizer.lemmatize(token) for token in tokens).strip()
+
+
+def timed(label, fn, reference, n):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    same = sum(a == b for a, b in zip(result, reference)) / n if reference else 1.0
+    print(f"{label:32s} {elapsed:8.2f} s  {n / elapsed:9.0f} q/s  identical to original {same:7.2%}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", default="internal/storage/healthcare_qna.csv")
+    parser.add_argument("--questions", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.csv, args.questions)
+    n = len(corpus)
+    print(f"{n} questions, {len(set(corpus))} distinct")
+
+    treebank = NLTKWordTokenizer()
+    stripped = [q.lower().translate(str.maketrans("", "", string.punctuation)) for q in corpus]
+    agree = sum(regex_tokenize(q) == treebank.tokenize(q) for q in stripped) / n
+    print(f"regex tokenizer agrees with NLTK Treebank tokens on {agree:.2%} of questions")
+
+    lemmatizer = WordNetLemmatizer()
+    reference = timed("original preprocess_input", lambda: [legacy_preprocess(lemmatizer, q) for q in corpus], None, n)
+    for tokenizer in text_norm.TOKENIZERS:
+        text_norm.lemmatize.cache_clear()
+        timed(f"text_norm {tokenizer}", lambda: normalise_many(corpus, tokenizer), reference, n)
+        timed(f"text_norm {tokenizer} (warm lemmas)", lambda: normalise_many(corpus, tokenizer), reference, n)
+        if args.workers > 1:
+            timed(f"text_norm {tokenizer} x{args.workers} procs",
+                  lambda: normalise_many(corpus, tokenizer, workers=args.workers), reference, n)
+    print(f"lemma cache: {text_norm.lemmatize.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+TF-IDF retrieval: inverted index vs brute-force cosine_similarity + argmax.
+
+Builds synthetic Zipf-distributed corpora of the requested sizes, checks that
+both paths pick the same best question, and reports per-query latency.
+
+Run from the repository root:
+    python -m benchmarks.bench_tfidf_retrieval --sizes 10000 100000 1000000
+"""
+
+import argparse
+import time
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+from internal.sparse_index import InvertedIndex
+
+
+def synthetic_corpus(n_docs, vocab_size, terms_per_doc, rng):
+    """Random L2-normalised TF-IDF-like matrix with a Zipfian term distribution."""
+    ranks = np.arange(1, vocab_size + 1)
+    probs = 1.0 / ranks
+    probs /= probs.sum()
+    cols = rng.choice(vocab_size, size=n_docs * terms_per_doc, p=probs)
+    rows = np.repeat(np.arange(n_docs), terms_per_doc)
+    idf = np.log(vocab_size / ranks) + 1.0
+    matrix = sp.csr_matrix((idf[cols], (rows, cols)), shape=(n_docs, vocab_size))
+    matrix.sum_duplicates()
+    return normalize(matrix)
+
+
+def brute_force(query, matrix):
+    similarities = cosine_similarity(query, matrix).flatten()
+    best = similarities.argmax()
+    return int(best), float(similarities[best])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--terms", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n_docs in args.sizes:
+        matrix = synthetic_corpus(n_docs, args.vocab, args.terms, rng)
+        # Queries share a few terms with random documents, like paraphrased questions
+        queries = synthetic_corpus(args.queries, args.vocab, args.terms // 2, rng)
+
+        start = time.perf_counter()
+        index = InvertedIndex(matrix)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [brute_force(queries[i], matrix) for i in range(args.queries)]
+        brute = (time.perf_counter() - start) / args.queries
+
+        start = time.perf_counter()
+        got = [index.top_k(queries[i], args.k) for i in range(args.queries)]
+        indexed = (time.perf_counter() - start) / args.queries
+
+        start = time.perf_counter()
+        batched = index.batch_top_k(queries, args.k)
+        batch = (time.perf_counter() - start) / args.queries
+
+        for (best, score), single, multi in zip(expected, got, batched):
+            assert single == multi
+            if score > 0:
+                assert single[0][0] == best and abs(single[0][1] - score) < 1e-9
+
+        print(f"n={n_docs:>9,}  build {build * 1e3:8.1f} ms  "
+              f"brute {brute * 1e3:8.3f} ms/q  index {indexed * 1e3:7.3f} ms/q  "
+              f"batch {batch * 1e3:7.3f} ms/q  speedup {brute / indexed:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
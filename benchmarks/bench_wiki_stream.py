@@ -0,0 +1,167 @@
+"""
+Streaming Wikipedia answers: time to first byte and parse cost.
+
+Synthetic Wikipedia-like sections (paragraphs with citations, edit links,
+lists, tables, inline styles) of several sizes are stored as API snapshots
+and served by the stub Wikipedia server. Then:
+  - parsing: the original BeautifulSoup get_text() + truncate path vs the
+    incremental AnswerStream, with a check that the answers are identical
+  - over HTTP (a local werkzeug server): POST /chat as plain JSON vs
+    streaming NDJSON, reporting time to first byte, to the first answer
+    text and to the last byte
+The response cache is off and the Wikipedia caches are cleared before
+every request, so each one runs both API calls and the parse.
+
+Run from the repository root:
+    python -m benchmarks.bench_wiki_stream --sizes 10 100 500 --repeat 20
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+os.environ["RESPONSE_CACHE"] = "0"
+
+import numpy as np
+import requests
+from bs4 import BeautifulSoup
+from werkzeug.serving import make_server
+
+import core
+from app import app
+from internal.wiki_client import (SnapshotStore, answer_prefix, section_answer, serve_snapshots,
+                                  truncate_answer, wiki_client)
+
+WORDS = ("diabetes is a chronic condition that affects how the body turns food into energy insulin "
+         "glucose blood sugar levels kidney heart disease vision loss risk factors include obesity").split()
+
+
+def legacy_answer(page, section, section_html):
+    """The original path: full BeautifulSoup parse, get_text, regex cleanup, truncation."""
+    soup = BeautifulSoup(section_html, "html.parser")
+    text = soup.get_text(separator=" ").strip()
+    text = re.sub(r"\[\d+\]", "", text)
+    text = re.sub(r"\[edit\]", "", text)
+    return truncate_answer(answer_prefix(page, section) + text)
+
+
+def sentence(rng):
+    words = []
+    for _ in range(rng.randint(8, 25)):
+        word = rng.choice(WORDS)
+        if rng.random() < 0.08:
+            word += f'<sup class="reference"><a href="#cite_note-{rng.randint(1, 99)}">[{rng.randint(1, 99)}]</a></sup>'
+        elif rng.random() < 0.05:
+            word = f'<a href="/wiki/{word}" title="{word}">{word}</a>'
+        words.append(word)
+    return " ".join(words).capitalize() + "."
+
+
+def synthetic_section(kb, rng):
+    parts = ['<div class="mw-parser-output"><style data-mw-deduplicate="x">.mw-parser-output .hatnote{font-style:italic}</style>',
+             '<h2><span class="mw-headline" id="Overview">Overview</span><span class="mw-editsection">'
+             '<span class="mw-editsection-bracket">[</span><a href="#">edit</a>'
+             '<span class="mw-editsection-bracket">]</span></span></h2>']
+    size = sum(map(len, parts))
+    while size < kb * 1024:
+        kind = rng.random()
+        if kind < 0.7:
+            block = "<p>" + " ".join(sentence(rng) for _ in range(rng.randint(2, 6))) + "</p>\n"
+        elif kind < 0.85:
+            block = "<ul>" + "".join(f"<li>{sentence(rng)}</li>" for _ in range(4)) + "</ul>\n"
+        else:
+            block = ('<table class="wikitable"><tbody>' + "".join(
+                f"<tr><th>{rng.choice(WORDS)}</th><td>{sentence(rng)}</td></tr>" for _ in range(5)) + "</tbody></table>\n")
+        # Wikipedia's section HTML often has runs of blank (or space-only) lines between blocks
+        block += rng.choice(("", "\n", "\n\n", "\n\n\n", "\n  \n", " "))
+        parts.append(block)
+        size += len(block)
+    parts.append("</div>")
+    return "".join(parts)
+
+
+def store_page(store, page, section_html):
+    store.put({"action": "parse", "page": page, "format": "json", "prop": "sections"},
+              {"parse": {"sections": [{"index": "1", "line": "Overview"}]}})
+    store.put({"action": "parse", "page": page, "format": "json", "prop": "text", "section": "1"},
+              {"parse": {"text": {"*": section_html}}})
+
+
+def timed_post(url, message, stream):
+    headers = {"Accept": "application/x-ndjson"} if stream else {}
+    start = time.perf_counter()
+    first_byte = first_text = None
+    body = b""
+    with requests.post(url, json={"message": message, "stream": stream}, headers=headers, stream=True) as response:
+        for chunk in response.iter_content(chunk_size=None):
+            now = time.perf_counter()
+            first_byte = first_byte or now
+            body += chunk
+            if first_text is None and (not stream or b'"chunk"' in body):
+                first_text = now
+    end = time.perf_counter()
+    if stream:
+        answer = json.loads(body.decode("utf-8").strip().splitlines()[-1])["answer"]
+    else:
+        answer = json.loads(body)["answer"]
+    return first_byte - start, first_text - start, end - start, answer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500], help="section HTML sizes in KB")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    store = SnapshotStore(tempfile.mkdtemp(prefix="wiki-bench-"))
+    pages = {}
+    for kb in args.sizes:
+        page = f"synthetic{'abcdefghij'[len(pages)]}"
+        pages[page] = synthetic_section(kb, rng)
+        store_page(store, page, pages[page])
+
+    print("parse + truncate (ms per answer)")
+    for page, html in pages.items():
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            old = legacy_answer(page, "Overview", html)
+        legacy = (time.perf_counter() - start) / args.repeat
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            new = section_answer(page, "Overview", html)
+        incremental = (time.perf_counter() - start) / args.repeat
+        print(f"  {len(html) / 1024:6.0f} KB  BeautifulSoup {legacy * 1e3:8.2f}  AnswerStream {incremental * 1e3:7.2f}  "
+              f"identical {old == new}")
+
+    stub, api_url = serve_snapshots(store)
+    wiki_client.api_url = api_url
+    core.init_once()
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/chat"
+
+    print("POST /chat over HTTP (ms: first byte / first answer text / last byte)")
+    try:
+        for page in pages:
+            for stream in (False, True):
+                samples = []
+                for _ in range(args.repeat):
+                    wiki_client.answer_cache.clear()
+                    wiki_client.section_index_cache.clear()
+                    samples.append(timed_post(url, f"what is {page}", stream))
+                ttfb, first_text, total = (np.median([s[i] for s in samples]) * 1e3 for i in range(3))
+                print(f"  {len(pages[page]) / 1024:6.0f} KB  {'stream' if stream else 'json':6s}  "
+                      f"{ttfb:7.2f} / {first_text:7.2f} / {total:7.2f}  answer {len(samples[-1][3])} chars")
+    finally:
+        server.shutdown()
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Load test for the async /chat path against a local fake Wikipedia server.
+
+Measures latency of non-network queries (AIML, TF-IDF, fuzzy) on their own
+and again while slow Wikipedia queries are in flight. With the async
+pipeline p99 of the fast queries should stay flat; with --sync-workers the
+same load is pushed through the blocking process_query on a thread pool
+(like Flask's threaded server) for comparison.
+
+Run from the repository root:
+    python -m benchmarks.load_async_chat --wiki-delay 1.0 --slow 50 --fast 500
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+import numpy as np
+
+# AIML, fuzzy (#300) and TF-IDF fallback (#100): none of them touch the network
+FAST_MESSAGES = ["hello", "how are you", "i have fever mild 95", "tell me about diabetes symptoms"]
+
+
+def start_fake_wikipedia(delay: float):
+    """Answers any page with two sections after `delay` seconds."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = dict(parse_qsl(urlsplit(self.path).query))
+            time.sleep(delay)
+            if params.get("prop") == "sections":
+                response = {"parse": {"sections": [{"line": "Signs and symptoms", "index": "1"},
+                                                   {"line": "Treatment", "index": "2"}]}}
+            else:
+                text = f"<p>{params.get('page')} is a condition. " + "More detail. " * 200 + "</p>"
+                response = {"parse": {"text": {"*": text}}}
+            body = json.dumps(response).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/w/api.php"
+
+
+def slow_message():
+    # Unique page names so every request misses the cache and hits the network
+    return f"what are the symptoms of disease{uuid.uuid4().hex[:8]}"
+
+
+def percentiles(latencies):
+    arr = np.array(latencies) * 1000
+    return f"n={len(arr):4d}  p50 {np.percentile(arr, 50):7.1f} ms  p99 {np.percentile(arr, 99):7.1f} ms"
+
+
+async def run_async(application, n_fast, n_slow, concurrency):
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def ask(message):
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"message": message})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fast_one(i):
+            async with semaphore:
+                return await ask(FAST_MESSAGES[i % len(FAST_MESSAGES)])
+
+        slow = [asyncio.create_task(ask(slow_message())) for _ in range(n_slow)]
+        await asyncio.sleep(0.05)  # let the slow requests reach the network
+        fast = await asyncio.gather(*(fast_one(i) for i in range(n_fast)))
+        slow = await asyncio.gather(*slow)
+        return fast, slow
+
+
+def run_sync(process_query, n_fast, n_slow, workers):
+    def ask(message, submitted):
+        # Measured from submission, so time spent queued behind busy workers counts
+        process_query(message)
+        return time.perf_counter() - submitted
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        slow = [pool.submit(ask, slow_message(), time.perf_counter()) for _ in range(n_slow)]
+        fast = [pool.submit(ask, FAST_MESSAGES[i % len(FAST_MESSAGES)], time.perf_counter())
+                for i in range(n_fast)]
+        return [f.result() for f in fast], [f.result() for f in slow]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--wiki-delay", type=float, default=1.0)
+    parser.add_argument("--fast", type=int, default=500)
+    parser.add_argument("--slow", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sync-workers", type=int, default=0,
+                        help="also run the blocking path on this many threads")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server, url = start_fake_wikipedia(args.wiki_delay)
+    from internal.wiki_client import wiki_client
+    wiki_client.api_url = url
+
+    import core
+    from asgi import application
+    core.init_once()
+    asyncio.run(run_async(application, len(FAST_MESSAGES), 0, 1))  # warm-up
+
+    fast, _ = asyncio.run(run_async(application, args.fast, 0, args.concurrency))
+    print(f"async, no network load : {percentiles(fast)}")
+    fast, slow = asyncio.run(run_async(application, args.fast, args.slow, args.concurrency))
+    print(f"async, {args.slow:3d} wiki in flight: {percentiles(fast)}   (wiki {percentiles(slow)})")
+
+    if args.sync_workers:
+        fast, _ = run_sync(core.process_query, args.fast, 0, args.sync_workers)
+        print(f"sync,  no network load : {percentiles(fast)}")
+        fast, slow = run_sync(core.process_query, args.fast, args.slow, args.sync_workers)
+        print(f"sync,  {args.slow:3d} wiki in flight: {percentiles(fast)}   (wiki {percentiles(slow)})")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
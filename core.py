@@ -1,118 +1,289 @@
-import aiml
-import pandas as pd
-import requests
-import re
-from bs4 import BeautifulSoup
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import internal.aiml_brain as aiml_brain
 import internal.kb_methods as kb
+import internal.metrics as metrics
 from internal.tfidf_module import TfidfManager
-from internal.brain_tumor_mask import predict_mask
-from internal.fuzzy_fever import assess_fever_description
+from internal.kb_inference import RULES_FILE
+from internal.fuzzy_fever import assess_fever_description, assess_fever_batch
+from internal.wiki_client import wiki_client, async_wiki_client
+from internal.sessions import SessionPool, new_session_id
+from internal.response_cache import response_cache, command_key, fallback_key
+from internal.reloader import Reloader, Source
 
-# Глобальные переменные
-kern = None
-kb_expressions = None
-tfidf_manager = None
+# Глобальные переменные: все источники знаний в одном снимке (knowledge.state),
+# который перезагрузчик подменяет целиком, не останавливая воркер
+knowledge = None
+_init_lock = threading.Lock()
+QNA_FILE = "internal/storage/healthcare_qna.csv"
+
+# Сессии: пул AIML-ядер, у каждого пользователя свои предикаты
+AIML_FILE = "internal/storage/healthbot.aiml"
+DEFAULT_SESSION = "_global"
+CHAT_KERNELS = int(os.environ.get("CHAT_KERNELS", min(4, os.cpu_count() or 1)))
+CHAT_MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", 10000))
+CHAT_SESSION_TTL = float(os.environ.get("CHAT_SESSION_TTL", 1800))
+
+# Асинхронный путь: сетевые команды ждут в event loop, CPU-команды уходят в пул потоков
+WIKI_COMMANDS = {1: "Overview", 2: "Symptoms", 3: "Causes", 4: "Treatment"}
+COMMAND_DEADLINES = {1: 8.0, 2: 8.0, 3: 8.0, 4: 8.0, 100: 2.0, 102: 2.0, 103: 2.0, 300: 2.0}
+DEFAULT_DEADLINE = 2.0
+# Записи в KB без дедлайна: поток из пула не отменить, и факт сохранился бы после ответа о таймауте
+WRITE_COMMANDS = {101}
+TIMEOUT_ANSWER = "Sorry, that took too long to answer. Please try again."
+WIKI_NOT_FOUND = "I couldn't find that information on Wikipedia."
+NO_ANSWER = "Извините, я не знаю, как на это ответить."
+# Временные сбои не кэшируются
+UNCACHED_ANSWERS = {TIMEOUT_ANSWER, WIKI_NOT_FOUND}
+# Ответы AIML, означающие «шаблон не найден» — тогда отвечает TF-IDF
+AIML_NO_MATCH = {"I don't know how to respond to that", "I have no answer for that"}
+
+# Пакетная обработка: сообщения группируются по командам AIML, блоками по BATCH_CHUNK
+BATCH_CHUNK = int(os.environ.get("CHAT_BATCH_CHUNK", 256))
+BATCH_WIKI_WORKERS = int(os.environ.get("CHAT_BATCH_WIKI_WORKERS", 8))
+cpu_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("CHAT_CPU_WORKERS", min(8, os.cpu_count() or 1))),
+    thread_name_prefix="chat-cpu",
+)
+
+def make_kernel():
+    # Ядро грузится из заранее скомпилированного brain-файла (пересобирается при изменении AIML)
+    return aiml_brain.load_kernel([AIML_FILE])
+
+def build_sessions(previous=None):
+    if previous is None:
+        return SessionPool(make_kernel, CHAT_KERNELS, CHAT_MAX_SESSIONS, CHAT_SESSION_TTL)
+    # Новый мозг AIML; предикаты пользователей переходят в новые ядра
+    aiml_brain.clear_loaded()
+    return previous.reloaded(make_kernel)
 
 def init_once():
     """Инициализация бота: AIML, TF-IDF, база знаний"""
-    global kern, kb_expressions, tfidf_manager
-    if kern:
+    global knowledge
+    if knowledge:
         return  # Уже инициализировано
+    with _init_lock:
+        if knowledge:
+            return
 
-    kern = aiml.Kernel()
-    kern.setTextEncoding(None)
-    kern.bootstrap(learnFiles="internal/storage/healthbot.aiml")
+        # Гарантировать, что файл базы существует
+        kb.ensure_storage_path()
+        reloader = Reloader([
+            # Индекс TF-IDF сохраняется на диск и отображается в память (mmap)
+            Source("qna", [QNA_FILE], lambda previous: TfidfManager.from_csv(QNA_FILE)),
+            Source("aiml", [AIML_FILE], build_sessions),
+            # Новые факты из журнала хранилище подхватывает само; при правке kb_file.kb
+            # или правил хранилище и вывод строятся заново в фоне и подменяются целиком
+            # (сжатие журнала тоже переписывает kb_file.kb, но такие факты хранилище уже знает)
+            Source("kb", [kb.KB_FILE, RULES_FILE], lambda previous: kb.load_kb(),
+                   current=lambda engine, changed: changed == [kb.KB_FILE] and engine.kb.reflects_files()),
+        ])
+        reloader.load()
+        # Ответы старой версии больше не нужны (ключи кэша содержат дайджест снимка)
+        reloader.on_swap(lambda old, new: response_cache.clear())
+        metrics.register_gauge("chat_sessions", lambda: reloader.state["aiml"].stats()["sessions"])
+        for name in reloader.sources:
+            metrics.register_gauge("knowledge_version", lambda name=name: reloader.state.versions[name], source=name)
+        reloader.start_polling()
 
-    qna_df = pd.read_csv("internal/storage/healthcare_qna.csv")
-    tfidf_manager = TfidfManager(qna_df['question'], qna_df['answer'])
+        # Присваивается последним: по нему проверяется готовность
+        knowledge = reloader
 
-    # Гарантировать, что файл базы существует
-    kb.ensure_storage_path()
-    kb_expressions = kb.load_kb()
+def reload_knowledge(sources=None, wait=False) -> dict:
+    """Перестроить источники в фоне (по умолчанию — изменившиеся файлы)"""
+    init_once()
+    scheduled = knowledge.reload(sources, wait)
+    return {"scheduled": scheduled, **knowledge.stats()}
+
+def knowledge_stats() -> dict:
+    init_once()
+    return knowledge.stats()
 
-def process_query(text: str, is_voice=False) -> dict:
+def _versioned(state, key):
+    # Ключ кэша привязан к содержимому источников, из которых получен ответ
+    return f"{state.digest}:{key}" if key is not None else None
+
+def process_query(text: str, is_voice=False, session_id=DEFAULT_SESSION) -> dict:
     """Обработка запроса пользователя"""
     init_once()
-    answer = kern.respond(text)
+    # Весь запрос работает с одним снимком, даже если во время него пройдёт перезагрузка
+    state = knowledge.state
+    with metrics.stage("aiml_respond"):
+        answer = state["aiml"].respond(text, session_id)
+    return _answer(state, answer, text, is_voice)
 
+def _answer(state, answer, text, is_voice=False) -> dict:
+    """Ответ на уже разобранный AIML запрос"""
     if answer.startswith("#"):
-        handle_result = handle_aiml_command(answer, text, is_voice)
-        return {"answer": handle_result, "continue": False if handle_result == "Goodbye!" else True}
+        # Детерминированные команды (#1-#4, #100, #300) берутся из кэша ответов
+        key = _versioned(state, command_key(answer))
+        handle_result = response_cache.get(key)
+        if handle_result is None:
+            with metrics.stage("command_dispatch"):
+                handle_result = handle_aiml_command(answer, text, is_voice, state)
+            if handle_result not in UNCACHED_ANSWERS:
+                response_cache.set(key, handle_result)
+        return {"answer": handle_result, "continue": False if handle_result == "Goodbye!" else True,
+                "versions": state.versions}
+    else:
+        if not answer.strip() or answer in AIML_NO_MATCH:
+            metrics.inc("chat_commands_total", command="fallback")
+            key = _versioned(state, fallback_key(text))
+            fallback = response_cache.get(key)
+            if fallback is None:
+                fallback = state["qna"].get_most_similar_answer(text) or NO_ANSWER
+                response_cache.set(key, fallback)
+            return {"answer": fallback, "continue": True, "versions": state.versions}
+        return {"answer": answer, "continue": True, "versions": state.versions}
+
+def _wiki_command(answer):
+    """(номер команды, статья) для #1-#4, иначе None"""
+    cmd, _, param = answer[1:].partition("$") if answer.startswith("#") else ("", "", "")
+    if cmd.isdigit() and int(cmd) in WIKI_COMMANDS:
+        return int(cmd), param.split("$")[0]
+    return None
+
+def process_query_stream(text: str, is_voice=False, session_id=DEFAULT_SESSION):
+    """
+    Потоковый ответ. События: {"type": "ack"} сразу, затем {"type": "chunk", "text"}
+    по мере готовности (статьи Википедии — по предложениям), в конце
+    {"type": "done", ...} с полным ответом, как у process_query.
+    """
+    yield {"type": "ack"}
+    init_once()
+    state = knowledge.state
+    with metrics.stage("aiml_respond"):
+        answer = state["aiml"].respond(text, session_id)
+    wiki = _wiki_command(answer)
+    if wiki is None or response_cache.get(_versioned(state, command_key(answer))) is not None:
+        result = _answer(state, answer, text, is_voice)
+        yield {"type": "chunk", "text": result["answer"]}
+        yield {"type": "done", **result}
+        return
+
+    cmd, page = wiki
+    metrics.inc("chat_commands_total", command=f"#{cmd}")
+    pieces = []
+    for piece in wiki_client.stream_section_text(page, WIKI_COMMANDS[cmd]):
+        pieces.append(piece)
+        yield {"type": "chunk", "text": piece}
+    result = "".join(pieces)
+    if result:
+        response_cache.set(_versioned(state, command_key(answer)), result)
     else:
-        if not answer.strip() or answer in ["I don't know how to respond to that", "I have no answer for that"]:
-            fallback = tfidf_manager.get_most_similar_answer(text)
-            return {"answer": fallback or "Извините, я не знаю, как на это ответить.", "continue": True}
-        return {"answer": answer, "continue": True}
+        result = WIKI_NOT_FOUND
+        yield {"type": "chunk", "text": result}
+    yield {"type": "done", "answer": result, "continue": True, "versions": state.versions}
+
+def process_queries(texts, session_id=None):
+    """
+    Пакетная обработка (оценка качества, разбор истории сообщений).
+    Генератор: результаты в порядке входа, по мере готовности блоков.
+    Без session_id сообщения идут через временную сессию, удаляемую в конце.
+    """
+    init_once()
+    # Весь пакет работает с одним снимком знаний
+    state = knowledge.state
+    texts = list(texts)
+    own_session = session_id is None
+    session_id = session_id or f"batch-{new_session_id()}"
+    try:
+        for start in range(0, len(texts), BATCH_CHUNK):
+            yield from _process_chunk(state, texts[start:start + BATCH_CHUNK], session_id, start)
+    finally:
+        if own_session:
+            state["aiml"].end_session(session_id)
+
+def _process_chunk(state, texts, session_id, offset):
+    results = [None] * len(texts)
+    with metrics.stage("aiml_respond"):
+        answers = [state["aiml"].respond(text, session_id) if text else "" for text in texts]
+
+    # Группы: Википедия, TF-IDF (#100 и запасной ответ), нечёткая логика, остальное по порядку
+    wiki, tfidf, fever, sequential = {}, {}, {}, []
+    keys = {}
+    for i, (text, answer) in enumerate(zip(texts, answers)):
+        if not text:
+            results[i] = {"error": "message is required"}
+            continue
+        if answer.startswith("#"):
+            cmd, _, param = answer[1:].partition("$")
+            key = _versioned(state, command_key(answer))
+        elif not answer.strip() or answer in AIML_NO_MATCH:
+            cmd, param = "fallback", text
+            key = _versioned(state, fallback_key(text))
+        else:
+            results[i] = answer
+            continue
+        cached = response_cache.get(key)
+        if cached is not None:
+            results[i] = cached
+            continue
+        # Одинаковые ключи (с точностью до регистра и пунктуации) считаются один раз
+        keys[i] = key
+        group_key = key if key is not None else i
+        if cmd.isdigit() and int(cmd) in WIKI_COMMANDS:
+            wiki.setdefault(group_key, (param.split("$")[0], cmd, []))[2].append(i)
+        elif cmd in ("100", "fallback"):
+            tfidf.setdefault(group_key, (param.split("$")[0], cmd, []))[2].append(i)
+        elif cmd == "300":
+            fever.setdefault(group_key, (param.split("$")[0], cmd, []))[2].append(i)
+        else:
+            sequential.append(i)
+
+    if wiki:
+        with metrics.stage("batch_wiki"), ThreadPoolExecutor(min(BATCH_WIKI_WORKERS, len(wiki))) as pool:
+            found = pool.map(lambda item: fetch_wikipedia_section(item[0], WIKI_COMMANDS[int(item[1])]), wiki.values())
+            _fill(results, wiki.values(), found)
+    if tfidf:
+        with metrics.stage("batch_tfidf"):
+            found = state["qna"].get_most_similar_answers([query for query, _, _ in tfidf.values()])
+        _fill(results, tfidf.values(), [
+            answer or (NO_ANSWER if cmd == "fallback" else "I don't know the answer.")
+            for answer, (_, cmd, _) in zip(found, tfidf.values())
+        ])
+    if fever:
+        with metrics.stage("batch_fuzzy"):
+            _fill(results, fever.values(), assess_fever_batch([desc for desc, _, _ in fever.values()]))
+    for group in (wiki, tfidf, fever):
+        for _, cmd, indices in group.values():
+            metrics.inc("chat_commands_total", len(indices), command=cmd if cmd == "fallback" else f"#{cmd}")
+
+    # Команды базы знаний (#101 меняет её) выполняются строго по порядку
+    for i in sequential:
+        try:
+            results[i] = handle_aiml_command(answers[i], texts[i], False, state)
+        except Exception as e:
+            results[i] = {"error": f"could not handle {answers[i][:40]!r}: {e}"}
+
+    stored = set()
+    for i, result in enumerate(results):
+        if isinstance(result, dict):
+            yield {"index": offset + i, **result}
+            continue
+        key = keys.get(i)
+        if key is not None and key not in stored and result not in UNCACHED_ANSWERS:
+            response_cache.set(key, result)
+            stored.add(key)
+        yield {"index": offset + i, "answer": result, "continue": result != "Goodbye!", "versions": state.versions}
+
+def _fill(results, groups, answers):
+    for (_, _, indices), answer in zip(groups, answers):
+        for i in indices:
+            results[i] = answer
 
 def fetch_wikipedia_section(query, section):
-    """Получение секции из Википедии"""
-    url = "https://en.wikipedia.org/w/api.php"
-    params = {
-        "action": "parse",
-        "page": query,
-        "format": "json",
-        "prop": "sections"
-    }
-
-    section_fallbacks = {
-        "Overview":  ["Overview", "Introduction", "Summary", "General"],
-        "Symptoms":  ["Symptoms", "Signs and symptoms"],
-        "Causes":    ["Causes",   "Risk factors"],
-        "Treatment": ["Treatment","Management", "Therapy"]
-    }
-
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        section_number = None
-        fallbacks = section_fallbacks.get(section, [section])
-
-        for fallback in fallbacks:
-            for s in data.get("parse", {}).get("sections", []):
-                if fallback.lower() in s["line"].lower():
-                    section_number = s["index"]
-                    break
-            if section_number:
-                break
-
-        if not section_number:
-            sections_list = data.get("parse", {}).get("sections", [])
-            if sections_list:
-                section_number = sections_list[0].get("index")
-
-        if section_number:
-            params["prop"] = "text"
-            params["section"] = section_number
-            section_response = requests.get(url, params=params)
-            if section_response.status_code == 200:
-                section_data = section_response.json()
-                section_html = section_data.get("parse", {}).get("text", {}).get("*", "")
-                soup = BeautifulSoup(section_html, "html.parser")
-                section_text = soup.get_text(separator=" ").strip()
-
-                section_text = re.sub(r"\[\d+\]", "", section_text)
-                section_text = re.sub(r"\[edit\]", "", section_text)
-
-                if section == "Symptoms":
-                    response_text = f"Here are common symptoms of {query.capitalize()}:\n\n{section_text}"
-                elif section == "Causes":
-                    response_text = f"Main causes and risk factors for {query.capitalize()}:\n\n{section_text}"
-                elif section == "Treatment":
-                    response_text = f"Treatments and management strategies for {query.capitalize()}:\n\n{section_text}"
-                else:
-                    response_text = f"Overview of {query.capitalize()}:\n\n{section_text}"
-
-                if len(response_text) > 1000:
-                    last_period = response_text[:1000].rfind(".")
-                    response_text = response_text[:last_period + 1] + "..." if last_period != -1 else response_text[:1000] + "..."
-                return response_text
-    return "I couldn't find that information on Wikipedia."
-
-def handle_aiml_command(answer, user_input, is_voice=False):
+    """Получение секции из Википедии (через кэширующий клиент)"""
+    return wiki_client.section_text(query, section) or WIKI_NOT_FOUND
+
+def handle_aiml_command(answer, user_input, is_voice=False, state=None):
     """Обработка команд AIML вида #1$param"""
-    global kern, kb_expressions, tfidf_manager
+    state = state or knowledge.state
     params = answer[1:].split("$")
     cmd = int(params[0])
+    metrics.inc("chat_commands_total", command=f"#{cmd}")
 
     if cmd == 0:
         return params[1] if len(params) > 1 else "Goodbye!"
@@ -131,18 +302,143 @@ def handle_aiml_command(answer, user_input, is_voice=False):
 
     elif cmd == 100:  # TF-IDF
         query = params[1]
-        return tfidf_manager.get_most_similar_answer(query) or "I don't know the answer."
+        return state["qna"].get_most_similar_answer(query) or "I don't know the answer."
 
     elif cmd == 101:  # Add fact to KB
-        return kb.add_fact(kb_expressions, params[1])
+        return kb.add_fact(state["kb"], params[1])
 
     elif cmd == 102:  # Check fact in KB
-        return kb.check_fact(kb_expressions, params[1])
+        return kb.check_fact(state["kb"], params[1])
+
+    elif cmd == 103:  # Pattern query over stored and derived facts
+        # "$" ещё и маркер переменной: Symptom($x, Cold)
+        return kb.query_kb(state["kb"], "$".join(params[1:]))
 
     elif cmd == 300:  # Fuzzy Fever
-        return assess_fever_description(params[1])
+        with metrics.stage("fuzzy_assess"):
+            return assess_fever_description(params[1])
 
     elif cmd == 301:  # Brain image classification (requires frontend to upload image separately)
         return "Image classification should be done via /brain/segment endpoint."
 
     return "Unknown command."
+
+
+async def process_query_async(text: str, is_voice=False, session_id=DEFAULT_SESSION) -> dict:
+    """Асинхронная обработка запроса: медленная сеть не блокирует другие запросы"""
+    loop = asyncio.get_running_loop()
+    if knowledge is None:
+        await loop.run_in_executor(cpu_executor, init_once)
+    state = knowledge.state
+    with metrics.stage("aiml_respond"):
+        answer = await loop.run_in_executor(cpu_executor, state["aiml"].respond, text, session_id)
+    return await _answer_async(state, answer, text, is_voice)
+
+async def _answer_async(state, answer, text, is_voice=False) -> dict:
+    loop = asyncio.get_running_loop()
+    if answer.startswith("#"):
+        key = _versioned(state, command_key(answer))
+        handle_result = await _cache_get_async(key)
+        if handle_result is None:
+            with metrics.stage("command_dispatch"):
+                handle_result = await handle_aiml_command_async(answer, text, is_voice, state)
+            if handle_result not in UNCACHED_ANSWERS:
+                await _cache_set_async(key, handle_result)
+        return {"answer": handle_result, "continue": False if handle_result == "Goodbye!" else True,
+                "versions": state.versions}
+    else:
+        if not answer.strip() or answer in AIML_NO_MATCH:
+            metrics.inc("chat_commands_total", command="fallback")
+            key = _versioned(state, fallback_key(text))
+            fallback = await _cache_get_async(key)
+            if fallback is None:
+                try:
+                    fallback = await asyncio.wait_for(
+                        loop.run_in_executor(cpu_executor, state["qna"].get_most_similar_answer, text),
+                        COMMAND_DEADLINES[100],
+                    )
+                except asyncio.TimeoutError:
+                    return {"answer": TIMEOUT_ANSWER, "continue": True, "versions": state.versions}
+                fallback = fallback or NO_ANSWER
+                await _cache_set_async(key, fallback)
+            return {"answer": fallback, "continue": True, "versions": state.versions}
+        return {"answer": answer, "continue": True, "versions": state.versions}
+
+async def _cache_get_async(key):
+    # Общий (сетевой) кэш не должен блокировать event loop
+    if response_cache.shared and key is not None:
+        return await asyncio.get_running_loop().run_in_executor(cpu_executor, response_cache.get, key)
+    return response_cache.get(key)
+
+async def _cache_set_async(key, value):
+    if response_cache.shared and key is not None:
+        await asyncio.get_running_loop().run_in_executor(cpu_executor, response_cache.set, key, value)
+    else:
+        response_cache.set(key, value)
+
+async def handle_aiml_command_async(answer, user_input, is_voice=False, state=None):
+    """Команды AIML с дедлайном на каждую команду"""
+    params = answer[1:].split("$")
+    cmd = int(params[0])
+    deadline = COMMAND_DEADLINES.get(cmd, DEFAULT_DEADLINE)
+    try:
+        if cmd in WIKI_COMMANDS:
+            metrics.inc("chat_commands_total", command=f"#{cmd}")
+            section_text = await asyncio.wait_for(
+                async_wiki_client.section_text(params[1], WIKI_COMMANDS[cmd]), deadline
+            )
+            return section_text or WIKI_NOT_FOUND
+        loop = asyncio.get_running_loop()
+        work = loop.run_in_executor(cpu_executor, handle_aiml_command, answer, user_input, is_voice, state)
+        if cmd in WRITE_COMMANDS:
+            return await work
+        return await asyncio.wait_for(work, deadline)
+    except asyncio.TimeoutError:
+        metrics.inc("chat_command_timeouts_total", command=f"#{cmd}")
+        return TIMEOUT_ANSWER
+
+
+async def process_query_stream_async(text: str, is_voice=False, session_id=DEFAULT_SESSION):
+    """Асинхронный двойник process_query_stream (дедлайн команды — на весь поток)"""
+    yield {"type": "ack"}
+    loop = asyncio.get_running_loop()
+    if knowledge is None:
+        await loop.run_in_executor(cpu_executor, init_once)
+    state = knowledge.state
+    with metrics.stage("aiml_respond"):
+        answer = await loop.run_in_executor(cpu_executor, state["aiml"].respond, text, session_id)
+    wiki = _wiki_command(answer)
+    if wiki is None or await _cache_get_async(_versioned(state, command_key(answer))) is not None:
+        result = await _answer_async(state, answer, text, is_voice)
+        yield {"type": "chunk", "text": result["answer"]}
+        yield {"type": "done", **result}
+        return
+
+    cmd, page = wiki
+    metrics.inc("chat_commands_total", command=f"#{cmd}")
+    deadline = loop.time() + COMMAND_DEADLINES.get(cmd, DEFAULT_DEADLINE)
+    stream = async_wiki_client.stream_section_text(page, WIKI_COMMANDS[cmd])
+    pieces = []
+    try:
+        while True:
+            piece = await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - loop.time()))
+            pieces.append(piece)
+            yield {"type": "chunk", "text": piece}
+    except StopAsyncIteration:
+        pass
+    except asyncio.TimeoutError:
+        metrics.inc("chat_command_timeouts_total", command=f"#{cmd}")
+        await stream.aclose()
+        # Уже отправленный текст остаётся; без него — сообщение о таймауте (не кэшируется)
+        if not pieces:
+            yield {"type": "chunk", "text": TIMEOUT_ANSWER}
+        yield {"type": "done", "answer": "".join(pieces) or TIMEOUT_ANSWER, "continue": True,
+               "versions": state.versions, "timeout": True}
+        return
+    result = "".join(pieces)
+    if result:
+        await _cache_set_async(_versioned(state, command_key(answer)), result)
+    else:
+        result = WIKI_NOT_FOUND
+        yield {"type": "chunk", "text": result}
+    yield {"type": "done", "answer": result, "continue": True, "versions": state.versions}
@@ -0,0 +1,37 @@
+"""
+Pre-fork serving: the master imports the app and loads the chat knowledge
+and the fork-safe models once (internal/preload.py); the workers forked from
+it share those pages instead of loading private copies.
+
+    gunicorn -c gunicorn.conf.py app:app
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+
+HEALTHBOT_PRELOAD=0 turns preloading off (every worker loads its own copies).
+GET /health/memory on a worker reports its unique (USS) and shared memory.
+"""
+
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = os.environ.get("HEALTHBOT_PRELOAD", "1") == "1"
+
+if preload_app:
+    # app.py would start its warm-up thread in the master; workers warm up after the fork instead
+    os.environ["HEALTHBOT_WARMUP"] = "0"
+
+
+def when_ready(server):
+    # Runs in the master after the app was imported, before the first fork
+    if preload_app:
+        import app
+        from internal import preload
+        preload.preload(chat=app.CHAT_ENABLED, imaging=app.IMAGING_ENABLED)
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from internal import preload
+        preload.after_fork()
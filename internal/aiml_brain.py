@@ -0,0 +1,129 @@
+"""
+aiml_brain.py
+
+Precompiled AIML brain files: the AIML sources are parsed once into
+python-aiml's pattern graph and saved with saveBrain(); kernels then boot
+from that file, skipping XML parsing entirely. The graph is only read while
+matching, so every kernel in a process (e.g. the session pool) shares one
+loaded copy.
+
+A brain file is named after a hash of the sources (plus the Python and
+python-aiml versions, since the graph is stored with marshal), so an edited
+AIML file simply misses the cache and is recompiled.
+
+Build step (e.g. in the image build or before recycling workers):
+    python -m internal.aiml_brain build
+"""
+
+import argparse
+import gc
+import glob
+import hashlib
+import os
+import sys
+import threading
+import aiml
+from aiml.PatternMgr import PatternMgr
+from aiml.constants import VERSION as AIML_VERSION
+
+BASE_DIR = os.path.dirname(__file__)
+AIML_SOURCES = [os.path.join(BASE_DIR, "storage", "healthbot.aiml")]
+BRAIN_DIR = os.path.join(BASE_DIR, "storage", "aiml_brain")
+BRAIN_FORMAT_VERSION = 1
+
+_loaded = {}   # brain path -> PatternMgr shared by the kernels booted from it
+_loaded_lock = threading.Lock()
+
+
+def sources_digest(sources) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{BRAIN_FORMAT_VERSION}|{sys.version_info[:2]}|{AIML_VERSION}".encode())
+    for path in sorted(sources):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def brain_path(sources, brain_dir=BRAIN_DIR) -> str:
+    return os.path.join(brain_dir, f"brain-{sources_digest(sources)[:32]}.brn")
+
+
+def _new_kernel():
+    kernel = aiml.Kernel()
+    kernel.setTextEncoding(None)
+    return kernel
+
+
+def compile_brain(sources, brain_dir=BRAIN_DIR) -> str:
+    """Parse the AIML sources and save the brain; returns its path."""
+    path = brain_path(sources, brain_dir)
+    kernel = _new_kernel()
+    kernel.bootstrap(learnFiles=list(sources))
+    os.makedirs(brain_dir, exist_ok=True)
+    tmp = path + f".{os.getpid()}.tmp"
+    kernel.saveBrain(tmp)
+    os.replace(tmp, path)
+    # Brains of older sources are never read again
+    for stale in glob.glob(os.path.join(brain_dir, "brain-*.brn")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return path
+
+
+def _restore(path) -> PatternMgr:
+    with _loaded_lock:
+        brain = _loaded.get(path)
+        if brain is None:
+            brain = PatternMgr()
+            # The graph is tens of thousands of small dicts; collecting while
+            # unmarshalling them roughly doubles the load time
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                brain.restore(path)
+            finally:
+                if collecting:
+                    gc.enable()
+            _loaded[path] = brain
+    return brain
+
+
+def clear_loaded():
+    """Forget brains loaded in this process (the next kernel re-reads the file)."""
+    with _loaded_lock:
+        _loaded.clear()
+
+
+def load_kernel(sources=None, brain_dir=BRAIN_DIR):
+    """
+    Kernel booted from the precompiled brain for `sources`, compiling it
+    first if the sources changed since the last build.
+    """
+    sources = list(sources or AIML_SOURCES)
+    path = brain_path(sources, brain_dir)
+    if not os.path.exists(path):
+        path = compile_brain(sources, brain_dir)
+    kernel = _new_kernel()
+    # Same as loadBrain(), minus a private copy of the graph per kernel
+    kernel._brain = _restore(path)
+    return kernel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompiled AIML brain files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compile the AIML sources into a brain file")
+    build.add_argument("sources", nargs="*", default=AIML_SOURCES)
+    build.add_argument("--brain-dir", default=BRAIN_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(compile_brain(args.sources, args.brain_dir))
+
+
+if __name__ == "__main__":
+    main()
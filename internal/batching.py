@@ -0,0 +1,123 @@
+"""
+batching.py
+
+Dynamic micro-batching for model inference:
+  - callers submit single preprocessed samples from any thread
+  - a worker thread groups them into batches of up to max_batch_size,
+    waiting at most max_wait_ms after the first sample of a batch
+  - one forward pass per batch; results are fanned back out through futures
+A forked child (pre-fork serving) starts with an empty queue and starts its
+own worker on first use.
+"""
+
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+import numpy as np
+import internal.metrics as metrics
+
+_schedulers = weakref.WeakSet()
+
+
+class BatchScheduler:
+    def __init__(self, name, run_batch, max_batch_size=8, max_wait_ms=5.0):
+        """
+        :param name:           label used in stats
+        :param run_batch:      callable(np.ndarray of shape (n, ...)) -> sequence of n results
+        :param max_batch_size: upper bound on samples per forward pass
+        :param max_wait_ms:    how long the first sample of a batch may wait for company
+        """
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        metrics.register_gauge("model_queue_depth", lambda: self._queue.qsize(), model=name)
+        _schedulers.add(self)
+
+    def _after_fork(self):
+        # The worker thread and anything it held stayed in the parent
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._loop, name=f"batch-{self.name}", daemon=True
+                    )
+                    self._worker.start()
+
+    def submit(self, sample) -> Future:
+        """Queue one sample (no batch dimension); the future resolves to its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((sample, future))
+        self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def predict(self, sample, timeout=None):
+        """Blocking submit()."""
+        return self.submit(sample).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Deadline passed: still take whatever is already queued
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            futures = [future for _, future in batch]
+            try:
+                with metrics.stage(f"{self.name}_forward"):
+                    results = self.run_batch(np.stack([sample for sample, _ in batch]))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self._batches += 1
+            self._items += len(batch)
+            metrics.inc("model_batch_items_total", len(batch), model=self.name)
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self._max_queue_depth,
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+
+def _reset_after_fork():
+    for scheduler in list(_schedulers):
+        scheduler._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,20 +1,28 @@
 import os
 import cv2
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+from internal.batching import BatchScheduler
+from internal.model_registry import registry
+from internal.inference import thread_split
 
 # constants
 IMG_HEIGHT = 150
 IMG_WIDTH = 150
 CLASS_NAMES = ['glioma', 'meningioma', 'no_tumor', 'pituitary']
+# Inference backend: keras | tflite | tflite-int8 (see classifier_backends.py)
+BRAIN_CLASSIFIER_BACKEND = os.environ.get("BRAIN_CLASSIFIER_BACKEND", "keras")
+# Intra-op threads for TensorFlow (default: the classifier's share of the cores)
+CLASSIFIER_THREADS = int(os.environ.get("CLASSIFIER_THREADS", 0)) or thread_split()["classifier"]
 
 def build_brain_model(input_shape=(IMG_HEIGHT, IMG_WIDTH, 3), num_classes=4):
     """
     Builds the CNN model architecture. Must match the original architecture
     used during training.
     """
+    # TensorFlow is imported here so chat-only workers never pay for it
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+
     model = Sequential([
         Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
         MaxPooling2D((2, 2)),
@@ -40,36 +48,145 @@ def build_brain_model(input_shape=(IMG_HEIGHT, IMG_WIDTH, 3), num_classes=4):
     
     return model
 
-# Build the model (same architecture as training)
-model = build_brain_model()
-
-# Load weights
 weights_path = os.path.join(os.path.dirname(__file__), 'storage', 'brain.weights.h5')
-model.load_weights(weights_path)
+# Scans used to calibrate the int8 backend; converted TFLite models
+CLASSIFIER_CALIBRATION_DIR = os.environ.get(
+    "CLASSIFIER_CALIBRATION_DIR", os.path.join(os.path.dirname(__file__), 'storage', 'classifier_calibration'))
+# Without any, tflite-int8 refuses to convert unless random-input calibration is allowed explicitly
+CLASSIFIER_RANDOM_CALIBRATION = os.environ.get("CLASSIFIER_RANDOM_CALIBRATION", "0") == "1"
+CLASSIFIER_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'storage', 'classifier_cache')
 
-def preprocess_image(image_path):
+def load_keras_model():
     """
-    Loads and preprocesses an image from disk for model prediction.
+    Builds the model (same architecture as training) and loads its weights.
+    """
+    import tensorflow as tf
+    try:
+        # Only possible before TensorFlow runs its first op
+        tf.config.threading.set_intra_op_parallelism_threads(CLASSIFIER_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        pass
+    model = build_brain_model()
+    model.load_weights(weights_path)
+    return model
+
+def _calibration_batch(max_images=64):
+    if not os.path.isdir(CLASSIFIER_CALIBRATION_DIR):
+        return None
+    images = []
+    for name in sorted(os.listdir(CLASSIFIER_CALIBRATION_DIR))[:max_images]:
+        img = cv2.imread(os.path.join(CLASSIFIER_CALIBRATION_DIR, name))
+        if img is not None:
+            images.append(preprocess_array(img)[0])
+    return np.stack(images) if images else None
+
+def classifier_calibration():
+    """
+    What tflite-int8 is calibrated on, as in its converted model's file name
+    (a digest of the scans, or "random"); None for the other backends.
+    Part of the prediction-cache key.
+    """
+    if BRAIN_CLASSIFIER_BACKEND != "tflite-int8":
+        return None
+    from internal.classifier_backends import calibration_digest
+    return calibration_digest(_calibration_batch())
+
+def load_brain_model():
+    """
+    The classifier wrapped in the configured inference backend. Called by
+    the model registry on first use.
+    """
+    from internal.classifier_backends import build_backend
+
+    return build_backend(
+        load_keras_model,
+        BRAIN_CLASSIFIER_BACKEND,
+        weights_file=weights_path,
+        threads=CLASSIFIER_THREADS,
+        calibration=_calibration_batch() if BRAIN_CLASSIFIER_BACKEND == "tflite-int8" else None,
+        cache_dir=CLASSIFIER_CACHE_DIR,
+        random_calibration=CLASSIFIER_RANDOM_CALIBRATION,
+    )
+
+registry.register("brain_classifier", load_brain_model)
+
+def preprocess_array(img):
+    """
+    Preprocesses an already decoded BGR image (as returned by OpenCV)
+    for model prediction.
     """
-    # Read image using OpenCV
-    img = cv2.imread(image_path)
-    
-    if img is None:
-        raise ValueError(f"Unable to read image at path: {image_path}")
-    
     # Convert BGR to RGB (OpenCV loads as BGR by default)
     img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     
     # Resize
     img = cv2.resize(img, (IMG_WIDTH, IMG_HEIGHT))
     
-    # Normalize pixel values
-    img = img / 255.0
+    # Normalize pixel values in float32, the dtype every backend runs in
+    # (float64 would double the memory traffic only to be cast back)
+    img = img.astype(np.float32) / np.float32(255.0)
     
     # Expand dimensions so we have shape (1, IMG_HEIGHT, IMG_WIDTH, 3)
     img = np.expand_dims(img, axis=0)
     return img
 
+def preprocess_image(image_path):
+    """
+    Loads and preprocesses an image from disk for model prediction.
+    """
+    # Read image using OpenCV
+    img = cv2.imread(image_path)
+    
+    if img is None:
+        raise ValueError(f"Unable to read image at path: {image_path}")
+    
+    return preprocess_array(img)
+
+def predict_batch(batch):
+    """
+    Class probabilities for a batch of preprocessed images, shape (N, 4).
+    """
+    backend = registry.get("brain_classifier")
+    return backend(batch)
+
+# Concurrent requests share forward passes through the batch scheduler
+classifier_scheduler = BatchScheduler(
+    "brain_classifier",
+    predict_batch,
+    max_batch_size=int(os.environ.get("BRAIN_CLASSIFIER_MAX_BATCH", 16)),
+    max_wait_ms=float(os.environ.get("BRAIN_CLASSIFIER_MAX_WAIT_MS", 5)),
+)
+
+def classify_array(img):
+    """
+    Classifies a decoded BGR image and returns the predicted class name.
+    """
+    return classify_array_probs(img)[0]
+
+def classify_array_probs(img):
+    """
+    Classifies a decoded BGR image.
+    Returns (predicted class name, {class name: probability}).
+    """
+    # Perform prediction (batched with other requests)
+    return class_probabilities(submit_classify(img).result())
+
+def submit_classify(img):
+    """
+    Queues a decoded BGR image for classification; the future resolves to
+    the class probabilities, shape (4,).
+    """
+    return classifier_scheduler.submit(preprocess_array(img)[0])
+
+def class_probabilities(predictions):
+    """
+    Model output -> (predicted class name, {class name: probability}).
+    """
+    predicted_idx = np.argmax(predictions)
+    
+    probabilities = {name: float(p) for name, p in zip(CLASS_NAMES, predictions)}
+    return CLASS_NAMES[predicted_idx], probabilities
+
 def classify_image(image_path):
     """
     Classifies an image and returns the predicted class name.
@@ -77,11 +194,10 @@ def classify_image(image_path):
     # Preprocess image
     preprocessed_img = preprocess_image(image_path)
     
-    # Perform prediction
-    predictions = model.predict(preprocessed_img)
+    # Perform prediction (batched with other requests)
+    predictions = classifier_scheduler.predict(preprocessed_img[0])
     
-    # predictions is a 2D array; for a single image, index 0
-    predicted_idx = np.argmax(predictions[0])
+    predicted_idx = np.argmax(predictions)
     
     # Return the class name
     return CLASS_NAMES[predicted_idx]
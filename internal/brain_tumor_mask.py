@@ -1,79 +1,293 @@
+import hashlib
 import os
+import threading
+from concurrent.futures import Future
+from functools import partial
 from pathlib import Path
-import torch
-import torch.nn as nn
 import cv2
 import numpy as np
+from internal.batching import BatchScheduler
+from internal.model_registry import registry
+from internal.inference import thread_split
 
-# Define UNet Model
-class UNet(nn.Module):
-    def __init__(self):
-        super(UNet, self).__init__()
-        def conv_block(in_c, out_c):
-            return nn.Sequential(
-                nn.Conv2d(in_c, out_c, kernel_size=3, padding=1),
-                nn.ReLU(inplace=True),
-                nn.Conv2d(out_c, out_c, kernel_size=3, padding=1),
-                nn.ReLU(inplace=True)
-            )
-
-        self.encoder1 = conv_block(1, 64)
-        self.encoder2 = conv_block(64, 128)
-        self.encoder3 = conv_block(128, 256)
-        self.encoder4 = conv_block(256, 512)
-        self.pool     = nn.MaxPool2d(2, 2)
-        self.bottleneck = conv_block(512, 1024)
-        self.upconv4  = nn.ConvTranspose2d(1024, 512, kernel_size=2, stride=2)
-        self.decoder4 = conv_block(1024, 512)
-        self.upconv3  = nn.ConvTranspose2d(512, 256, kernel_size=2, stride=2)
-        self.decoder3 = conv_block(512, 256)
-        self.upconv2  = nn.ConvTranspose2d(256, 128, kernel_size=2, stride=2)
-        self.decoder2 = conv_block(256, 128)
-        self.upconv1  = nn.ConvTranspose2d(128, 64, kernel_size=2, stride=2)
-        self.decoder1 = conv_block(128, 64)
-        self.final_conv = nn.Conv2d(64, 1, kernel_size=1)
-
-    def forward(self, x):
-        e1 = self.encoder1(x)
-        e2 = self.encoder2(self.pool(e1))
-        e3 = self.encoder3(self.pool(e2))
-        e4 = self.encoder4(self.pool(e3))
-        b  = self.bottleneck(self.pool(e4))
-        d4 = self.decoder4(torch.cat((self.upconv4(b), e4), dim=1))
-        d3 = self.decoder3(torch.cat((self.upconv3(d4), e3), dim=1))
-        d2 = self.decoder2(torch.cat((self.upconv2(d3), e2), dim=1))
-        d1 = self.decoder1(torch.cat((self.upconv1(d2), e1), dim=1))
-        return self.final_conv(d1)
-
-# Load model and weights once at import
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 # Determine weights path relative to this file
 data_dir = Path(__file__).parent / "storage"
 weights_file = data_dir / "brain_tumor_segmentation.pth"
-if not weights_file.exists():
-    raise FileNotFoundError(f"Segmentation weights not found at {weights_file}")
-# Initialize model
-tumor_seg_model = UNet().to(device)
-tumor_seg_model.load_state_dict(torch.load(str(weights_file), map_location=device))
-tumor_seg_model.eval()
+
+# Inference backend: eager | torchscript | onnx | onnx-int8 | int8 (see seg_backends.py)
+SEG_BACKEND = os.environ.get("SEG_BACKEND", "eager")
+# Intra-op threads (default: the segmenter's share of the cores)
+SEG_THREADS = int(os.environ.get("SEG_THREADS", 0)) or thread_split()["segmenter"]
+SEG_CHANNELS_LAST = os.environ.get("SEG_CHANNELS_LAST", "0") == "1"
+# Scans used to calibrate the int8 backend
+SEG_CALIBRATION_DIR = os.environ.get("SEG_CALIBRATION_DIR", str(data_dir / "seg_calibration"))
+# Without any, int8 refuses to load unless random-input calibration is allowed explicitly
+SEG_RANDOM_CALIBRATION = os.environ.get("SEG_RANDOM_CALIBRATION", "0") == "1"
+SEG_CACHE_DIR = data_dir / "seg_cache"
+# Side of the square input the UNet was trained on
+SEG_INPUT_SIZE = 256
+# resize: the whole image is scaled to one input; tiled: native resolution,
+# cut into overlapping SEG_INPUT_SIZE tiles whose logits are blended back
+SEG_MODES = ("resize", "tiled")
+SEG_MODE = os.environ.get("SEG_MODE", "resize")
+SEG_TILE_OVERLAP = min(max(0, int(os.environ.get("SEG_TILE_OVERLAP", 64))), SEG_INPUT_SIZE // 2)
+# Largest image tiled mode accepts, in tiles (64: about 1600x1600 at the default overlap)
+SEG_MAX_TILES = max(1, int(os.environ.get("SEG_MAX_TILES", 64)))
+# Volume slices read and segmented at a time
+SEG_VOLUME_BATCH = max(1, int(os.environ.get("SEG_VOLUME_BATCH", 8)))
+
+def load_unet():
+    """
+    Builds the float32 UNet and loads its weights. PyTorch itself is only
+    imported here.
+    """
+    import torch
+    from internal.unet import UNet
+
+    if not weights_file.exists():
+        raise FileNotFoundError(f"Segmentation weights not found at {weights_file}")
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # Initialize model
+    tumor_seg_model = UNet().to(device)
+    tumor_seg_model.load_state_dict(torch.load(str(weights_file), map_location=device))
+    tumor_seg_model.eval()
+    return tumor_seg_model
+
+def _calibration_batch(max_images=32):
+    if not os.path.isdir(SEG_CALIBRATION_DIR):
+        return None
+    images = []
+    for name in sorted(os.listdir(SEG_CALIBRATION_DIR))[:max_images]:
+        img = cv2.imread(os.path.join(SEG_CALIBRATION_DIR, name), cv2.IMREAD_GRAYSCALE)
+        if img is not None:
+            images.append(_preprocess_seg_array(img))
+    return np.stack(images) if images else None
+
+def seg_calibration():
+    """
+    What the int8 backend is calibrated on (a digest of the scans, or
+    "random"); None for the other backends. Part of the prediction-cache key.
+    """
+    if SEG_BACKEND != "int8":
+        return None
+    calibration = _calibration_batch()
+    if calibration is None:
+        return "random"
+    return hashlib.sha256(calibration.tobytes()).hexdigest()[:16]
+
+def load_tumor_seg_model():
+    """
+    UNet wrapped in the configured inference backend. Called by the model
+    registry on first use.
+    """
+    from internal.seg_backends import build_backend
+    from internal import preload
+
+    calibration = _calibration_batch() if SEG_BACKEND == "int8" else None
+    if SEG_BACKEND == "int8" and calibration is None and not SEG_RANDOM_CALIBRATION:
+        raise FileNotFoundError(f"No calibration scans in {SEG_CALIBRATION_DIR} for the int8 backend "
+                                "(set SEG_RANDOM_CALIBRATION=1 to calibrate on random inputs)")
+    threads = SEG_THREADS
+    if preload.in_master():
+        # A pre-fork master stays single-threaded: an OpenMP pool would not survive fork()
+        import torch
+        torch.set_num_threads(1)
+        threads = 1
+    return build_backend(
+        load_unet(),
+        SEG_BACKEND,
+        weights_file=str(weights_file),
+        threads=threads,
+        channels_last=SEG_CHANNELS_LAST,
+        calibration=calibration,
+        cache_dir=str(SEG_CACHE_DIR),
+        random_calibration=SEG_RANDOM_CALIBRATION,
+    )
+
+registry.register("tumor_segmenter", load_tumor_seg_model)
 
 # Preprocessing for segmentation
-def _preprocess_seg(image_path: str) -> torch.Tensor:
+def _to_uint8_gray(img: np.ndarray) -> np.ndarray:
+    """
+    Grayscale uint8 view of a decoded image or volume slice; other dtypes
+    (16-bit TIFF, float .npy) are min-max scaled per slice.
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    if img.dtype != np.uint8:
+        img = img.astype(np.float32)
+        low, high = float(img.min()), float(img.max())
+        img = ((img - low) * (255.0 / (high - low)) if high > low else np.zeros_like(img)).astype(np.uint8)
+    return img
+
+def _preprocess_seg_array(img: np.ndarray) -> np.ndarray:
+    """
+    Decoded image (grayscale, or BGR as returned by cv2.imdecode) -> (1, 256, 256) float32.
+    """
+    img = _to_uint8_gray(img)
+    img = cv2.resize(img, (SEG_INPUT_SIZE, SEG_INPUT_SIZE))
+    return (img.astype(np.float32) / 255.0)[None]
+
+def _preprocess_seg(image_path: str) -> np.ndarray:
     img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    img = cv2.resize(img, (256, 256))
-    img = img / 255.0
-    img_tensor = torch.tensor(img, dtype=torch.float32).unsqueeze(0).unsqueeze(0).to(device)
-    return img_tensor
+    return _preprocess_seg_array(img)[None]
+
+def predict_logits_batch(batch: np.ndarray) -> np.ndarray:
+    """
+    Logits of shape (N, 256, 256) for a batch of preprocessed images of shape (N, 1, 256, 256).
+    """
+    backend = registry.get("tumor_segmenter")
+    return backend(batch)[:, 0]
+
+def predict_mask_batch(batch: np.ndarray) -> np.ndarray:
+    """
+    Binary masks (0 or 255) for a batch of preprocessed images of shape (N, 1, 256, 256).
+    """
+    # sigmoid(x) > 0.5 exactly when x > 0: threshold the logits directly
+    return (predict_logits_batch(batch) > 0).astype(np.uint8) * 255
+
+segmenter_scheduler = BatchScheduler(
+    "tumor_segmenter",
+    predict_mask_batch,
+    max_batch_size=int(os.environ.get("TUMOR_SEG_MAX_BATCH", 8)),
+    max_wait_ms=float(os.environ.get("TUMOR_SEG_MAX_WAIT_MS", 5)),
+)
+
+# Tiles need logits (blending happens before thresholding); they batch
+# across tiles of one image and across concurrent images
+tile_scheduler = BatchScheduler(
+    "tumor_segmenter_tiles",
+    predict_logits_batch,
+    max_batch_size=int(os.environ.get("TUMOR_SEG_TILE_MAX_BATCH", 8)),
+    max_wait_ms=float(os.environ.get("TUMOR_SEG_MAX_WAIT_MS", 5)),
+)
+
+def tile_starts(length: int, tile: int, overlap: int) -> list:
+    """Tile offsets covering [0, length): a stride of tile - overlap, the last tile flush with the end."""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, tile - overlap))
+    starts.append(length - tile)
+    return starts
+
+def blend_window(tile: int, overlap: int) -> np.ndarray:
+    """
+    Weights of one tile: 1 in the centre, ramping down across the overlap so
+    neighbouring tiles cross-fade instead of leaving seams.
+    """
+    ramp = np.ones(tile, np.float32)
+    if overlap:
+        edge = np.arange(1, overlap + 1, dtype=np.float32) / (overlap + 1)
+        ramp[:overlap], ramp[-overlap:] = edge, edge[::-1]
+    return np.outer(ramp, ramp)
+
+_window = blend_window(SEG_INPUT_SIZE, SEG_TILE_OVERLAP)
+
+class _TileBlender:
+    """Accumulates weighted tile logits as they finish; resolves `result` to the mask after the last one."""
+
+    def __init__(self, height, width, padded_shape, tiles):
+        self.height, self.width = height, width
+        self.logits = np.zeros(padded_shape, np.float32)
+        self.weights = np.zeros(padded_shape, np.float32)
+        self.remaining = tiles
+        self.lock = threading.Lock()
+        self.result = Future()
+
+    def add(self, y, x, future):
+        try:
+            logits = future.result()
+        except Exception as e:
+            with self.lock:
+                if not self.result.done():
+                    self.result.set_exception(e)
+            return
+        size = logits.shape[0]
+        with self.lock:
+            if self.result.done():
+                return
+            self.logits[y:y + size, x:x + size] += logits * _window
+            self.weights[y:y + size, x:x + size] += _window
+            self.remaining -= 1
+            if self.remaining:
+                return
+        # Every pixel is covered by at least one tile: weights are > 0
+        blended = self.logits[:self.height, :self.width] > 0
+        self.result.set_result(blended.astype(np.uint8) * 255)
+
+def tile_positions(height: int, width: int) -> list:
+    """
+    (y, x) of every tile covering a height x width image (padded to at least one tile).
+    :raises ValueError: more than SEG_MAX_TILES tiles
+    """
+    tile = SEG_INPUT_SIZE
+    rows = tile_starts(max(height, tile), tile, SEG_TILE_OVERLAP)
+    cols = tile_starts(max(width, tile), tile, SEG_TILE_OVERLAP)
+    if len(rows) * len(cols) > SEG_MAX_TILES:
+        raise ValueError(f"Image of {width}x{height} needs {len(rows) * len(cols)} tiles, "
+                         f"tiled mode allows {SEG_MAX_TILES}")
+    return [(y, x) for y in rows for x in cols]
+
+def submit_mask_tiled(img: np.ndarray) -> Future:
+    """
+    Queues an already decoded image for tiled segmentation at its native
+    resolution; the future resolves to a binary mask of the same height and
+    width. Sides shorter than one tile are zero-padded.
+    :raises ValueError: the image needs more than SEG_MAX_TILES tiles
+    """
+    positions = tile_positions(*img.shape[:2])
+    gray = _to_uint8_gray(img)
+    height, width = gray.shape
+    tile = SEG_INPUT_SIZE
+    padded = cv2.copyMakeBorder(gray, 0, max(0, tile - height), 0, max(0, tile - width),
+                                cv2.BORDER_CONSTANT, value=0)
+    blender = _TileBlender(height, width, padded.shape, len(positions))
+    for y, x in positions:
+        sample = (padded[y:y + tile, x:x + tile].astype(np.float32) / 255.0)[None]
+        tile_scheduler.submit(sample).add_done_callback(partial(blender.add, y, x))
+    return blender.result
+
+def submit_mask_mode(img: np.ndarray, mode: str) -> Future:
+    """submit_mask or submit_mask_tiled, by SEG_MODES name."""
+    if mode not in SEG_MODES:
+        raise ValueError(f"Unknown segmentation mode {mode!r}, expected one of {SEG_MODES}")
+    return submit_mask_tiled(img) if mode == "tiled" else submit_mask(img)
+
+def segment_volume(volume, mode: str = SEG_MODE, batch_size: int = SEG_VOLUME_BATCH):
+    """
+    Streams a volume through the UNet SEG_VOLUME_BATCH slices at a time;
+    only one batch of slices is in memory. Yields one binary mask per slice,
+    at the slice's own height and width.
+    :param volume: internal.image_io.Volume (or anything with batches(size))
+    :raises ValueError: tiled mode and slices larger than SEG_MAX_TILES tiles
+    """
+    if mode == "tiled" and hasattr(volume, "height"):
+        tile_positions(volume.height, volume.width)  # fail before the first slice is read
+    for slices in volume.batches(batch_size):
+        futures = [submit_mask_mode(image, mode) for image in slices]
+        for image, future in zip(slices, futures):
+            mask = future.result()
+            if mask.shape != image.shape[:2]:
+                mask = cv2.resize(mask, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_NEAREST)
+            yield mask
 
 # Public API: predict mask
+def predict_mask_array(img: np.ndarray) -> np.ndarray:
+    """
+    Binary mask (0 or 255) for an already decoded image.
+    """
+    return submit_mask(img).result()
+
+def submit_mask(img: np.ndarray):
+    """
+    Queues an already decoded image for segmentation; the future resolves
+    to its binary mask.
+    """
+    return segmenter_scheduler.submit(_preprocess_seg_array(img))
+
 def predict_mask(image_path: str) -> np.ndarray:
     """
     Generates a binary mask (0 or 255) for the tumor region.
     """
-    img_tensor = _preprocess_seg(image_path)
-    with torch.no_grad():
-        output = tumor_seg_model(img_tensor)
-        mask = torch.sigmoid(output).squeeze().cpu().numpy()
-    # Threshold and convert to uint8 mask
-    bin_mask = (mask > 0.5).astype(np.uint8) * 255
-    return bin_mask
+    img = _preprocess_seg(image_path)
+    return segmenter_scheduler.predict(img[0])
@@ -0,0 +1,147 @@
+"""
+classifier_backends.py
+
+Selectable CPU inference backends for the brain tumour classifier. Every
+backend is a callable taking a float32 batch of shape (N, 150, 150, 3) and
+returning the class probabilities, shape (N, 4), as a NumPy array:
+
+  - keras        the Keras Sequential model as trained (float32)
+  - tflite       converted to TensorFlow Lite, run with the XNNPACK delegate
+  - tflite-int8  TensorFlow Lite with int8 weights and activations,
+                 calibrated on representative scans; float32 in and out
+
+Converted models are cached on disk, keyed by the weights hash (and for
+tflite-int8 by the calibration batch), so only the first start needs
+TensorFlow for the TFLite backends: later starts run on the standalone
+LiteRT / tflite_runtime interpreter when it is installed.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ("keras", "tflite", "tflite-int8")
+
+
+def weights_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def calibration_digest(calibration) -> str:
+    """Short digest of a calibration batch; "random" for None (random-input calibration)."""
+    if calibration is None:
+        return "random"
+    return hashlib.sha256(np.ascontiguousarray(calibration, dtype=np.float32).tobytes()).hexdigest()[:16]
+
+
+def _interpreter_class():
+    """The lightest TFLite interpreter available."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        # Calls the model directly: no per-call predict() setup for small batches
+        return self.model(batch, training=False).numpy()
+
+
+class TFLiteBackend:
+    """
+    One interpreter with a batch-1 input, invoked per sample: micro-batches
+    vary in size and resizing the input would re-plan the XNNPACK delegate.
+    """
+
+    def __init__(self, tflite_path, threads=None, name="tflite"):
+        # The default (AUTO) op resolver runs the graph through the XNNPACK delegate
+        self.interpreter = _interpreter_class()(model_path=tflite_path, num_threads=threads)
+        self.interpreter.allocate_tensors()
+        self.name = name
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self._lock = threading.Lock()
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        out = []
+        with self._lock:
+            for sample in batch:
+                self.interpreter.set_tensor(self.input_index, sample[None])
+                self.interpreter.invoke()
+                out.append(self.interpreter.get_tensor(self.output_index)[0].copy())
+        return np.stack(out)
+
+
+def export_tflite(model, tflite_path, calibration=None):
+    """
+    Convert the Keras model to a .tflite file. With `calibration` (float32
+    batch (N, 150, 150, 3)) the graph is fully int8-quantised; input and
+    output stay float32 so preprocessing is the same for every backend.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([sample[None]] for sample in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    flatbuffer = converter.convert()
+    tmp = tflite_path + f".{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(flatbuffer)
+    os.replace(tmp, tflite_path)
+
+
+def build_backend(load_keras_model, name="keras", weights_file=None, threads=None, calibration=None,
+                  cache_dir=None, random_calibration=False):
+    """
+    :param load_keras_model:   zero-argument callable returning the Keras model with weights
+                               (only called when the backend needs TensorFlow)
+    :param threads:            intra-op threads for TensorFlow / the TFLite interpreter
+    :param calibration:        float32 batch (N, 150, 150, 3) used to calibrate tflite-int8
+    :param cache_dir:          where converted models are kept (default: the temp dir)
+    :param random_calibration: calibrate tflite-int8 on random inputs when `calibration` is None
+                               (inaccurate ranges; otherwise that is an error)
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown classifier backend {name!r}, expected one of {BACKENDS}")
+    if name == "keras":
+        return KerasBackend(load_keras_model())
+
+    tag = weights_digest(weights_file) if weights_file else "unversioned"
+    suffix = ".tflite"
+    if name == "tflite-int8":
+        if calibration is None and not random_calibration:
+            raise ValueError("The tflite-int8 backend needs a calibration batch of real scans")
+        # New calibration scans mean a new conversion, not the model cached from the old ones
+        suffix = f".int8-{calibration_digest(calibration)}.tflite"
+    tflite_path = os.path.join(cache_dir or tempfile.gettempdir(), f"classifier-{tag}{suffix}")
+    if not os.path.exists(tflite_path):
+        if name == "tflite-int8" and calibration is None:
+            log.warning("Calibrating int8 classifier on random inputs; pass real scans for accurate ranges")
+            calibration = np.random.default_rng(0).random((16, 150, 150, 3), dtype=np.float32)
+        os.makedirs(os.path.dirname(tflite_path), exist_ok=True)
+        export_tflite(load_keras_model(), tflite_path, calibration if name == "tflite-int8" else None)
+    return TFLiteBackend(tflite_path, threads, name)
@@ -0,0 +1,190 @@
+"""
+dense_index.py
+
+Dense retrieval tier next to the TF-IDF inverted index:
+  - LSA: a truncated SVD of the TF-IDF matrix projects questions (and
+    queries) into a small dense space where paraphrases with few shared
+    terms still land close together
+  - vectors are L2-normalised float32, optionally int8-quantised with a
+    per-vector scale
+  - IVF index: k-means centroids partition the vectors; a query scans only
+    the nprobe nearest lists, each stored contiguously
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+DENSE_DIM = 128
+DEFAULT_NPROBE = 8
+
+
+def _normalise_rows(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    np.divide(x, norms, out=x, where=norms > 0)
+    return x
+
+
+def fit_lsa(doc_matrix, dim=DENSE_DIM, seed=0):
+    """
+    SVD components mapping TF-IDF rows to `dim` dense dimensions,
+    as a (dim, n_terms) float32 array; None if the corpus is too small.
+    """
+    from sklearn.decomposition import TruncatedSVD
+
+    dim = min(dim, min(doc_matrix.shape) - 1)
+    if dim < 1:
+        return None
+    svd = TruncatedSVD(n_components=dim, algorithm="randomized", random_state=seed)
+    svd.fit(doc_matrix)
+    return svd.components_.astype(np.float32)
+
+
+def embed(matrix, components):
+    """(n, n_terms) sparse TF-IDF rows -> (n, dim) L2-normalised float32."""
+    dense = sp.csr_matrix(matrix, dtype=np.float32) @ components.T
+    return _normalise_rows(np.asarray(dense, dtype=np.float32))
+
+
+def quantize_int8(vectors):
+    """Symmetric per-vector int8: vectors ~= codes * scales[:, None]."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class IvfIndex:
+    def __init__(self, centroids, offsets, ids, vectors, scales=None, nprobe=DEFAULT_NPROBE):
+        """
+        :param centroids: (nlist, dim) L2-normalised list centroids
+        :param offsets:   (nlist + 1,) start of each list in ids/vectors
+        :param ids:       (n,) doc ids in list order
+        :param vectors:   (n, dim) float32, or int8 codes when `scales` is given
+        :param scales:    (n,) per-vector scale of int8 codes
+        """
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.scales = scales
+        self.nprobe = nprobe
+        # Doc id -> row in list order, for scoring arbitrary documents
+        self.positions = np.empty(len(ids), dtype=np.int64)
+        self.positions[ids] = np.arange(len(ids))
+
+    @classmethod
+    def build(cls, vectors, nlist=None, quantize=True, nprobe=DEFAULT_NPROBE, seed=0):
+        """
+        :param vectors: (n, dim) L2-normalised float32, row i is doc i
+        :param nlist:   number of lists (default ~sqrt(n))
+        """
+        from sklearn.cluster import MiniBatchKMeans
+
+        n = len(vectors)
+        nlist = max(1, min(n, nlist or int(np.sqrt(n))))
+        if nlist > 1:
+            kmeans = MiniBatchKMeans(n_clusters=nlist, n_init=3, random_state=seed,
+                                     batch_size=min(n, 4096), max_iter=50)
+            assign = kmeans.fit_predict(vectors)
+            centroids = _normalise_rows(kmeans.cluster_centers_.astype(np.float32))
+        else:
+            assign = np.zeros(n, dtype=np.int64)
+            centroids = _normalise_rows(vectors.mean(axis=0, keepdims=True).astype(np.float32))
+
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=offsets[1:])
+        ordered = np.ascontiguousarray(vectors[order])
+        if quantize:
+            codes, scales = quantize_int8(ordered)
+            return cls(centroids, offsets, order.astype(np.int64), codes, scales, nprobe)
+        return cls(centroids, offsets, order.astype(np.int64), ordered, None, nprobe)
+
+    def arrays(self) -> dict:
+        arrays = {"centroids": self.centroids, "offsets": self.offsets, "ids": self.ids, "vectors": self.vectors}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, nprobe=DEFAULT_NPROBE):
+        return cls(arrays["centroids"], arrays["offsets"], arrays["ids"], arrays["vectors"],
+                   arrays.get("scales"), nprobe)
+
+    def _scores(self, start, end, query):
+        block = self.vectors[start:end]
+        if self.scales is None:
+            return block @ query
+        return (block.astype(np.float32) @ query) * self.scales[start:end]
+
+    def score_docs(self, doc_ids, query):
+        """Dense cosine of `query` with the given documents."""
+        rows = self.positions[np.asarray(doc_ids, dtype=np.int64)]
+        block = self.vectors[rows].astype(np.float32)
+        scores = block @ query
+        return scores * self.scales[rows] if self.scales is not None else scores
+
+    def search(self, query, k=5, nprobe=None):
+        """
+        Approximate top-k by inner product.
+        :param query: (dim,) L2-normalised float32
+        :return: list of (doc_id, score), best first
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        if nprobe < len(centroid_scores):
+            lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            lists = np.arange(len(centroid_scores))
+        ids, scores = [], []
+        for lst in lists:
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            if end > start:
+                ids.append(self.ids[start:end])
+                scores.append(self._scores(start, end, query))
+        if not ids:
+            return []
+        return _top(np.concatenate(ids), np.concatenate(scores), k)
+
+    def brute_force(self, query, k=5):
+        """Exact top-k over every vector (reference for recall measurements)."""
+        return _top(self.ids, self._scores(0, len(self.ids), query), k)
+
+
+def _top(ids, scores, k):
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        ids, scores = ids[part], scores[part]
+    order = np.lexsort((ids, -scores))
+    return [(int(ids[i]), float(scores[i])) for i in order]
+
+
+class DenseRetriever:
+    """LSA projection + IVF index; queries are TF-IDF rows from the same vectorizer."""
+
+    def __init__(self, components, ivf):
+        self.components = components
+        self.ivf = ivf
+
+    @classmethod
+    def build(cls, doc_matrix, dim=DENSE_DIM, quantize=True, nlist=None, nprobe=DEFAULT_NPROBE):
+        components = fit_lsa(doc_matrix, dim)
+        if components is None:
+            return None
+        return cls(components, IvfIndex.build(embed(doc_matrix, components), nlist, quantize, nprobe))
+
+    def arrays(self) -> dict:
+        arrays = {"components": self.components}
+        arrays.update({f"ivf_{name}": arr for name, arr in self.ivf.arrays().items()})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, nprobe=DEFAULT_NPROBE):
+        ivf = {name[4:]: arr for name, arr in arrays.items() if name.startswith("ivf_")}
+        return cls(arrays["components"], IvfIndex.from_arrays(ivf, nprobe))
+
+    def query_vector(self, query_vec):
+        return embed(query_vec, self.components)[0]
+
+    def search(self, query_vec, k=5):
+        return self.ivf.search(self.query_vector(query_vec), k)
@@ -1,56 +1,204 @@
 # fuzzy_fever.py
 
 import re
+import threading
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
 
-def assess_fever_description(fever_desc: str) -> str:
+# Universes of the fuzzy variables
+# Temperature from 36.0 to 42.0 in steps of 0.1
+TEMPERATURE_UNIVERSE = np.arange(36.0, 42.0, 0.1)
+# Heart rate from 40 to 180 in steps of 1 (example range)
+HEART_RATE_UNIVERSE = np.arange(40, 181, 1)
+CONCERN_UNIVERSE = np.arange(0, 101, 1)
+
+# Fuzzy rules (combine temperature & heart_rate):
+# (temperature term, operator, heart rate term, concern term).
+# Adjust rules as makes sense for your scenario.
+FEVER_RULES = (
+    ("normal",   "&", "normal",   "low"),
+    ("normal",   "&", "elevated", "medium"),
+    ("mild",     "&", "normal",   "medium"),
+    ("mild",     "&", "elevated", "medium"),
+    ("moderate", "&", "normal",   "medium"),
+    ("moderate", "&", "high",     "high"),
+    ("high",     "|", "high",     "high"),
+)
+
+
+def build_fever_variables():
     """
-    Interpret a user's fever description (e.g. "mild", "moderate", "high")
-    and (optionally) a heart rate from the user's text using fuzzy logic.
-    Returns a recommended response based on both temperature and heart rate.
+    Builds the fuzzy variables with their membership functions.
+    Returns (temperature, heart_rate, concern).
     """
+    temperature = ctrl.Antecedent(TEMPERATURE_UNIVERSE, 'temperature')
+    heart_rate  = ctrl.Antecedent(HEART_RATE_UNIVERSE, 'heart_rate')
+    concern     = ctrl.Consequent(CONCERN_UNIVERSE, 'concern')
 
-    # 1. Define fuzzy variables
-    # Temperature from 36.0 to 42.0 in steps of 0.1
-    temperature = ctrl.Antecedent(np.arange(36.0, 42.0, 0.1), 'temperature')
-    # Heart rate from 40 to 180 in steps of 1 (example range)
-    heart_rate  = ctrl.Antecedent(np.arange(40, 181, 1), 'heart_rate')
-    concern     = ctrl.Consequent(np.arange(0, 101, 1), 'concern')
-
-    # 2. Define membership functions for temperature
+    # Membership functions for temperature
     temperature['normal']   = fuzz.trimf(temperature.universe, [36.0, 36.0, 37.0])
     temperature['mild']     = fuzz.trimf(temperature.universe, [37.0, 37.5, 38.0])
     temperature['moderate'] = fuzz.trimf(temperature.universe, [38.0, 39.0, 40.0])
     temperature['high']     = fuzz.trimf(temperature.universe, [39.5, 41.0, 42.0])
 
-    # 3. Define membership functions for heart rate
+    # Membership functions for heart rate
     #    You can adjust these ranges to be more precise if needed
     heart_rate['normal']   = fuzz.trapmf(heart_rate.universe, [40, 60, 80, 90])
     heart_rate['elevated'] = fuzz.trimf(heart_rate.universe, [80, 100, 120])
     heart_rate['high']     = fuzz.trapmf(heart_rate.universe, [110, 130, 180, 180])
 
-    # 4. Define membership functions for concern level (0-100)
+    # Membership functions for concern level (0-100)
     concern['low']    = fuzz.trimf(concern.universe, [0, 0, 25])
     concern['medium'] = fuzz.trimf(concern.universe, [25, 50, 75])
     concern['high']   = fuzz.trimf(concern.universe, [75, 100, 100])
 
-    # 5. Define fuzzy rules (combine temperature & heart_rate)
-    #    Adjust rules as makes sense for your scenario:
-    rule1 = ctrl.Rule(temperature['normal'] & heart_rate['normal'],   concern['low'])
-    rule2 = ctrl.Rule(temperature['normal'] & heart_rate['elevated'], concern['medium'])
-    rule3 = ctrl.Rule(temperature['mild']   & heart_rate['normal'],   concern['medium'])
-    rule4 = ctrl.Rule(temperature['mild']   & heart_rate['elevated'], concern['medium'])
-    rule5 = ctrl.Rule(temperature['moderate'] & heart_rate['normal'], concern['medium'])
-    rule6 = ctrl.Rule(temperature['moderate'] & heart_rate['high'],   concern['high'])
-    rule7 = ctrl.Rule(temperature['high'] | heart_rate['high'],       concern['high'])
-
-    # 6. Create and simulate the control system
-    fever_ctrl = ctrl.ControlSystem([rule1, rule2, rule3, rule4, rule5, rule6, rule7])
-    fever_sim = ctrl.ControlSystemSimulation(fever_ctrl)
-
-    # 7. Map textual input to numeric temperature
+    return temperature, heart_rate, concern
+
+
+def build_fever_control_system():
+    """
+    Builds the skfuzzy ControlSystem from FEVER_RULES.
+    This is the reference implementation the compiled engine is checked against.
+    """
+    temperature, heart_rate, concern = build_fever_variables()
+    rules = []
+    for temp_term, op, hr_term, concern_term in FEVER_RULES:
+        if op == "&":
+            antecedent = temperature[temp_term] & heart_rate[hr_term]
+        else:
+            antecedent = temperature[temp_term] | heart_rate[hr_term]
+        rules.append(ctrl.Rule(antecedent, concern[concern_term]))
+    return ctrl.ControlSystem(rules)
+
+
+class FuzzyFeverEngine:
+    """
+    Compiled fever controller.
+
+    The rule base is evaluated once over the whole temperature x heart rate
+    grid and stored as a NumPy surface; assessments are answered by bilinear
+    interpolation on that surface. Cells where no rule fires hold NaN.
+    """
+
+    def __init__(self):
+        temperature, heart_rate, concern = build_fever_variables()
+        self.temperature_universe = temperature.universe
+        self.heart_rate_universe = heart_rate.universe
+        self.concern_universe = concern.universe
+        self._temperature_mfs = {label: term.mf for label, term in temperature.terms.items()}
+        self._heart_rate_mfs = {label: term.mf for label, term in heart_rate.terms.items()}
+        self._concern_mfs = {label: term.mf for label, term in concern.terms.items()}
+        self._t_step = self.temperature_universe[1] - self.temperature_universe[0]
+        self._hr_step = self.heart_rate_universe[1] - self.heart_rate_universe[0]
+        self._surface = None
+        self._lock = threading.Lock()
+
+    @property
+    def surface(self) -> np.ndarray:
+        """Concern surface, shape (len(temperature), len(heart_rate)); built on first use."""
+        if self._surface is None:
+            with self._lock:
+                if self._surface is None:
+                    self._surface = self._compute(self.temperature_universe[:, None],
+                                                  self.heart_rate_universe[None, :])
+        return self._surface
+
+    def _activations(self, temps, hrs):
+        """Rule activation (cut) of every concern term, broadcast over the inputs."""
+        t_mu = {label: fuzz.interp_membership(self.temperature_universe, mf, temps)
+                for label, mf in self._temperature_mfs.items()}
+        hr_mu = {label: fuzz.interp_membership(self.heart_rate_universe, mf, hrs)
+                 for label, mf in self._heart_rate_mfs.items()}
+        shape = np.broadcast(temps, hrs).shape
+        cuts = {label: np.zeros(shape) for label in self._concern_mfs}
+        for temp_term, op, hr_term, concern_term in FEVER_RULES:
+            combine = np.fmin if op == "&" else np.fmax
+            strength = combine(t_mu[temp_term], hr_mu[hr_term])
+            np.fmax(cuts[concern_term], strength, out=cuts[concern_term])
+        return cuts
+
+    def _defuzz(self, cuts) -> float:
+        """Centroid of the clipped, aggregated output set (same steps as skfuzzy)."""
+        new_values = []
+        for label, mf in self._concern_mfs.items():
+            new_values.extend(fuzz.interp_universe(self.concern_universe, mf, cuts[label]))
+        universe = np.union1d(self.concern_universe, new_values)
+        output_mf = np.zeros_like(universe, dtype=np.float64)
+        for label, mf in self._concern_mfs.items():
+            upsampled = fuzz.interp_membership(self.concern_universe, mf, universe)
+            np.maximum(output_mf, np.minimum(cuts[label], upsampled), output_mf)
+        if not output_mf.any():
+            return np.nan
+        return fuzz.defuzz(universe, output_mf, "centroid")
+
+    def _compute(self, temps, hrs) -> np.ndarray:
+        """Exact concern for broadcastable input arrays; many cells share the same cuts."""
+        cuts = self._activations(np.asarray(temps, dtype=float), np.asarray(hrs, dtype=float))
+        labels = list(cuts)
+        stacked = np.stack([cuts[label] for label in labels], axis=-1)
+        flat = stacked.reshape(-1, len(labels))
+        unique, inverse = np.unique(flat, axis=0, return_inverse=True)
+        values = np.array([self._defuzz(dict(zip(labels, row))) for row in unique])
+        return values[inverse.ravel()].reshape(stacked.shape[:-1])
+
+    def concern_batch(self, temperatures, heart_rates) -> np.ndarray:
+        """
+        Concern level for many (temperature, heart rate) pairs in one call.
+        Inputs are clipped to the variable universes; NaN marks pairs where
+        no rule fires.
+        """
+        temps = np.asarray(temperatures, dtype=float)
+        hrs = np.asarray(heart_rates, dtype=float)
+        temps, hrs = np.broadcast_arrays(temps, hrs)
+        surface = self.surface
+
+        # Fractional grid positions; rounding snaps float noise onto grid points
+        t_pos = np.round((temps - self.temperature_universe[0]) / self._t_step, 9)
+        hr_pos = np.round((hrs - self.heart_rate_universe[0]) / self._hr_step, 9)
+        t_pos = np.clip(t_pos, 0, len(self.temperature_universe) - 1)
+        hr_pos = np.clip(hr_pos, 0, len(self.heart_rate_universe) - 1)
+        t0 = np.minimum(np.floor(t_pos).astype(int), len(self.temperature_universe) - 2)
+        h0 = np.minimum(np.floor(hr_pos).astype(int), len(self.heart_rate_universe) - 2)
+        tw = t_pos - t0
+        hw = hr_pos - h0
+
+        result = np.zeros(temps.shape)
+        for dt, wt in ((0, 1 - tw), (1, tw)):
+            for dh, wh in ((0, 1 - hw), (1, hw)):
+                w = wt * wh
+                corner = surface[t0 + dt, h0 + dh]
+                # NaN corners only matter when they carry weight
+                result += np.where(w > 0, w * corner, 0.0)
+
+        # Off-grid points next to an undefined cell: evaluate them exactly
+        missing = np.isnan(result)
+        if missing.any():
+            result[missing] = self._compute(
+                np.clip(temps[missing], self.temperature_universe[0], self.temperature_universe[-1]),
+                np.clip(hrs[missing], self.heart_rate_universe[0], self.heart_rate_universe[-1]),
+            )
+        return result
+
+    def concern(self, temperature: float, heart_rate: float) -> float:
+        """Concern level (0-100) for a single pair; raises ValueError if no rule fires."""
+        level = float(self.concern_batch(temperature, heart_rate))
+        if np.isnan(level):
+            raise ValueError(
+                f"No fuzzy rule fires for temperature={temperature}, heart_rate={heart_rate}"
+            )
+        return level
+
+
+# Compiled once per process; the surface itself is built lazily on first use
+fever_engine = FuzzyFeverEngine()
+
+
+def parse_fever_description(fever_desc: str):
+    """
+    Map a textual fever description to (temperature, heart_rate).
+    """
+    # Map textual input to numeric temperature
     user_input_temp = 36.5  # default if no fever keyword found
     desc_lower = fever_desc.lower()
 
@@ -61,27 +209,26 @@ def assess_fever_description(fever_desc: str) -> str:
     elif any(word in desc_lower for word in ["high", "severe"]):
         user_input_temp = 40.0
 
-    # 8. Attempt to parse a numeric heart rate from the description (if provided).
-    #    If none is found, we default to a "normal" 80 BPM.
+    # Attempt to parse a numeric heart rate from the description (if provided).
+    # If none is found, we default to a "normal" 80 BPM.
     user_input_hr = 80
     # Simple regex to look for a number (like 90 or 120, etc.)
     hr_match = re.search(r'\b(\d{2,3})\b', desc_lower)
     if hr_match:
-        # Convert the captured text to int. You could refine the detection 
+        # Convert the captured text to int. You could refine the detection
         # by searching specifically for "heart rate" patterns, if needed.
         parsed_value = int(hr_match.group(1))
         # Only accept plausible heart-rate ranges for humans
         if 40 <= parsed_value <= 180:
             user_input_hr = parsed_value
 
-    # 9. Run the fuzzy system with both temperature & heart_rate
-    fever_sim.input['temperature'] = user_input_temp
-    fever_sim.input['heart_rate']  = user_input_hr
-    fever_sim.compute()
+    return user_input_temp, user_input_hr
 
-    concern_level = fever_sim.output['concern']
 
-    # 10. Convert numeric concern to a user-facing message
+def format_fever_advice(user_input_temp, user_input_hr, concern_level) -> str:
+    """
+    Convert numeric concern to a user-facing message.
+    """
     if concern_level < 30:
         msg = (
             f"Temp ~{user_input_temp}°C, HR ~{user_input_hr} bpm => Concern: {concern_level:.1f}%.\n"
@@ -99,3 +246,32 @@ def assess_fever_description(fever_desc: str) -> str:
         )
 
     return msg
+
+
+def assess_fever_description(fever_desc: str) -> str:
+    """
+    Interpret a user's fever description (e.g. "mild", "moderate", "high")
+    and (optionally) a heart rate from the user's text using fuzzy logic.
+    Returns a recommended response based on both temperature and heart rate.
+    """
+    user_input_temp, user_input_hr = parse_fever_description(fever_desc)
+    concern_level = fever_engine.concern(user_input_temp, user_input_hr)
+    return format_fever_advice(user_input_temp, user_input_hr, concern_level)
+
+
+def assess_fever_batch(fever_descs) -> list:
+    """
+    Vectorised assess_fever_description for many descriptions at once.
+    """
+    parsed = [parse_fever_description(desc) for desc in fever_descs]
+    if not parsed:
+        return []
+    temps, hrs = zip(*parsed)
+    levels = fever_engine.concern_batch(temps, hrs)
+    results = []
+    for temp, hr, level in zip(temps, hrs, levels):
+        if np.isnan(level):
+            results.append("I couldn't assess that fever description.")
+        else:
+            results.append(format_fever_advice(temp, hr, level))
+    return results
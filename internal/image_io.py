@@ -0,0 +1,105 @@
+"""
+image_io.py
+
+In-memory image helpers for the imaging endpoints: decode an upload once
+straight from its bytes and encode results without touching the disk.
+Multi-slice volumes are read from disk a batch of slices at a time.
+"""
+
+import io
+import zipfile
+
+import cv2
+import numpy as np
+
+
+def decode_image(data) -> np.ndarray:
+    """
+    Decode uploaded bytes (or any buffer) into a BGR array without copying
+    the input: np.frombuffer wraps the memoryview directly.
+    """
+    buf = np.frombuffer(memoryview(data), dtype=np.uint8)
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Unable to decode the uploaded image")
+    return img
+
+
+def encode_png(img: np.ndarray) -> bytes:
+    ok, buf = cv2.imencode(".png", img)
+    if not ok:
+        raise ValueError("Unable to encode image as PNG")
+    return buf.tobytes()
+
+
+NPY_MAGIC = b"\x93NUMPY"
+TIFF_MAGICS = (b"II*\x00", b"MM\x00*")
+
+
+class Volume:
+    """
+    A multi-slice scan on disk (.npy of shape (slices, H, W) or (H, W), or a
+    multi-page TIFF), read a batch of slices at a time: .npy files are
+    memory-mapped, TIFF pages are decoded by range.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic = f.read(6)
+        if magic.startswith(NPY_MAGIC):
+            self._array = np.load(path, mmap_mode="r")
+            if self._array.ndim == 2:
+                self._array = self._array[None]
+            if self._array.ndim != 3:
+                raise ValueError(f"Expected a .npy volume of shape (slices, H, W), got {self._array.shape}")
+            self.slices, self.height, self.width = self._array.shape
+        elif magic[:4] in TIFF_MAGICS:
+            self._array = None
+            self.slices = cv2.imcount(path, cv2.IMREAD_UNCHANGED)
+            first = self._read_pages(0, 1)[0]
+            self.height, self.width = first.shape[:2]
+        else:
+            raise ValueError("Unsupported volume: expected a .npy array or a multi-page TIFF")
+
+    def _read_pages(self, start, count):
+        ok, pages = cv2.imreadmulti(self.path, start, count, flags=cv2.IMREAD_UNCHANGED)
+        if not ok or len(pages) != count:
+            raise ValueError(f"Unable to read TIFF pages {start}..{start + count - 1}")
+        return pages
+
+    def batches(self, size):
+        """Yields lists of at most `size` 2D (or BGR) slices, in order."""
+        for start in range(0, self.slices, size):
+            count = min(size, self.slices - start)
+            if self._array is not None:
+                pages = list(np.asarray(self._array[start:start + count]))
+            else:
+                pages = self._read_pages(start, count)
+            for page in pages:
+                if page.shape[:2] != (self.height, self.width):
+                    raise ValueError(f"Slices differ in size: {page.shape[:2]} vs {(self.height, self.width)}")
+            yield pages
+
+
+class MaskStackWriter:
+    """
+    Writes (H, W) uint8 masks one at a time into an in-memory .npz holding a
+    single (slices, H, W) array "masks"; only the compressed output is kept.
+    """
+
+    def __init__(self, slices, height, width):
+        self.buffer = io.BytesIO()
+        self.zip = zipfile.ZipFile(self.buffer, "w", zipfile.ZIP_DEFLATED)
+        self.entry = self.zip.open("masks.npy", "w", force_zip64=True)
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.uint8)),
+                  "fortran_order": False, "shape": (slices, height, width)}
+        np.lib.format.write_array_header_2_0(self.entry, header)
+
+    def write(self, mask: np.ndarray):
+        self.entry.write(np.ascontiguousarray(mask, dtype=np.uint8).tobytes())
+
+    def close(self) -> bytes:
+        self.entry.close()
+        self.zip.close()
+        return self.buffer.getvalue()
@@ -0,0 +1,122 @@
+"""
+inference.py
+
+Per-upload inference for /brain/segment:
+  - the classifier and the segmenter run in parallel: both samples are
+    submitted to their BatchSchedulers before waiting on either, so the
+    Keras and PyTorch forward passes overlap (both release the GIL)
+  - the CPU cores are split between the two runtimes (thread_split), each
+    with one inter-op thread, so running side by side does not oversubscribe
+  - admission control: at most max_pending uploads are in flight; beyond
+    that run() raises Overloaded and the caller answers 503 with Retry-After
+INFERENCE_PARALLEL=0 restores the serial path (classify, then segment).
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import internal.metrics as metrics
+
+INFERENCE_PARALLEL = os.environ.get("INFERENCE_PARALLEL", "1") == "1"
+# Cores shared by both runtimes (default: the cores this process may use)
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 0)) or (
+    len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1)
+# The UNet does most of the work; the small CNN gets the rest
+CLASSIFIER_THREAD_SHARE = float(os.environ.get("CLASSIFIER_THREAD_SHARE", 0.25))
+
+
+def thread_split(total=INFERENCE_THREADS, parallel=INFERENCE_PARALLEL, share=CLASSIFIER_THREAD_SHARE) -> dict:
+    """Intra-op threads per runtime: disjoint shares when they run side by side."""
+    if not parallel or total < 2:
+        return {"classifier": total, "segmenter": total}
+    classifier = min(total - 1, max(1, round(total * share)))
+    return {"classifier": classifier, "segmenter": total - classifier}
+
+
+class Overloaded(Exception):
+    def __init__(self, pending, retry_after):
+        super().__init__(f"Inference queue full ({pending} uploads in flight)")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    def __init__(self, classify, segment, max_pending=32, parallel=INFERENCE_PARALLEL):
+        """
+        :param classify:    callable(decoded image) -> Future of the class probabilities
+        :param segment:     callable(decoded image) -> Future of the mask
+        :param max_pending: uploads in flight before run() raises Overloaded
+        :param parallel:    submit both models before waiting on either
+        """
+        self.classify = classify
+        self.segment = segment
+        self.max_pending = max(1, int(max_pending))
+        self.parallel = parallel
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._latency = None       # moving average of run() seconds
+        self.completed = 0
+        self.rejected = 0
+        metrics.register_gauge("inference_pending", lambda: self._pending)
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                pending = self._pending
+            else:
+                self._pending += 1
+                return
+        metrics.inc("inference_rejected_total")
+        # A slot frees up about one service time from now
+        raise Overloaded(pending, max(1, math.ceil(self._latency or 1)))
+
+    def _release(self, seconds):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+            if seconds is not None:
+                self._latency = seconds if self._latency is None else 0.9 * self._latency + 0.1 * seconds
+
+    @contextmanager
+    def admit(self, timed=True):
+        """
+        Holds one in-flight slot for the block (volumes take one for all their slices).
+        :param timed: count the block in the latency behind Retry-After (not for volumes)
+        :raises Overloaded: max_pending uploads are already in flight
+        """
+        self._admit()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - start if timed else None)
+
+    def run(self, img, segment=None):
+        """
+        (class probabilities, mask) for a decoded image.
+        :param segment: replaces the executor's segment callable (e.g. tiled mode)
+        :raises Overloaded: max_pending uploads are already in flight
+        """
+        segment = segment or self.segment
+        with self.admit(), metrics.stage("inference"):
+            if self.parallel:
+                # Segment first: a rejected image (e.g. too many tiles) never reaches the classifier
+                mask = segment(img)
+                probabilities = self.classify(img)
+                return probabilities.result(), mask.result()
+            probabilities = self.classify(img).result()
+            return probabilities, segment(img).result()
+
+    def stats(self) -> dict:
+        return {
+            "parallel": self.parallel,
+            "threads": thread_split(parallel=self.parallel),
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency": self._latency,
+        }
@@ -0,0 +1,258 @@
+"""
+kb_inference.py
+
+Forward chaining over the knowledge base store:
+  - Horn rules such as  Symptom(x,z) & Subtype(y,z) -> Symptom(x,y)
+    (?x, or a single lower-case letter with optional digits as in NLTK, is a
+    variable; everything else is a constant)
+  - derived facts are materialised in memory and kept up to date
+    incrementally: only facts new since the last sync are pushed through the
+    rules (semi-naive evaluation), each join probing the predicate/argument
+    indexes instead of scanning
+  - pattern queries with variables, e.g. Symptom(?x,Cold)
+
+Derived facts are never written to kb_file.kb, so changing the rules file
+only needs a knowledge reload.
+"""
+
+import logging
+import os
+import re
+import threading
+
+from internal.kb_store import parse_atom
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(__file__)
+RULES_FILE = os.path.join(BASE_DIR, "storage", "kb_rules.kb")
+MAX_DERIVED = 2_000_000   # safety valve against runaway rules
+
+_VARIABLE = re.compile(r"^(\?\w+|[a-z]\d*)$")
+
+
+def is_variable(term: str) -> bool:
+    return _VARIABLE.match(term) is not None
+
+
+def normalise_terms(terms) -> tuple:
+    """Spell every variable as ?name, so the hot loops can test term[0] == "?"."""
+    return tuple(("?" + t.lstrip("?")) if is_variable(t) else t for t in terms)
+
+
+def parse_pattern(text: str):
+    """ "Symptom(?x, Cold)" -> ("Symptom", ("?x", "Cold")); raises ValueError if not an atom."""
+    atom = parse_atom("".join(text.split()))
+    if atom is None or not atom[1]:
+        raise ValueError(f"Not an atomic pattern: {text!r}")
+    return atom
+
+
+def format_atom(predicate, args) -> str:
+    # Same canonical form as str(Expression) for atoms
+    return f"{predicate}({','.join(args)})"
+
+
+class Rule:
+    def __init__(self, body, head):
+        """
+        :param body: list of (predicate, terms) atoms, all must hold
+        :param head: (predicate, terms) atom derived for every joint binding
+        """
+        self.body = [(predicate, normalise_terms(terms)) for predicate, terms in body]
+        self.head = (head[0], normalise_terms(head[1]))
+        body_vars = {t for _, terms in self.body for t in terms if t[0] == "?"}
+        unbound = [t for t in self.head[1] if t[0] == "?" and t not in body_vars]
+        if unbound:
+            raise ValueError(f"Head variables {unbound} do not appear in the body")
+
+    @classmethod
+    def parse(cls, line: str):
+        """ "Symptom(x,z) & Subtype(y,z) -> Symptom(x,y)" """
+        body, sep, head = line.partition("->")
+        if not sep:
+            raise ValueError(f"Rule without '->': {line!r}")
+        return cls([parse_pattern(atom) for atom in body.split("&")], parse_pattern(head))
+
+    def __str__(self):
+        body = " & ".join(format_atom(*atom) for atom in self.body)
+        return f"{body} -> {format_atom(*self.head)}"
+
+
+def load_rules(path=RULES_FILE):
+    rules = []
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    rules.append(Rule.parse(line))
+    except FileNotFoundError:
+        pass
+    return rules
+
+
+def _unify(terms, args, binding):
+    """Extend `binding` so that normalised `terms` match the fact arguments, or None."""
+    if len(terms) != len(args):
+        return None
+    extended = dict(binding)
+    for term, arg in zip(terms, args):
+        if term[0] == "?":
+            if extended.setdefault(term, arg) != arg:
+                return None
+        elif term != arg:
+            return None
+    return extended
+
+
+class InferenceEngine:
+    """
+    Wraps a KnowledgeBase: `in`, add() and query() see stored and derived
+    facts alike, so kb_methods can use it wherever it used the store.
+    """
+
+    def __init__(self, kb, rules):
+        self.kb = kb
+        self.rules = rules
+        # predicate -> [(rule, index of the body atom with that predicate)]
+        self._triggers = {}
+        for rule in rules:
+            for i, (predicate, _) in enumerate(rule.body):
+                self._triggers.setdefault(predicate, []).append((rule, i))
+        self._lock = threading.RLock()
+        self._reset()
+        self.sync()
+
+    def _reset(self):
+        self._derived = {}        # fact -> (predicate, args)
+        self._by_predicate = {}
+        self._by_argument = {}
+        self._generation = None
+        self._position = 0
+
+    # ---- materialisation --------------------------------------------------
+
+    def sync(self):
+        """Push facts added since the last sync (by any worker) through the rules."""
+        with self._lock:
+            generation, position, new = self.kb.changes(self._generation, self._position)
+            if generation != self._generation:
+                self._reset()
+            self._generation, self._position = generation, position
+            delta = [atom for atom in map(parse_atom, new) if atom is not None]
+            if delta and self._triggers:
+                self._saturate(delta)
+
+    def _saturate(self, delta):
+        while delta:
+            next_delta = []
+            for predicate, args in delta:
+                for rule, i in self._triggers.get(predicate, ()):
+                    binding = _unify(rule.body[i][1], args, {})
+                    if binding is None:
+                        continue
+                    rest = rule.body[:i] + rule.body[i + 1:]
+                    for full in self._join(rest, binding):
+                        head = (rule.head[0], tuple(full.get(t, t) for t in rule.head[1]))
+                        if self._derive(head):
+                            next_delta.append(head)
+            delta = next_delta
+
+    def _join(self, atoms, binding):
+        if not atoms:
+            yield binding
+            return
+        # Most-bound atom first keeps the index probes selective
+        i = 0 if len(atoms) == 1 else max(range(len(atoms)), key=lambda k: sum(
+            t[0] != "?" or t in binding for t in atoms[k][1]))
+        predicate, terms = atoms[i]
+        rest = atoms[:i] + atoms[i + 1:]
+        probe = tuple(binding.get(t) if t[0] == "?" else t for t in terms)
+        for args in self._candidates(predicate, probe):
+            extended = _unify(terms, args, binding)
+            if extended is not None:
+                yield from self._join(rest, extended)
+
+    def _candidates(self, predicate, probe):
+        # Copy: another thread may index new journal lines while we iterate
+        for fact in tuple(self.kb.lookup(predicate, probe)):
+            yield parse_atom(fact)[1]
+        for fact in self._lookup_derived(predicate, probe):
+            yield self._derived[fact][1]
+
+    def _lookup_derived(self, predicate, probe):
+        bound = [(i, a) for i, a in enumerate(probe) if a is not None]
+        if not bound:
+            return tuple(self._by_predicate.get(predicate, ()))
+        sets = [self._by_argument.get((predicate, i, a), set()) for i, a in bound]
+        return tuple(set.intersection(*sets)) if len(sets) > 1 else tuple(sets[0])
+
+    def _derive(self, atom) -> bool:
+        fact = format_atom(*atom)
+        if fact in self._derived or self.kb.known(fact):
+            return False
+        if len(self._derived) >= MAX_DERIVED:
+            log.warning("Derived fact limit (%d) reached; check the rules for runaway recursion", MAX_DERIVED)
+            return False
+        predicate, args = atom
+        self._derived[fact] = atom
+        self._by_predicate.setdefault(predicate, set()).add(fact)
+        for position, arg in enumerate(args):
+            self._by_argument.setdefault((predicate, position, arg), set()).add(fact)
+        return True
+
+    # ---- KB-like interface ------------------------------------------------
+
+    def __contains__(self, expr) -> bool:
+        with self._lock:
+            self.sync()
+            fact = str(expr)
+            return fact in self._derived or expr in self.kb
+
+    def add(self, expr, conflicts=()):
+        """Store `expr` (see KnowledgeBase.add), treating derived facts as known."""
+        with self._lock:
+            self.sync()
+            for fact in (expr, *conflicts):
+                if str(fact) in self._derived:
+                    return fact
+            blocker = self.kb.add(expr, conflicts)
+            self.sync()
+            return blocker
+
+    def append(self, expr):
+        self.add(expr)
+
+    def derived(self, fact) -> bool:
+        return str(fact) in self._derived
+
+    def query(self, pattern, limit=None):
+        """
+        Bindings for a pattern with variables, stored and derived facts alike.
+
+        :param pattern: "Symptom(?x,Cold)" or a (predicate, terms) tuple
+        :param limit:   stop after this many distinct answers
+        :return: list of {"?variable": value} dicts ({} for a ground fact that holds)
+        """
+        predicate, terms = parse_pattern(pattern) if isinstance(pattern, str) else pattern
+        terms = normalise_terms(terms)
+        probe = tuple(None if t[0] == "?" else t for t in terms)
+        answers, seen = [], set()
+        with self._lock:
+            self.sync()
+            for args in self._candidates(predicate, probe):
+                binding = _unify(terms, args, {})
+                if binding is None:
+                    continue
+                key = tuple(sorted(binding.items()))
+                if key not in seen:
+                    seen.add(key)
+                    answers.append(binding)
+                    if limit is not None and len(answers) >= limit:
+                        break
+        return answers
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rules": len(self.rules), "derived": len(self._derived)}
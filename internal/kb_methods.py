@@ -1,19 +1,19 @@
 import os
 from nltk.sem import Expression
+from internal.kb_store import KnowledgeBase
+from internal.kb_inference import InferenceEngine, load_rules, parse_pattern
 
 # Абсолютный путь: <папка-модуля>/storage/kb_file.kb
 BASE_DIR = os.path.dirname(__file__)           # internal/
 KB_FILE  = os.path.join(BASE_DIR, "storage", "kb_file.kb")
+MAX_QUERY_ANSWERS = 20
 
 
 # Function to load the KB from the file
 def load_kb():
-    try:
-        with open(KB_FILE, "r") as file:
-            return [Expression.fromstring(line.strip()) for line in file if line.strip()]
-    except FileNotFoundError:
-        # If the file doesn't exist, return an empty KB
-        return []
+    # Индексированное хранилище: факты дописываются в журнал, а не перезаписывают файл.
+    # Поверх него — прямой вывод по правилам из kb_rules.kb
+    return InferenceEngine(KnowledgeBase(KB_FILE), load_rules())
     
 def ensure_storage_path():
     """Создаёт папку и файл хранения KB, если их нет"""
@@ -34,6 +34,7 @@ def preprocess_query(query):
     - "sneezing is a symptom of cold" -> "Symptom(Sneezing, Cold)"
     - "X is good" -> "Good(X)"
     - "X is bad" -> "Bad(X)"
+    - "flu is a type of infection" -> "Subtype(Flu, Infection)"
     """
     query = query.strip().lower()  # Standardize to lowercase for parsing
 
@@ -56,7 +57,14 @@ def preprocess_query(query):
             subject, predicate = parts
             return f"Symptom({subject.capitalize().strip()}, {predicate.capitalize().strip()})"
 
-    # 4) Handle generic " is " pattern
+    # 4) Handle "is a type of" pattern
+    if " is a type of " in query:
+        parts = query.split(" is a type of ")
+        if len(parts) == 2:
+            subject, parent = parts
+            return f"Subtype({subject.capitalize().strip()}, {parent.capitalize().strip()})"
+
+    # 5) Handle generic " is " pattern
     if " is " in query:
         parts = query.split(" is ")
         if len(parts) == 2:
@@ -86,14 +94,12 @@ def add_fact(kb_expressions, fact):
             good_expr = Expression.fromstring(f"Good({subject})")
             bad_expr = Expression.fromstring(f"Bad({subject})")
 
-            if good_expr in kb_expressions:
+            # Check and append happen atomically across workers
+            blocker = kb_expressions.add(good_expr, conflicts=[bad_expr])
+            if blocker == good_expr:
                 return f"I already know that {subject} is good."
-            if bad_expr in kb_expressions:
+            if blocker == bad_expr:
                 return f"I know that {subject} is bad, so I won't remember it as good."
-            
-            # Otherwise add the new fact
-            kb_expressions.append(good_expr)
-            save_kb(kb_expressions)
             return f"OK, I will remember that {subject} is good."
 
         # If the new fact is Bad(X), check for conflicts or redundancy
@@ -103,22 +109,17 @@ def add_fact(kb_expressions, fact):
             good_expr = Expression.fromstring(f"Good({subject})")
             bad_expr = Expression.fromstring(f"Bad({subject})")
 
-            if bad_expr in kb_expressions:
+            blocker = kb_expressions.add(bad_expr, conflicts=[good_expr])
+            if blocker == bad_expr:
                 return f"I already know that {subject} is bad."
-            if good_expr in kb_expressions:
+            if blocker == good_expr:
                 return f"I know that {subject} is good, so I won't remember it as bad."
-
-            # Otherwise add the new fact
-            kb_expressions.append(bad_expr)
-            save_kb(kb_expressions)
             return f"OK, I will remember that {subject} is bad."
 
         # For all other facts (e.g., Symptom(...))
-        if new_fact in kb_expressions:
+        if kb_expressions.add(new_fact) is not None:
             return f"I already know that {processed_fact}."
         else:
-            kb_expressions.append(new_fact)
-            save_kb(kb_expressions)
             return f"OK, I will remember that {processed_fact}."
 
     except Exception as e:
@@ -143,3 +144,30 @@ def check_fact(kb_expressions, query):
     except Exception:
         # Handle evaluation errors gracefully
         return "I don't know"
+
+def query_kb(kb_expressions, pattern):
+    """
+    Answers a pattern query with variables, e.g. "Symptom($x, Cold)" or
+    "Symptom(?x, Cold)", from stored and derived facts. Only terms marked
+    with $ (chat-safe: AIML splits sentences at "?") or ? are variables;
+    anything else, even a single letter, is a constant.
+    """
+    try:
+        predicate, terms = parse_pattern(pattern)
+    except ValueError:
+        return "I can only answer queries like Symptom($x, Cold)."
+
+    # Constants are stored capitalised, whatever the user typed
+    predicate = predicate[:1].upper() + predicate[1:]
+    terms = tuple("?" + t[1:] if t[0] in "?$" else t[:1].upper() + t[1:] for t in terms)
+    answers = kb_expressions.query((predicate, terms), limit=MAX_QUERY_ANSWERS + 1)
+    if not answers:
+        return "I don't know any."
+
+    variables = list(dict.fromkeys(t for t in terms if t[0] == "?"))
+    if not variables:
+        return "Correct"
+    found = sorted(", ".join(f"{v.lstrip('?')} = {a[v]}" for v in variables) if len(variables) > 1
+                   else a[variables[0]] for a in answers[:MAX_QUERY_ANSWERS])
+    more = " and more" if len(answers) > MAX_QUERY_ANSWERS else ""
+    return "; ".join(found) + more + "."
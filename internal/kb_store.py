@@ -0,0 +1,320 @@
+"""
+kb_store.py
+
+Indexed, append-only store for the FOL knowledge base:
+  - facts are kept by their canonical string form (str(Expression)), so
+    membership is a set lookup instead of a scan with structural equality
+  - atomic facts such as Good(X) or Symptom(X,Y) are also indexed by
+    predicate and by (predicate, position, argument) for pattern queries
+  - new facts are appended to a journal (<kb_file>.journal); the base file is
+    only rewritten by compaction, once the journal outgrows it
+  - writers in different processes serialise on an fcntl lock file and pick
+    up each other's facts by re-reading the journal tail
+  - a base file replaced under us (compaction elsewhere, a hand edit) is
+    merged in place, new facts only, so readers never rebuild the indexes;
+    facts deleted by hand need a fresh store (core's reloader watches the file;
+    compaction records the file it wrote in <kb_file>.compacted, so its own
+    rewrites do not count as edits)
+
+The base file keeps the original one-fact-per-line format of kb_file.kb.
+"""
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+from nltk.sem import Expression
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+COMPACT_MIN_JOURNAL = 1000   # never compact for fewer journal entries than this
+
+_ATOM = re.compile(r"^(\w+)\(([^()]*)\)$")
+
+
+def parse_atom(fact: str):
+    """Symptom(Cough,Flu) -> ("Symptom", ("Cough", "Flu")); None for non-atomic facts."""
+    m = _ATOM.match(fact)
+    if m is None:
+        return None
+    return m.group(1), tuple(m.group(2).split(",")) if m.group(2) else ()
+
+
+def canonical(line: str) -> str:
+    """
+    A hand-written fact in the str(Expression) form membership is checked
+    with, e.g. "Symptom(Cough,  Flu)" -> "Symptom(Cough,Flu)".
+    """
+    fact = line.strip()
+    if not fact or (_ATOM.match(fact) and len(fact.split()) == 1):
+        return fact  # already canonical (journal lines, compacted files)
+    try:
+        return str(Expression.fromstring(fact))
+    except Exception:
+        return fact
+
+
+class KnowledgeBase:
+    def __init__(self, path, compact_min=COMPACT_MIN_JOURNAL):
+        """
+        :param path:        base KB file (one fact per line)
+        :param compact_min: smallest journal that may trigger compaction
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.lock_path = path + ".lock"
+        self.compacted_path = path + ".compacted"   # identity of the base file compaction wrote
+        self.compact_min = compact_min
+        self._lock = threading.RLock()
+        self.generation = 0
+        self.edited = False       # the base file changed other than by compaction since it was loaded
+        self._reset()
+        with self._lock, self._file_lock(shared=True):
+            self._load()
+
+    def _reset(self):
+        self.generation += 1      # bumped whenever the fact list is rebuilt from disk
+        self._log = []            # facts in the order they were indexed
+        self._facts = {}          # canonical string -> parsed Expression (or None until needed)
+        self._by_predicate = {}   # predicate -> set of facts
+        self._by_argument = {}    # (predicate, position, argument) -> set of facts
+        self._base_id = None
+        self._journal_id = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    # ---- locking / change detection -------------------------------------
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _file_id(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        """Pick up facts written by other processes since the last look."""
+        base_id = self._file_id(self.path)
+        journal_id = self._file_id(self.journal_path)
+        if base_id == self._base_id and journal_id == self._journal_id:
+            return
+        with self._file_lock(shared=True):
+            self._sync()
+
+    def _sync(self):
+        """Caller holds the file lock."""
+        journal_id = self._file_id(self.journal_path)
+        if self._file_id(self.path) != self._base_id or (
+            journal_id is not None and self._journal_id is not None
+            and (journal_id[0] != self._journal_id[0] or journal_id[2] < self._journal_offset)
+        ):
+            # Compacted (or replaced) under us: merge in what is new
+            self._journal_offset = self._journal_entries = 0
+            self._load(merge=True)
+        else:
+            self._read_journal()
+
+    # ---- loading ----------------------------------------------------------
+
+    def _load(self, merge=False):
+        """:param merge: re-reading a base file replaced under us (compaction or an edit)"""
+        self._base_id = self._file_id(self.path)
+        if merge and self._base_id != self._compacted_id():
+            self.edited = True
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    self._index(canonical(line))
+        except FileNotFoundError:
+            pass
+        self._read_journal()
+
+    def _compacted_id(self):
+        """Identity of the base file the last compaction wrote (any process), or None."""
+        try:
+            with open(self.compacted_path) as f:
+                return tuple(int(field) for field in f.read().split())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._journal_id = None
+            self._journal_offset = self._journal_entries = 0
+            return
+        # A writer may be mid-line; only consume complete lines
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8").splitlines():
+            if self._index(line.strip()):
+                self._journal_entries += 1
+        self._journal_offset += end
+        self._journal_id = self._file_id(self.journal_path)
+
+    def _index(self, fact: str) -> bool:
+        if not fact or fact in self._facts:
+            return False
+        self._facts[fact] = None
+        self._log.append(fact)
+        atom = parse_atom(fact)
+        if atom is not None:
+            predicate, args = atom
+            self._by_predicate.setdefault(predicate, set()).add(fact)
+            for position, arg in enumerate(args):
+                self._by_argument.setdefault((predicate, position, arg), set()).add(fact)
+        return True
+
+    # ---- public API -------------------------------------------------------
+
+    def __contains__(self, expr) -> bool:
+        with self._lock:
+            self._refresh()
+            return str(expr) in self._facts
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._facts)
+
+    def __iter__(self):
+        """Parsed Expressions, in insertion order."""
+        with self._lock:
+            self._refresh()
+            facts = list(self._facts)
+        for fact in facts:
+            yield self.expression(fact)
+
+    def reflects_files(self) -> bool:
+        """
+        True while the base file was only ever rewritten by compaction (ours
+        or another process's) since it was loaded, so every fact on disk is
+        held here. False once it was edited: only a fresh store drops
+        deleted facts.
+        """
+        with self._lock:
+            self._refresh()
+            return not self.edited
+
+    def known(self, fact: str) -> bool:
+        """Membership of a canonical fact string, without re-reading the journal."""
+        return fact in self._facts
+
+    def expression(self, fact: str):
+        expr = self._facts.get(fact)
+        if expr is None:
+            expr = self._facts[fact] = Expression.fromstring(fact)
+        return expr
+
+    def add(self, expr, conflicts=()):
+        """
+        Append `expr` unless it, or one of `conflicts`, is already known.
+        The check and the write happen under the cross-process lock.
+
+        :return: None when added, otherwise the fact that blocked it
+        """
+        fact = str(expr)
+        with self._lock, self._file_lock():
+            self._sync()
+            for blocker in (fact, *map(str, conflicts)):
+                if blocker in self._facts:
+                    return self.expression(blocker)
+            with open(self.journal_path, "a") as f:
+                f.write(fact + "\n")
+            # Our own line is picked up like anyone else's, keeping the offset exact
+            self._read_journal()
+            self._facts[fact] = expr
+            if self._journal_entries >= max(self.compact_min, len(self._facts) - self._journal_entries):
+                self._compact()
+        return None
+
+    def append(self, expr):
+        """list-style alias of add() for callers that treated the KB as a list."""
+        self.add(expr)
+
+    def facts(self, predicate, *args):
+        """
+        Canonical strings of atomic facts matching a pattern; None in `args`
+        is a wildcard:  kb.facts("Symptom", None, "Flu")
+        """
+        with self._lock:
+            self._refresh()
+            matches = self.lookup(predicate, args)
+            if args:
+                matches = [f for f in matches if len(parse_atom(f)[1]) == len(args)]
+            return sorted(matches)
+
+    def lookup(self, predicate, args=()):
+        """
+        Index probe behind facts(): the set of facts for `predicate` whose
+        bound (non-None) arguments match. Does not re-read the journal or
+        check arity; for callers that already synced via changes().
+        """
+        bound = [(i, a) for i, a in enumerate(args) if a is not None]
+        if not bound:
+            return self._by_predicate.get(predicate, set())
+        sets = [self._by_argument.get((predicate, i, a), set()) for i, a in bound]
+        return set.intersection(*sorted(sets, key=len)) if len(sets) > 1 else sets[0]
+
+    def changes(self, generation, position):
+        """
+        Facts indexed since a caller last looked, for incremental consumers.
+
+        :return: (generation, position, new facts); when the store was rebuilt
+                 (generation differs) the new facts are all facts
+        """
+        with self._lock:
+            self._refresh()
+            if generation != self.generation:
+                position = 0
+            return self.generation, len(self._log), self._log[position:]
+
+    def compact(self):
+        with self._lock, self._file_lock():
+            self._sync()
+            self._compact()
+
+    def _compact(self):
+        """Fold the journal into the base file. Caller holds both locks."""
+        tmp = self.path + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            for fact in self._facts:
+                f.write(fact + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        open(self.journal_path, "w").close()
+        self._base_id = self._file_id(self.path)
+        # Lets every process tell this rewrite from an edit of the file
+        with open(tmp, "w") as f:
+            f.write(" ".join(map(str, self._base_id)))
+        os.replace(tmp, self.compacted_path)
+        self._journal_id = self._file_id(self.journal_path)
+        self._journal_offset = self._journal_entries = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "facts": len(self._facts),
+                "journal_entries": self._journal_entries,
+                "predicates": {p: len(f) for p, f in self._by_predicate.items()},
+            }
@@ -0,0 +1,150 @@
+"""
+metrics.py
+
+Lightweight tracing/metrics for the query and imaging paths:
+  - stage("name") timers feeding per-stage latency histograms
+  - labelled counters (e.g. AIML command ids)
+  - gauges read at scrape time (cache hit ratios, model queue depth)
+  - Prometheus text exposition for /metrics
+  - optional per-request timing breakdown (Server-Timing header)
+
+Disabled unless HEALTHBOT_METRICS=1; when disabled stage() returns a shared
+no-op context manager and counters return immediately.
+"""
+
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("HEALTHBOT_METRICS", "0") == "1"
+PREFIX = "healthbot_"
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}   # stage -> [bucket counts..., +Inf count, sum]
+_counters = {}     # (name, labels) -> value
+_gauges = {}       # (name, labels) -> callable returning a number
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+_NOOP = contextlib.nullcontext()
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def observe(stage: str, seconds: float):
+    """Record one duration for `stage` (histogram + current request breakdown)."""
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        else:
+            hist[len(BUCKETS)] += 1
+        hist[-1] += seconds
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name: str):
+    """with stage("tfidf_score"): ...  -- times the block when metrics are enabled."""
+    return _Stage(name) if ENABLED else _NOOP
+
+
+def inc(name: str, value=1, **labels):
+    if not ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def register_gauge(name: str, fn, **labels):
+    """fn() is called on every scrape; use it for values owned by other objects."""
+    _gauges[(name, _labels(labels))] = fn
+
+
+def begin_request():
+    """Start collecting a per-request stage breakdown; returns a token for end_request()."""
+    if not ENABLED:
+        return None
+    return _request_timings.set({})
+
+
+def end_request(token) -> dict:
+    """Stop collecting and return {stage: seconds} for the request."""
+    if token is None:
+        return {}
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings: dict) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+
+    name = PREFIX + "stage_seconds"
+    lines.append(f"# TYPE {name} histogram")
+    for stage_name, hist in sorted(histograms.items()):
+        labels = (("stage", stage_name),)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, hist):
+            cumulative += count
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {cumulative}")
+        cumulative += hist[len(BUCKETS)]
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {cumulative}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {hist[-1]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+
+    typed = set()
+    for (counter, labels), value in sorted(counters.items()):
+        if counter not in typed:
+            lines.append(f"# TYPE {PREFIX}{counter} counter")
+            typed.add(counter)
+        lines.append(f"{PREFIX}{counter}{_fmt_labels(labels)} {value}")
+
+    for (gauge, labels), fn in sorted(_gauges.items(), key=lambda item: item[0]):
+        try:
+            value = float(fn())
+        except Exception:
+            continue
+        if gauge not in typed:
+            lines.append(f"# TYPE {PREFIX}{gauge} gauge")
+            typed.add(gauge)
+        lines.append(f"{PREFIX}{gauge}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
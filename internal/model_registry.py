@@ -0,0 +1,83 @@
+"""
+model_registry.py
+
+Lazy model registry: models are registered with a loader and only built on
+first use (or on an explicit warm-up), each behind its own lock so one slow
+load does not block the others.
+"""
+
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class _Entry:
+    def __init__(self, loader):
+        self.loader = loader
+        self.model = None
+        self.state = NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name, loader):
+        """
+        :param loader: zero-argument callable returning the ready-to-use model
+        """
+        self._entries[name] = _Entry(loader)
+
+    def get(self, name):
+        """Return the model, loading it on first call. Load errors are re-raised on every call."""
+        entry = self._entries[name]
+        if entry.state == READY:
+            return entry.model
+        with entry.lock:
+            if entry.state != READY:
+                entry.state = LOADING
+                start = time.perf_counter()
+                try:
+                    entry.model = entry.loader()
+                except Exception as e:
+                    entry.state = FAILED
+                    entry.error = str(e)
+                    log.exception("Failed to load model %s", name)
+                    raise
+                entry.load_seconds = time.perf_counter() - start
+                entry.error = None
+                entry.state = READY
+                log.info("Loaded model %s in %.2f s", name, entry.load_seconds)
+        return entry.model
+
+    def warm_up(self, names=None):
+        """Load the given (default: all) models now; failures are reported in status()."""
+        for name in names or list(self._entries):
+            try:
+                self.get(name)
+            except Exception:
+                pass
+        return self.status()
+
+    def is_ready(self, name) -> bool:
+        return self._entries[name].state == READY
+
+    def status(self) -> dict:
+        return {
+            name: {"state": entry.state, "load_seconds": entry.load_seconds, "error": entry.error}
+            for name, entry in self._entries.items()
+        }
+
+
+# Shared by every model module of this process
+registry = ModelRegistry()
@@ -0,0 +1,231 @@
+"""
+prediction_cache.py
+
+Content-addressed cache of /brain/segment results:
+  - the key is a hash of the uploaded bytes, the model weight files and the
+    preprocessing/backend settings, so new weights or settings never serve
+    old results
+  - an entry holds the predicted class, the class probabilities and the
+    PNG-encoded mask
+  - memory tier: LRU bounded by total entry size; optional disk tier (one
+    file per key) bounded by total size, oldest files pruned first
+  - identical uploads that arrive while the first is still being computed
+    (frontend retries) wait for that result instead of running the models
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from internal.cache import BlobCache
+import internal.metrics as metrics
+
+log = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+
+
+def file_digest(path) -> str:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return "missing"
+    return digest.hexdigest()
+
+
+def encode_entry(entry: dict) -> bytes:
+    meta = {"prediction": entry["prediction"], "probabilities": entry["probabilities"]}
+    return json.dumps(meta).encode("utf-8") + b"\0" + entry["mask_png"]
+
+
+def decode_entry(blob: bytes) -> dict:
+    meta, _, mask_png = blob.partition(b"\0")
+    entry = json.loads(meta)
+    entry["mask_png"] = mask_png
+    return entry
+
+
+class PredictionCache:
+    def __init__(self, weight_files=(), settings=None, max_bytes=128 * 1024 * 1024,
+                 disk_dir=None, disk_max_bytes=1024 * 1024 * 1024, enabled=True):
+        """
+        :param weight_files: model weight files whose contents are part of every key
+        :param settings:     JSON-serialisable preprocessing/backend settings, part of every key
+        :param max_bytes:    memory tier size
+        :param disk_dir:     directory of the optional disk tier (None = memory only)
+        """
+        self.enabled = enabled
+        self.weight_files = list(weight_files)
+        self.settings = settings or {}
+        self.memory = BlobCache(max_bytes)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._inflight = {}          # key -> Event set when the first request finished
+        self._fingerprint = None
+        self._weight_ids = None
+        self._disk_writes = 0
+        self.memory_hits = self.disk_hits = self.shared_hits = self.misses = 0
+
+    # ---- keys -----------------------------------------------------------
+
+    def fingerprint(self) -> str:
+        """Hash of the weights and settings; weights are re-hashed only when their files change."""
+        ids = []
+        for path in self.weight_files:
+            try:
+                st = os.stat(path)
+                ids.append((path, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                ids.append((path, None, None))
+        if ids != self._weight_ids:
+            digest = hashlib.sha256(f"v{CACHE_FORMAT_VERSION}".encode())
+            digest.update(json.dumps(self.settings, sort_keys=True).encode())
+            for path in self.weight_files:
+                digest.update(file_digest(path).encode())
+            self._fingerprint, self._weight_ids = digest.hexdigest(), ids
+        return self._fingerprint
+
+    def key(self, data, *options) -> str:
+        """:param options: per-request settings that change the result (e.g. the segmentation mode)"""
+        digest = hashlib.sha256(self.fingerprint().encode())
+        for option in options:
+            digest.update(f"|{option}".encode())
+        digest.update(memoryview(data))
+        return digest.hexdigest()[:40]
+
+    # ---- tiers ----------------------------------------------------------
+
+    def _count(self, field, result):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+        metrics.inc("prediction_cache_total", result=result)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.bin")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _disk_put(self, key, blob):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning("Could not write prediction cache entry %s: %s", key, e)
+            return
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % 100 == 0
+        if prune:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Delete the least recently written files until the disk tier fits disk_max_bytes."""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith(".bin"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        blob = self.memory.get(key)
+        if blob is not None:
+            self._count("memory_hits", "memory_hit")
+            return decode_entry(blob)
+        blob = self._disk_get(key)
+        if blob is not None:
+            self.memory.put(key, blob)
+            self._count("disk_hits", "disk_hit")
+            return decode_entry(blob)
+        return None
+
+    def put(self, key, entry):
+        if not self.enabled:
+            return
+        blob = encode_entry(entry)
+        self.memory.put(key, blob)
+        if self.disk_dir:
+            self._disk_put(key, blob)
+
+    def get_or_compute(self, key, compute):
+        """
+        Cached entry for `key`, else compute() (a dict with prediction,
+        probabilities and mask_png) stored under it. Concurrent calls for
+        the same key run compute() once.
+        :return: (entry, hit)
+        """
+        if not self.enabled:
+            return compute(), False
+        while True:
+            entry = self.get(key)
+            if entry is not None:
+                return entry, True
+            with self._lock:
+                done = self._inflight.get(key)
+                if done is None:
+                    done = self._inflight[key] = threading.Event()
+                    break
+            # Same upload already being computed: wait for it, then read the cache
+            done.wait()
+            entry = self.get(key)
+            if entry is not None:
+                self._count("shared_hits", "shared_hit")
+                return entry, True
+            # The first attempt failed; try ourselves
+        try:
+            self._count("misses", "miss")
+            entry = compute()
+            self.put(key, entry)
+            return entry, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory": self.memory.stats(),
+            "disk_dir": self.disk_dir,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "shared_hits": self.shared_hits,    # hits that waited for an in-flight request
+            "misses": self.misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "in_flight": len(self._inflight),
+        }
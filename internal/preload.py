@@ -0,0 +1,115 @@
+"""
+preload.py
+
+Pre-fork serving (gunicorn.conf.py): everything large is loaded once in the
+master and inherited copy-on-write by the workers forked from it:
+  - the chat knowledge (TF-IDF index, AIML brain, KB) through core.init_once
+  - the models in PRELOAD_MODELS; the UNet's tensors are moved to shared
+    memory, so they stay shared whatever touches them
+  - gc.freeze() last, so collections in the workers do not write to (and
+    thereby copy) the pages holding the preloaded objects
+TensorFlow and ONNX Runtime start thread pools while a model loads, and
+those do not survive fork(): such models are loaded by each worker right
+after the fork, in the background. The master builds PyTorch models on one
+thread for the same reason; workers get their SEG_THREADS back after the fork.
+memory_usage() reports a process's unique (USS) and shared memory.
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+
+from internal.model_registry import registry, READY
+
+log = logging.getLogger(__name__)
+
+# Comma-separated; default: the models that are safe to load before fork()
+PRELOAD_MODELS = os.environ.get("PRELOAD_MODELS")
+
+# Set in the master by preload(); inherited by the workers
+preloaded = False
+shared_tensor_bytes = 0
+_in_master = False
+
+
+def in_master() -> bool:
+    """True while preload() builds models in the pre-fork master."""
+    return _in_master
+
+
+def default_models(imaging) -> list:
+    if not imaging:
+        return []
+    from internal.brain_tumor_mask import SEG_BACKEND
+    return [] if SEG_BACKEND.startswith("onnx") else ["tumor_segmenter"]
+
+
+def preload(chat=True, imaging=True) -> dict:
+    """
+    Load the shared state in the master, before the workers are forked.
+    :return: what was loaded, with timings
+    """
+    global preloaded, shared_tensor_bytes, _in_master
+    names = PRELOAD_MODELS.split(",") if PRELOAD_MODELS is not None else default_models(imaging)
+    names = [name.strip() for name in names if name.strip()]
+    report = {"chat": chat, "models": names}
+    _in_master = True
+    try:
+        if chat:
+            import core
+            start = time.perf_counter()
+            core.init_once()
+            report["chat_seconds"] = time.perf_counter() - start
+        if names:
+            report["model_status"] = registry.warm_up(names)
+        if registry.status().get("tumor_segmenter", {}).get("state") == READY:
+            from internal.seg_backends import share_memory
+            shared_tensor_bytes = share_memory(registry.get("tumor_segmenter"))
+            report["shared_tensor_bytes"] = shared_tensor_bytes
+    finally:
+        _in_master = False
+    gc.collect()
+    gc.freeze()
+    preloaded = True
+    log.info("Preloaded before fork: %s", report)
+    return report
+
+
+def after_fork():
+    """In each worker: restore the PyTorch threads and load what the master could not, in the background."""
+    status = registry.status()
+    if status.get("tumor_segmenter", {}).get("state") == READY:
+        import torch
+        from internal.brain_tumor_mask import SEG_THREADS
+        torch.set_num_threads(SEG_THREADS)
+    pending = [name for name, entry in status.items() if entry["state"] != READY]
+    if pending:
+        threading.Thread(target=registry.warm_up, args=(pending,), name="model-warmup", daemon=True).start()
+
+
+def memory_usage(pid="self") -> dict:
+    """
+    Memory of one process in bytes, from /proc/<pid>/smaps_rollup:
+    uss (pages only this process maps), shared (pages also mapped by others,
+    e.g. inherited from the master), pss (shared pages divided among their
+    users) and rss.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        with open(f"/proc/{pid}/smaps") as f:
+            lines = f.readlines()
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[2] == "kB":
+            fields[parts[0].rstrip(":")] = fields.get(parts[0].rstrip(":"), 0) + int(parts[1]) * 1024
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
@@ -0,0 +1,259 @@
+"""
+reloader.py
+
+Hot reload of the chat knowledge sources (Q&A CSV, AIML, KB rules) without
+restarting workers:
+  - everything a request reads lives in one KnowledgeState snapshot; a
+    request takes the current snapshot once and uses it to the end, so
+    in-flight requests finish on the version they started with
+  - a reload rebuilds only the requested parts in a background thread and
+    swaps the new snapshot in with a single assignment; requests never wait
+    for a rebuild
+  - changes are found by polling file signatures every
+    KNOWLEDGE_RELOAD_INTERVAL seconds (0 = off), or requested with reload()
+    (POST /admin/reload)
+  - each part has a version counter, bumped whenever a swap replaced it,
+    and the snapshot has a digest of the source contents for cache keys
+A part that fails to build keeps its previous version; the error is kept in
+stats() and the file is retried once it changes again. A forked child
+(pre-fork serving) keeps the parent's snapshot and restarts polling itself.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import weakref
+
+import internal.metrics as metrics
+
+log = logging.getLogger(__name__)
+
+RELOAD_INTERVAL = float(os.environ.get("KNOWLEDGE_RELOAD_INTERVAL", 0))
+
+_reloaders = weakref.WeakSet()
+
+
+def file_signature(paths) -> tuple:
+    """(path, mtime_ns, size) per file, None for missing files."""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            signature.append((path, None))
+            continue
+        signature.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(signature)
+
+
+def content_digest(paths) -> str:
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(path.encode())
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        except FileNotFoundError:
+            digest.update(b"\0missing")
+    return digest.hexdigest()
+
+
+class Source:
+    __slots__ = ("name", "paths", "build", "current")
+
+    def __init__(self, name, paths, build, current=None):
+        """
+        :param name:    part name ("qna", "aiml", "kb")
+        :param paths:   files the part is built from
+        :param build:   callable(previous part or None) -> new part
+        :param current: optional callable(part, changed paths) -> True when the part
+                        already reflects those files (e.g. the KB store wrote them
+                        itself), so no rebuild is needed
+        """
+        self.name = name
+        self.paths = list(paths)
+        self.build = build
+        self.current = current
+
+
+class KnowledgeState:
+    """One consistent set of parts; never modified after it is swapped in."""
+    __slots__ = ("parts", "versions", "signatures", "digests", "digest")
+
+    def __init__(self, parts, versions, signatures, digests):
+        self.parts = parts
+        self.versions = versions
+        self.signatures = signatures
+        self.digests = digests
+        self.digest = hashlib.sha1("|".join(digests[name] for name in sorted(digests)).encode()).hexdigest()[:16]
+
+    def __getitem__(self, name):
+        return self.parts[name]
+
+
+class Reloader:
+    def __init__(self, sources, interval=RELOAD_INTERVAL):
+        """
+        :param sources:  Source per reloadable part
+        :param interval: seconds between file polls (0 = only explicit reloads)
+        """
+        self.sources = {source.name: source for source in sources}
+        self.interval = float(interval)
+        self.state = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._worker = None
+        self._poller = None
+        self._listeners = []
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_duration = None
+        _reloaders.add(self)
+
+    def _after_fork(self):
+        # Threads do not survive fork(); a rebuild the parent had running is not finished here
+        polling = self._poller is not None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._worker = self._poller = None
+        if polling:
+            self.start_polling()
+
+    def load(self) -> KnowledgeState:
+        """Build every part in the calling thread (startup)."""
+        parts, versions, signatures, digests = {}, {}, {}, {}
+        for name, source in self.sources.items():
+            # Taken before the build: a change made during it is seen by the next poll
+            signatures[name] = file_signature(source.paths)
+            digests[name] = content_digest(source.paths)
+            parts[name] = source.build(None)
+            versions[name] = 1
+        self.state = KnowledgeState(parts, versions, signatures, digests)
+        return self.state
+
+    def on_swap(self, callback):
+        """callback(old_state, new_state), called in the reload thread after each swap."""
+        self._listeners.append(callback)
+
+    def changed(self) -> list:
+        """Parts whose files changed since they were last built."""
+        state = self.state
+        return [name for name, source in self.sources.items()
+                if file_signature(source.paths) != state.signatures[name]]
+
+    def reload(self, names=None, wait=False) -> list:
+        """
+        Rebuild `names` (default: the changed parts) in the background and swap them in.
+        :param wait: block until the rebuild finished (admin calls, tests)
+        :return: the parts scheduled
+        """
+        names = list(self.changed() if names is None else names)
+        unknown = [name for name in names if name not in self.sources]
+        if unknown:
+            raise ValueError(f"Unknown knowledge sources {unknown}, expected some of {sorted(self.sources)}")
+        with self._lock:
+            if names:
+                self._pending.update(names)
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="knowledge-reload", daemon=True)
+                    self._worker.start()
+            worker = self._worker
+        if wait and worker is not None:
+            worker.join()
+        return names
+
+    def _run(self):
+        while True:
+            with self._lock:
+                names = sorted(self._pending)
+                self._pending.clear()
+                if not names:
+                    self._worker = None
+                    return
+            self._rebuild(names)
+
+    def _rebuild(self, names):
+        old = self.state
+        parts, versions = dict(old.parts), dict(old.versions)
+        signatures, digests = dict(old.signatures), dict(old.digests)
+        start = time.perf_counter()
+        rebuilt = False
+        for name in names:
+            source = self.sources[name]
+            signature = file_signature(source.paths)
+            try:
+                changed = [new[0] for new, previous in zip(signature, old.signatures[name]) if new != previous]
+                if source.current is not None and changed and source.current(old.parts[name], changed):
+                    signatures[name] = signature
+                    metrics.inc("knowledge_reloads_total", source=name, result="current")
+                    continue
+                with metrics.stage(f"reload_{name}"):
+                    digest = content_digest(source.paths)
+                    part = source.build(old.parts[name])
+            except Exception as e:
+                log.exception("Reloading %s failed; keeping version %d", name, versions[name])
+                self.failures += 1
+                self.last_error = f"{name}: {e}"
+                metrics.inc("knowledge_reloads_total", source=name, result="error")
+                signatures[name] = signature
+                continue
+            parts[name], signatures[name], digests[name] = part, signature, digest
+            versions[name] += 1
+            rebuilt = True
+            metrics.inc("knowledge_reloads_total", source=name, result="ok")
+        new = KnowledgeState(parts, versions, signatures, digests)
+        # The swap: requests that already hold `old` finish on it
+        self.state = new
+        self.last_duration = time.perf_counter() - start
+        if rebuilt:
+            self.reloads += 1
+            log.info("Knowledge reloaded: %s (versions %s)", ", ".join(names), new.versions)
+            for callback in self._listeners:
+                try:
+                    callback(old, new)
+                except Exception:
+                    log.exception("Knowledge swap listener failed")
+
+    def start_polling(self):
+        if self.interval <= 0 or self._poller is not None:
+            return
+        self._poller = threading.Thread(target=self._poll, name="knowledge-poll", daemon=True)
+        self._poller.start()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reload()
+            except Exception:
+                log.exception("Polling knowledge sources failed")
+
+    def stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            pending, reloading = sorted(self._pending), self._worker is not None
+        return {
+            "versions": dict(state.versions) if state else {},
+            "digest": state.digest if state else None,
+            "sources": {name: source.paths for name, source in self.sources.items()},
+            "reloading": reloading,
+            "pending": pending,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_duration": self.last_duration,
+            "poll_interval": self.interval,
+        }
+
+
+def _restart_after_fork():
+    for reloader in list(_reloaders):
+        reloader._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
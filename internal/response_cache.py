@@ -0,0 +1,156 @@
+"""
+response_cache.py
+
+Cache of final chat answers for the deterministic paths only:
+  - AIML commands #1-#4 (Wikipedia sections), #100 (TF-IDF) and #300 (fuzzy
+    fever), keyed by the command and its normalised argument, so "What is
+    Diabetes?" and "define diabetes" share one entry
+  - the TF-IDF fallback for unmatched input, keyed by the normalised input
+KB commands (#101 adds facts, #102/#103 depend on them) are never cached.
+
+Entries live in a per-process TTL/LRU cache; with RESPONSE_CACHE_URL set to a
+redis:// URL (Redis or any compatible server) workers also share entries
+through it. The shared backend is optional: if the redis package or the
+server is unavailable the local cache keeps working on its own.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+
+from internal.cache import TTLCache
+import internal.metrics as metrics
+
+log = logging.getLogger(__name__)
+
+CACHEABLE_COMMANDS = {1, 2, 3, 4, 100, 300}
+KEY_PREFIX = "healthbot:response:"
+
+_PUNCTUATION = re.compile(r"[^\w\s.]+|(?<!\d)\.|\.(?!\d)")   # keeps decimal points (38.5)
+
+
+def normalise_input(text: str) -> str:
+    """Lower-case, punctuation-free, single-spaced form used in cache keys."""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+def command_key(answer: str):
+    """Cache key for an AIML command answer such as "#1$Diabetes", or None if not cacheable."""
+    cmd, _, param = answer[1:].partition("$")
+    try:
+        cmd = int(cmd)
+    except ValueError:
+        return None
+    if cmd not in CACHEABLE_COMMANDS:
+        return None
+    return f"#{cmd}${normalise_input(param)}"
+
+
+def fallback_key(text: str) -> str:
+    return f"fallback${normalise_input(text)}"
+
+
+class ResponseCache:
+    def __init__(self, maxsize=4096, ttl=3600.0, url=None, enabled=True):
+        """
+        :param maxsize: entries kept in this process
+        :param ttl:     seconds an answer stays valid (local and shared)
+        :param url:     optional redis:// URL of a shared backend
+        """
+        self.enabled = enabled
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, ttl)
+        self.remote = self._connect(url) if (url and enabled) else None
+        self._lock = threading.Lock()
+        self.hits = self.remote_hits = self.misses = self.remote_errors = 0
+
+    @staticmethod
+    def _connect(url):
+        try:
+            import redis
+        except ImportError:
+            log.warning("RESPONSE_CACHE_URL is set but the redis package is not installed; using the local cache only")
+            return None
+        return redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.2)
+
+    @property
+    def shared(self) -> bool:
+        return self.remote is not None
+
+    @staticmethod
+    def _remote_key(key: str) -> str:
+        return KEY_PREFIX + hashlib.sha1(key.encode()).hexdigest()
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key):
+        if not self.enabled or key is None:
+            return None
+        value = self.local.get(key)
+        if value is not None:
+            self._count("hits")
+            metrics.inc("response_cache_total", result="hit")
+            return value
+        if self.remote is not None:
+            try:
+                raw = self.remote.get(self._remote_key(key))
+            except Exception as e:
+                self._count("remote_errors")
+                log.debug("Shared response cache unavailable: %s", e)
+                raw = None
+            if raw is not None:
+                value = raw.decode("utf-8")
+                self.local.set(key, value)
+                self._count("remote_hits")
+                metrics.inc("response_cache_total", result="remote_hit")
+                return value
+        self._count("misses")
+        metrics.inc("response_cache_total", result="miss")
+        return None
+
+    def set(self, key, value):
+        if not self.enabled or key is None or not value:
+            return
+        self.local.set(key, value)
+        if self.remote is not None:
+            try:
+                self.remote.set(self._remote_key(key), value.encode("utf-8"), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                self._count("remote_errors")
+                log.debug("Shared response cache unavailable: %s", e)
+
+    def clear(self):
+        """Drop local entries (shared entries expire by TTL)."""
+        self.local.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.remote_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "shared": self.shared,
+            "size": len(self.local),
+            "maxsize": self.local.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "remote_hits": self.remote_hits,
+            "misses": self.misses,
+            "remote_errors": self.remote_errors,
+            "hit_ratio": (self.hits + self.remote_hits) / total if total else 0.0,
+        }
+
+
+def _cache_from_env():
+    return ResponseCache(
+        maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", 4096)),
+        ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 3600)),
+        url=os.environ.get("RESPONSE_CACHE_URL") or None,
+        enabled=os.environ.get("RESPONSE_CACHE", "1") == "1",
+    )
+
+
+response_cache = _cache_from_env()
+metrics.register_gauge("cache_hit_ratio", lambda: response_cache.stats()["hit_ratio"], cache="responses")
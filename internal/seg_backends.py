@@ -0,0 +1,182 @@
+"""
+seg_backends.py
+
+Selectable CPU inference backends for the UNet segmenter. Every backend is a
+callable taking a float32 batch of shape (N, 1, H, W) and returning raw
+logits of the same shape as a NumPy array:
+
+  - eager        the PyTorch module as trained (float32)
+  - torchscript  traced, frozen and optimised for inference
+  - onnx         exported to ONNX and run with ONNX Runtime
+  - onnx-int8    the ONNX graph with dynamically quantised int8 weights
+  - int8         PyTorch FX static quantisation (x86/fbgemm), calibrated
+
+Exported ONNX graphs are cached on disk, keyed by the weights hash.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import numpy as np
+import torch
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "onnx", "onnx-int8", "int8")
+INPUT_SIZE = 256
+
+
+def weights_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self, model, channels_last=False):
+        self.model = model.eval()
+        self.channels_last = channels_last
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        self.device = next(self.model.parameters()).device
+
+    def _input(self, batch):
+        x = torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32)).to(self.device)
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        return x
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            return self.model(self._input(batch)).float().cpu().numpy()
+
+
+class TorchScriptBackend(EagerBackend):
+    name = "torchscript"
+
+    def __init__(self, model, channels_last=False):
+        super().__init__(model, channels_last)
+        example = self._input(np.zeros((1, 1, INPUT_SIZE, INPUT_SIZE), dtype=np.float32))
+        with torch.inference_mode():
+            traced = torch.jit.trace(self.model, example)
+        self.model = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+
+class Int8Backend(EagerBackend):
+    """Static post-training quantisation; activations are calibrated on `calibration`."""
+    name = "int8"
+
+    def __init__(self, model, calibration, channels_last=False):
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        torch.backends.quantized.engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+        example = (torch.from_numpy(calibration[:1]),)
+        prepared = prepare_fx(model.cpu().eval(),
+                              get_default_qconfig_mapping(torch.backends.quantized.engine), example)
+        with torch.inference_mode():
+            for start in range(0, len(calibration), 4):
+                prepared(torch.from_numpy(calibration[start:start + 4]))
+        self.model = convert_fx(prepared).eval()
+        self.channels_last = channels_last
+        self.device = torch.device("cpu")
+
+
+class OnnxBackend:
+    def __init__(self, model, onnx_path, threads=None, quantize=False):
+        import onnxruntime as ort
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        if not os.path.exists(onnx_path):
+            export_onnx(model, onnx_path)
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            int8_path = onnx_path.replace(".onnx", ".int8.onnx")
+            if not os.path.exists(int8_path):
+                tmp = int8_path + f".{os.getpid()}.tmp"
+                quantize_dynamic(onnx_path, tmp, weight_type=QuantType.QUInt8)
+                os.replace(tmp, int8_path)
+            onnx_path = int8_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+def export_onnx(model, onnx_path):
+    """Export with a dynamic batch axis; written atomically so workers can race."""
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    tmp = onnx_path + f".{os.getpid()}.tmp"
+    example = torch.zeros((1, 1, INPUT_SIZE, INPUT_SIZE))
+    torch.onnx.export(
+        model.cpu().eval(), example, tmp,
+        input_names=["image"], output_names=["logits"],
+        dynamic_axes={"image": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17, dynamo=False,
+    )
+    os.replace(tmp, onnx_path)
+
+
+def share_memory(backend) -> int:
+    """
+    Move the backend's PyTorch parameters and buffers to shared memory, so
+    processes forked afterwards map the same pages. Returns the bytes moved
+    (0 for ONNX Runtime sessions, which are not tensors).
+    """
+    model = getattr(backend, "model", None)
+    if not isinstance(model, torch.nn.Module):
+        return 0
+    model.share_memory()
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def build_backend(model, name="eager", weights_file=None, threads=None, channels_last=False,
+                  calibration=None, cache_dir=None, random_calibration=False):
+    """
+    Wrap the float32 eager UNet in the requested backend.
+
+    :param threads:            intra-op threads for PyTorch / ONNX Runtime (None = library default)
+    :param calibration:        float32 batch (N, 1, 256, 256) used to calibrate the int8 backend
+    :param cache_dir:          where exported ONNX graphs are kept (default: the temp dir)
+    :param random_calibration: calibrate int8 on random inputs when `calibration` is None
+                               (inaccurate ranges; otherwise that is an error)
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown segmentation backend {name!r}, expected one of {BACKENDS}")
+    if threads:
+        torch.set_num_threads(threads)
+        try:
+            # The classifier runs alongside: no extra inter-op pool
+            torch.set_num_interop_threads(1)
+        except (RuntimeError, AttributeError):
+            pass  # already set in this process (it can only be set once), or an older PyTorch
+
+    if name == "eager":
+        return EagerBackend(model, channels_last)
+    if name == "torchscript":
+        return TorchScriptBackend(model, channels_last)
+    if name == "int8":
+        if calibration is None:
+            if not random_calibration:
+                raise ValueError("The int8 backend needs a calibration batch of real scans")
+            log.warning("Calibrating int8 UNet on random inputs; pass real scans for accurate ranges")
+            calibration = np.random.default_rng(0).random((8, 1, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+        return Int8Backend(model, calibration, channels_last)
+
+    tag = weights_digest(weights_file) if weights_file else "unversioned"
+    onnx_path = os.path.join(cache_dir or tempfile.gettempdir(), f"unet-{tag}.onnx")
+    return OnnxBackend(model, onnx_path, threads, quantize=(name == "onnx-int8"))
@@ -0,0 +1,135 @@
+"""
+sessions.py
+
+Session-aware AIML responses:
+  - a pool of AIML kernels, each behind its own lock, so requests pinned to
+    different kernels respond in parallel instead of queueing on one kernel
+  - every session is pinned to one kernel by a stable hash of its id, and its
+    predicates (input/output history, <set> values) live in that kernel
+  - a session table with idle TTL and an LRU cap; evicted sessions are
+    deleted from their kernel, which bounds memory
+  - reloaded() swaps in kernels with a new brain while keeping every
+    session's predicates
+"""
+
+import copy
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# "?x" in a KB query ("QUERY Symptom(?x, Cold)", AIML command #103) is sent
+# as "$x": python-aiml would end the sentence at the "?". Other messages are
+# left alone, "$" separates the parameters of every other command.
+_KB_QUERY = re.compile(r"^\s*query\s", re.IGNORECASE)
+_QUERY_VARIABLE = re.compile(r"\?(?=[A-Za-z_])")
+
+
+def _aiml_input(text: str) -> str:
+    return _QUERY_VARIABLE.sub("$", text) if _KB_QUERY.match(text) else text
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id) -> bool:
+    return isinstance(session_id, str) and _SESSION_ID.match(session_id) is not None
+
+
+class _KernelSlot:
+    __slots__ = ("kernel", "lock")
+
+    def __init__(self, kernel, lock=None):
+        self.kernel = kernel
+        self.lock = lock or threading.Lock()
+
+
+class SessionPool:
+    def __init__(self, kernel_factory, kernels=4, max_sessions=10000, ttl=1800.0):
+        """
+        :param kernel_factory: callable() -> bootstrapped aiml.Kernel
+        :param kernels:        number of kernels (parallel responders)
+        :param max_sessions:   LRU cap on live sessions across all kernels
+        :param ttl:            seconds of inactivity before a session is dropped
+        """
+        self._slots = [_KernelSlot(kernel_factory()) for _ in range(max(1, int(kernels)))]
+        self.max_sessions = max(1, int(max_sessions))
+        self.ttl = float(ttl)
+        self._sessions = OrderedDict()   # session id -> last seen (monotonic), oldest first
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def _slot(self, session_id) -> _KernelSlot:
+        return self._slots[zlib.crc32(session_id.encode()) % len(self._slots)]
+
+    def _touch(self, session_id) -> list:
+        """Mark the session as used; returns the sessions evicted to make room."""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            self._sessions[session_id] = now
+            self._sessions.move_to_end(session_id)
+            while self._sessions:
+                oldest, seen = next(iter(self._sessions.items()))
+                if oldest == session_id or (now - seen <= self.ttl and len(self._sessions) <= self.max_sessions):
+                    break
+                del self._sessions[oldest]
+                evicted.append(oldest)
+            self._evictions += len(evicted)
+        return evicted
+
+    def _drop(self, session_id):
+        slot = self._slot(session_id)
+        with slot.lock:
+            with self._lock:
+                if session_id in self._sessions:
+                    return  # used again since it was evicted
+            # python-aiml has no public way to forget a session
+            slot.kernel._deleteSession(session_id)
+
+    def respond(self, text, session_id) -> str:
+        for old in self._touch(session_id):
+            self._drop(old)
+        slot = self._slot(session_id)
+        with slot.lock:
+            return slot.kernel.respond(_aiml_input(text), session_id)
+
+    def reloaded(self, kernel_factory) -> "SessionPool":
+        """
+        New pool with fresh kernels (e.g. a rebuilt AIML brain) that shares
+        this pool's session table, slot locks and per-session predicates, so
+        users keep their state and requests still in flight on this pool
+        stay serialised with those on the new one.
+        """
+        pool = copy.copy(self)
+        pool._slots = []
+        for slot in self._slots:
+            kernel = kernel_factory()
+            # python-aiml keeps every session's predicates in this dict
+            kernel._sessions = slot.kernel._sessions
+            pool._slots.append(_KernelSlot(kernel, slot.lock))
+        return pool
+
+    def end_session(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        self._drop(session_id)
+
+    def session_data(self, session_id) -> dict:
+        slot = self._slot(session_id)
+        with slot.lock:
+            return slot.kernel.getSessionData(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kernels": len(self._slots),
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "evictions": self._evictions,
+            }
@@ -0,0 +1,95 @@
+"""
+sparse_index.py
+
+Inverted index over L2-normalised TF-IDF rows:
+  - term -> posting list (document ids + weights), stored as a CSC matrix
+  - scoring touches only documents that share a term with the query
+  - top-k selection without densifying the similarity vector
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class InvertedIndex:
+    def __init__(self, doc_matrix):
+        """
+        :param doc_matrix: (n_docs, n_terms) sparse matrix with L2-normalised rows,
+                           e.g. the output of TfidfVectorizer.fit_transform
+        """
+        postings = sp.csc_matrix(doc_matrix)
+        postings.sort_indices()
+        self._init_arrays(postings.indptr, postings.indices, postings.data, postings.shape)
+
+    @classmethod
+    def from_arrays(cls, indptr, doc_ids, weights, shape):
+        """
+        Rebuild an index from posting arrays saved by `arrays()`.
+        The arrays are used as-is, so read-only memory maps stay shared.
+        """
+        index = cls.__new__(cls)
+        index._init_arrays(indptr, doc_ids, weights, tuple(shape))
+        return index
+
+    def arrays(self) -> dict:
+        """Posting arrays (CSC layout) for persisting the index."""
+        return {"indptr": self._indptr, "doc_ids": self._doc_ids, "weights": self._weights}
+
+    def _init_arrays(self, indptr, doc_ids, weights, shape):
+        self.n_docs, self.n_terms = shape
+        self._indptr = indptr
+        self._doc_ids = doc_ids
+        self._weights = weights
+        # Documents are columns of the transposed view: term-major CSR of shape (n_terms, n_docs)
+        self._term_major = sp.csr_matrix(
+            (self._weights, self._doc_ids, self._indptr), shape=(self.n_terms, self.n_docs)
+        )
+
+    @staticmethod
+    def _select(doc_ids, scores, k):
+        """Best k (doc_id, score) pairs, ties broken by the lower doc id like argmax."""
+        if len(scores) > k:
+            part = np.argpartition(-scores, k - 1)[:k]
+            doc_ids, scores = doc_ids[part], scores[part]
+        order = np.lexsort((doc_ids, -scores))
+        return [(int(doc_ids[i]), float(scores[i])) for i in order]
+
+    def top_k(self, query_vec, k=5):
+        """
+        Cosine similarity against every document sharing a term with the query.
+        :param query_vec: (1, n_terms) sparse row, L2-normalised
+        :return: list of (doc_id, score), best first
+        """
+        query = sp.csr_matrix(query_vec)
+        terms, weights = query.indices, query.data
+        if not len(terms) or k <= 0:
+            return []
+
+        starts = self._indptr[terms]
+        ends = self._indptr[terms + 1]
+        if not (ends - starts).any():
+            return []
+        doc_ids = np.concatenate([self._doc_ids[s:e] for s, e in zip(starts, ends)])
+        contrib = np.concatenate([self._weights[s:e] * w for s, e, w in zip(starts, ends, weights)])
+
+        candidates, slot = np.unique(doc_ids, return_inverse=True)
+        scores = np.bincount(slot, weights=contrib)
+        return self._select(candidates, scores, k)
+
+    def batch_top_k(self, query_matrix, k=5):
+        """
+        top_k for every row of query_matrix with one sparse-sparse product;
+        only (query, candidate) pairs with a shared term are materialised.
+        """
+        queries = sp.csr_matrix(query_matrix)
+        if k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        scores = (queries @ self._term_major).tocsr()
+        results = []
+        for row in range(scores.shape[0]):
+            lo, hi = scores.indptr[row], scores.indptr[row + 1]
+            if lo == hi:
+                results.append([])
+                continue
+            results.append(self._select(scores.indices[lo:hi], scores.data[lo:hi], k))
+        return results
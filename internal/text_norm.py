@@ -0,0 +1,90 @@
+"""
+text_norm.py
+
+Text normalisation for TF-IDF (lowercase, strip punctuation, tokenize,
+lemmatize), built for throughput:
+  - the punctuation translation table is compiled once
+  - tokenizer "nltk" is nltk.word_tokenize; "regex" is a whitespace/regex
+    tokenizer that reproduces word_tokenize on punctuation-free text (the
+    MacIntyre contraction splits such as cannot -> can not, and Unicode
+    quotes as separate tokens) at a fraction of the cost
+  - lemmas are memoised in a bounded LRU shared by every caller in the process
+  - normalise_many() handles a whole corpus column in one pass, normalising
+    each distinct text once, optionally across a process pool
+"""
+
+import os
+import re
+import string
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import nltk
+from nltk.stem import WordNetLemmatizer
+
+TOKENIZERS = ("nltk", "regex")
+LEMMA_CACHE_SIZE = int(os.environ.get("TFIDF_LEMMA_CACHE", 100_000))
+
+_PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+_QUOTES = re.compile("([“”‘’«»„])")
+# NLTK's Treebank tokenizer splits these even without apostrophes
+_CONTRACTIONS = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+}
+_lemmatizer = WordNetLemmatizer()
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(token: str) -> str:
+    return _lemmatizer.lemmatize(token)
+
+
+def regex_tokenize(text: str) -> list:
+    tokens = []
+    for word in text.split():
+        if word in _CONTRACTIONS:
+            tokens.extend(_CONTRACTIONS[word])
+        elif word.isascii():
+            tokens.append(word)
+        else:
+            tokens.extend(part for part in _QUOTES.split(word) if part)
+    return tokens
+
+
+def tokenize(text: str, tokenizer="nltk") -> list:
+    if tokenizer == "regex":
+        return regex_tokenize(text)
+    if tokenizer == "nltk":
+        return nltk.word_tokenize(text)
+    raise ValueError(f"Unknown tokenizer {tokenizer!r}, expected one of {TOKENIZERS}")
+
+
+def normalise(text: str, tokenizer="nltk") -> str:
+    text = text.lower().translate(_PUNCTUATION_TABLE)
+    return " ".join(lemmatize(token) for token in tokenize(text, tokenizer)).strip()
+
+
+def _normalise_chunk(args):
+    texts, tokenizer = args
+    return [normalise(text, tokenizer) for text in texts]
+
+
+def normalise_many(texts, tokenizer="nltk", workers=None, chunksize=2000) -> list:
+    """
+    normalise() for a whole column. Each distinct text is normalised once;
+    with workers > 1 the distinct texts are split across a process pool.
+    """
+    texts = [str(text) for text in texts]
+    unique = list(dict.fromkeys(texts))
+    if workers and workers > 1 and len(unique) > chunksize:
+        chunks = [(unique[i:i + chunksize], tokenizer) for i in range(0, len(unique), chunksize)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [text for chunk in pool.map(_normalise_chunk, chunks) for text in chunk]
+    else:
+        results = _normalise_chunk((unique, tokenizer))
+    normalised = dict(zip(unique, results))
+    return [normalised[text] for text in texts]
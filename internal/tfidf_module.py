@@ -2,16 +2,40 @@
 tfidf_module.py
 
 This file encapsulates all TF-IDF related logic, including:
-  - Preprocessing (lowercasing, punctuation removal, lemmatization)
+  - Preprocessing (lowercasing, punctuation removal, lemmatization; see text_norm)
   - Building/fitting the TfidfVectorizer
-  - Computing cosine similarities
+  - Computing cosine similarities (through an inverted index)
+  - A dense LSA/IVF tier blended with the lexical scores (see dense_index)
+  - Saving/loading a memory-mapped index keyed by the CSV hash
 """
 
-import string
+import hashlib
+import json
+import os
+import shutil
+import tempfile
 import nltk
-from nltk.stem import WordNetLemmatizer
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from internal.sparse_index import InvertedIndex
+from internal.dense_index import DenseRetriever, DENSE_DIM, embed
+import internal.metrics as metrics
+import internal.text_norm as text_norm
+
+# Bump when preprocessing or the on-disk layout changes, so old indexes are rebuilt
+INDEX_FORMAT_VERSION = 2
+INDEX_ROOT = os.path.join(os.path.dirname(__file__), "storage", "tfidf_index")
+# "nltk" (word_tokenize) or "regex" (cheaper, same tokens on punctuation-free text)
+TFIDF_TOKENIZER = os.environ.get("TFIDF_TOKENIZER", "nltk")
+TFIDF_PREPROCESS_WORKERS = int(os.environ.get("TFIDF_PREPROCESS_WORKERS", 1))
+# Dense tier: hybrid score = HYBRID_ALPHA * lexical + (1 - HYBRID_ALPHA) * dense
+DENSE_ENABLED = os.environ.get("TFIDF_DENSE", "1") == "1"
+DENSE_QUANTIZE = os.environ.get("TFIDF_DENSE_INT8", "1") == "1"
+DENSE_NPROBE = int(os.environ.get("TFIDF_DENSE_NPROBE", 8))
+HYBRID_ALPHA = float(os.environ.get("TFIDF_HYBRID_ALPHA", 0.5))
+DENSE_THRESHOLD = float(os.environ.get("TFIDF_DENSE_THRESHOLD", 0.6))
 
 # Auto-download necessary NLTK resources (safe to run multiple times)
 try:
@@ -32,18 +56,152 @@ try:
 except LookupError:
     nltk.download("omw-1.4")
 
+
+class _MappedStrings:
+    """Read-only sequence of UTF-8 strings backed by a (memory-mapped) byte blob."""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+
+def csv_fingerprint(csv_path: str, tokenizer: str = TFIDF_TOKENIZER) -> str:
+    """SHA-256 of the Q&A CSV plus the index format version, tokenizer and dense tier settings."""
+    dense = f"dense-{DENSE_DIM}-{'int8' if DENSE_QUANTIZE else 'f32'}" if DENSE_ENABLED else "no-dense"
+    digest = hashlib.sha256(f"tfidf-v{INDEX_FORMAT_VERSION}:{tokenizer}:{dense}:".encode())
+    with open(csv_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 class TfidfManager:
-    def __init__(self, questions, answers):
+    def __init__(self, questions, answers, tokenizer=TFIDF_TOKENIZER, workers=TFIDF_PREPROCESS_WORKERS):
         """
         :param questions: list of question strings
         :param answers:   list of answer strings
+        :param tokenizer: "nltk" or "regex" (see text_norm)
+        :param workers:   processes used to preprocess the questions
         """
-        self.lemmatizer = WordNetLemmatizer()
-        self.questions = [self.preprocess_input(q) for q in questions]
+        self.tokenizer = tokenizer
+        self.questions = text_norm.normalise_many(questions, tokenizer, workers)
         self.answers = answers
 
         self.vectorizer = TfidfVectorizer()
         self.tfidf_matrix = self.vectorizer.fit_transform(self.questions)
+        # Rows are L2-normalised, so cosine similarity is a sparse dot product
+        self.index = InvertedIndex(self.tfidf_matrix)
+        self.dense = (DenseRetriever.build(self.tfidf_matrix, DENSE_DIM, DENSE_QUANTIZE, nprobe=DENSE_NPROBE)
+                      if DENSE_ENABLED else None)
+
+    @classmethod
+    def from_csv(cls, csv_path: str, index_root: str = INDEX_ROOT, tokenizer: str = TFIDF_TOKENIZER) -> "TfidfManager":
+        """
+        Load the index saved for this exact CSV, or fit it and save it once.
+        Workers that find the index on disk skip NLTK preprocessing and refitting.
+        """
+        index_dir = os.path.join(index_root, csv_fingerprint(csv_path, tokenizer)[:32])
+        if os.path.isfile(os.path.join(index_dir, "meta.json")):
+            return cls.load(index_dir)
+
+        qna_df = pd.read_csv(csv_path)
+        manager = cls(qna_df['question'], qna_df['answer'], tokenizer)
+        manager.save(index_dir)
+        return cls.load(index_dir)
+
+    def save(self, index_dir: str):
+        """
+        Write vocabulary, IDF vector, CSR/CSC arrays and answers to index_dir.
+        The directory is written under a temporary name and renamed into place,
+        so concurrent workers never see a half-written index.
+        """
+        parent = os.path.dirname(os.path.abspath(index_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tfidf-", dir=parent)
+        try:
+            matrix = sp.csr_matrix(self.tfidf_matrix)
+            arrays = {
+                "idf": self.vectorizer.idf_,
+                "matrix_data": matrix.data,
+                "matrix_indices": matrix.indices,
+                "matrix_indptr": matrix.indptr,
+            }
+            arrays.update({f"postings_{name}": arr for name, arr in self.index.arrays().items()})
+            if self.dense is not None:
+                arrays.update({f"dense_{name}": arr for name, arr in self.dense.arrays().items()})
+
+            encoded = [str(a).encode("utf-8") for a in self.answers]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(a) for a in encoded], out=offsets[1:])
+            arrays["answers_offsets"] = offsets
+            arrays["answers_blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(arr))
+            with open(os.path.join(tmp_dir, "vocabulary.json"), "w", encoding="utf-8") as f:
+                json.dump({term: int(col) for term, col in self.vectorizer.vocabulary_.items()}, f)
+            # meta.json goes last: its presence marks a complete index
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump({"version": INDEX_FORMAT_VERSION, "shape": list(matrix.shape),
+                           "tokenizer": self.tokenizer, "dense": sorted(self.dense.arrays()) if self.dense else []}, f)
+
+            try:
+                os.rename(tmp_dir, index_dir)
+            except OSError:
+                # Another worker saved the same index first
+                if not os.path.isfile(os.path.join(index_dir, "meta.json")):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "TfidfManager":
+        """
+        Open a saved index with every array memory-mapped read-only, so
+        processes on the same host share one copy through the page cache.
+        """
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["version"] != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported TF-IDF index version {meta['version']} in {index_dir}")
+        with open(os.path.join(index_dir, "vocabulary.json"), encoding="utf-8") as f:
+            vocabulary = json.load(f)
+
+        def mapped(name):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+        manager = cls.__new__(cls)
+        # Queries must be tokenized exactly like the indexed questions
+        manager.tokenizer = meta.get("tokenizer", "nltk")
+        manager.questions = None  # only needed while fitting
+        manager.answers = _MappedStrings(mapped("answers_blob"), mapped("answers_offsets"))
+
+        manager.vectorizer = TfidfVectorizer(vocabulary=vocabulary)
+        manager.vectorizer.idf_ = np.asarray(mapped("idf"))
+        shape = tuple(meta["shape"])
+        manager.tfidf_matrix = sp.csr_matrix(
+            (mapped("matrix_data"), mapped("matrix_indices"), mapped("matrix_indptr")),
+            shape=shape, copy=False,
+        )
+        manager.index = InvertedIndex.from_arrays(
+            mapped("postings_indptr"), mapped("postings_doc_ids"), mapped("postings_weights"), shape
+        )
+        dense_arrays = meta.get("dense") or []
+        manager.dense = (DenseRetriever.from_arrays({name: mapped(f"dense_{name}") for name in dense_arrays},
+                                                    DENSE_NPROBE)
+                         if dense_arrays and DENSE_ENABLED else None)
+        return manager
 
     def preprocess_input(self, text: str) -> str:
         """
@@ -51,24 +209,99 @@ class TfidfManager:
         - lowercase
         - remove punctuation
         - tokenize
-        - lemmatize
+        - lemmatize (memoised)
         - rejoin
         """
-        text = text.lower()
-        text = text.translate(str.maketrans("", "", string.punctuation))
-        tokens = nltk.word_tokenize(text)
-        lemmatized = [self.lemmatizer.lemmatize(token) for token in tokens]
-        return " ".join(lemmatized).strip()
+        return text_norm.normalise(text, self.tokenizer)
+
+    def top_k(self, user_input: str, k=5) -> list:
+        """
+        Return the k most similar questions as (row index, score) pairs, best first.
+        """
+        with metrics.stage("tfidf_preprocess"):
+            cleaned_input = self.preprocess_input(user_input)
+        with metrics.stage("tfidf_score"):
+            user_tfidf = self.vectorizer.transform([cleaned_input])
+            return self.index.top_k(user_tfidf, k)
+
+    def batch_top_k(self, user_inputs, k=5) -> list:
+        """
+        top_k for many inputs at once, scored with a single sparse product.
+        """
+        with metrics.stage("tfidf_preprocess"):
+            cleaned = text_norm.normalise_many(user_inputs, self.tokenizer)
+        if not cleaned:
+            return []
+        with metrics.stage("tfidf_score"):
+            return self.index.batch_top_k(self.vectorizer.transform(cleaned), k)
 
-    def get_most_similar_answer(self, user_input: str, threshold=0.1) -> str:
-        cleaned_input = self.preprocess_input(user_input)
-        user_tfidf = self.vectorizer.transform([cleaned_input])
-        similarities = cosine_similarity(user_tfidf, self.tfidf_matrix).flatten()
+    def hybrid_top_k(self, user_input: str, k=5, candidates=None) -> list:
+        """
+        Lexical and dense candidates, re-ranked by the blended score.
+        :param candidates: taken from each tier (default k); with k = 2 * candidates none is dropped
+        :return: list of (row index, hybrid, lexical, dense), best first
+        """
+        candidates = candidates or k
+        with metrics.stage("tfidf_preprocess"):
+            cleaned_input = self.preprocess_input(user_input)
+        with metrics.stage("tfidf_score"):
+            query = self.vectorizer.transform([cleaned_input])
+            lexical = self.index.top_k(query, candidates)
+        dense_query = self.dense.query_vector(query) if self.dense is not None else None
+        return self._rerank(query, dense_query, lexical, k, candidates)
+
+    def batch_hybrid_top_k(self, user_inputs, k=5, candidates=None) -> list:
+        """
+        hybrid_top_k for many inputs: one preprocessing pass, one sparse
+        product for the lexical tier and one projection for the dense tier.
+        """
+        candidates = candidates or k
+        with metrics.stage("tfidf_preprocess"):
+            cleaned = text_norm.normalise_many(user_inputs, self.tokenizer)
+        if not cleaned:
+            return []
+        with metrics.stage("tfidf_score"):
+            queries = self.vectorizer.transform(cleaned)
+            lexical = self.index.batch_top_k(queries, candidates)
+        dense_queries = embed(queries, self.dense.components) if self.dense is not None else None
+        return [self._rerank(queries[i], dense_queries[i] if dense_queries is not None else None, lexical[i], k,
+                             candidates)
+                for i in range(len(cleaned))]
 
-        best_match_idx = similarities.argmax()
-        best_match_score = similarities[best_match_idx]
+    def _rerank(self, query, dense_query, lexical, k, candidates) -> list:
+        """Blend one query's lexical candidates with its dense top candidates; the best k."""
+        if self.dense is None:
+            return [(doc, score, score, 0.0) for doc, score in lexical[:k]]
+
+        with metrics.stage("dense_score"):
+            dense = self.dense.ivf.search(dense_query, candidates)
+            docs = np.array(sorted({doc for doc, _ in lexical} | {doc for doc, _ in dense}), dtype=np.int64)
+            if not len(docs):
+                return []
+            # Fill in the score each candidate is missing from the other tier
+            lex_scores = np.asarray(self.tfidf_matrix[docs] @ query.T.toarray()).ravel()
+            dense_scores = self.dense.ivf.score_docs(docs, dense_query)
+            hybrid = HYBRID_ALPHA * lex_scores + (1 - HYBRID_ALPHA) * dense_scores
+        order = np.lexsort((docs, -hybrid))[:k]
+        return [(int(docs[i]), float(hybrid[i]), float(lex_scores[i]), float(dense_scores[i])) for i in order]
+
+    def _accept(self, matches, threshold, dense_threshold):
+        # The best-ranked acceptable match: a high blended score that passes
+        # neither test must not hide a lexical hit further down
+        for doc, _, lexical, dense in matches:
+            if lexical > threshold or (self.dense is not None and dense >= dense_threshold):
+                return self.answers[doc]
+        return None
+
+    def get_most_similar_answer(self, user_input: str, threshold=0.1, dense_threshold=DENSE_THRESHOLD) -> str:
+        """
+        Best hybrid match that overlaps lexically (> threshold) or is a close
+        paraphrase in the dense space (>= dense_threshold). Every candidate of
+        both tiers is kept, so the lexical best is always considered.
+        """
+        return self._accept(self.hybrid_top_k(user_input, k=10, candidates=5), threshold, dense_threshold)
 
-        if best_match_score > threshold:
-            return self.answers[best_match_idx]
-        else:
-            return None
+    def get_most_similar_answers(self, user_inputs, threshold=0.1, dense_threshold=DENSE_THRESHOLD) -> list:
+        """get_most_similar_answer for many inputs (None where nothing matches)."""
+        return [self._accept(matches, threshold, dense_threshold)
+                for matches in self.batch_hybrid_top_k(user_inputs, k=10, candidates=5)]
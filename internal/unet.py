@@ -0,0 +1,42 @@
+import torch
+import torch.nn as nn
+
+# Define UNet Model
+class UNet(nn.Module):
+    def __init__(self):
+        super(UNet, self).__init__()
+        def conv_block(in_c, out_c):
+            return nn.Sequential(
+                nn.Conv2d(in_c, out_c, kernel_size=3, padding=1),
+                nn.ReLU(inplace=True),
+                nn.Conv2d(out_c, out_c, kernel_size=3, padding=1),
+                nn.ReLU(inplace=True)
+            )
+
+        self.encoder1 = conv_block(1, 64)
+        self.encoder2 = conv_block(64, 128)
+        self.encoder3 = conv_block(128, 256)
+        self.encoder4 = conv_block(256, 512)
+        self.pool     = nn.MaxPool2d(2, 2)
+        self.bottleneck = conv_block(512, 1024)
+        self.upconv4  = nn.ConvTranspose2d(1024, 512, kernel_size=2, stride=2)
+        self.decoder4 = conv_block(1024, 512)
+        self.upconv3  = nn.ConvTranspose2d(512, 256, kernel_size=2, stride=2)
+        self.decoder3 = conv_block(512, 256)
+        self.upconv2  = nn.ConvTranspose2d(256, 128, kernel_size=2, stride=2)
+        self.decoder2 = conv_block(256, 128)
+        self.upconv1  = nn.ConvTranspose2d(128, 64, kernel_size=2, stride=2)
+        self.decoder1 = conv_block(128, 64)
+        self.final_conv = nn.Conv2d(64, 1, kernel_size=1)
+
+    def forward(self, x):
+        e1 = self.encoder1(x)
+        e2 = self.encoder2(self.pool(e1))
+        e3 = self.encoder3(self.pool(e2))
+        e4 = self.encoder4(self.pool(e3))
+        b  = self.bottleneck(self.pool(e4))
+        d4 = self.decoder4(torch.cat((self.upconv4(b), e4), dim=1))
+        d3 = self.decoder3(torch.cat((self.upconv3(d4), e3), dim=1))
+        d2 = self.decoder2(torch.cat((self.upconv2(d3), e2), dim=1))
+        d1 = self.decoder1(torch.cat((self.upconv1(d2), e1), dim=1))
+        return self.final_conv(d1)
@@ -0,0 +1,574 @@
+"""
+wiki_client.py
+
+Wikipedia section lookups for the #1$..#4$ commands:
+  - pooled requests.Session with timeouts (httpx.AsyncClient for the async path)
+  - LRU+TTL caches for the section index of a page and the final answer text
+  - on-disk snapshot store of raw API responses (pre-warming, offline replay)
+  - an incremental HTML-to-text parser that streams the answer sentence by
+    sentence and stops parsing once the answer length budget is spent
+  - a stub HTTP server that replays snapshots, for tests and local runs
+
+Usage:
+    python -m internal.wiki_client prewarm Diabetes Asthma Influenza
+    python -m internal.wiki_client serve --port 8765
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from internal.cache import TTLCache
+import internal.metrics as metrics
+
+log = logging.getLogger(__name__)
+
+API_URL = "https://en.wikipedia.org/w/api.php"
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "storage", "wiki_snapshots")
+MAX_ANSWER_CHARS = 1000
+# HTML characters fed to the parser between checks of the answer budget
+PARSE_SLICE = 4096
+
+SECTION_FALLBACKS = {
+    "Overview":  ["Overview", "Introduction", "Summary", "General"],
+    "Symptoms":  ["Symptoms", "Signs and symptoms"],
+    "Causes":    ["Causes",   "Risk factors"],
+    "Treatment": ["Treatment","Management", "Therapy"]
+}
+SECTIONS = tuple(SECTION_FALLBACKS)
+
+_NOT_FOUND = object()
+
+
+def snapshot_key(params: dict) -> str:
+    """Stable key of an API request (format is always json)."""
+    canonical = json.dumps({k: str(v) for k, v in params.items() if k != "format"}, sort_keys=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class SnapshotStore:
+    """Raw API responses stored as one JSON file per request."""
+
+    def __init__(self, root: str = SNAPSHOT_DIR):
+        self.root = root
+
+    def _path(self, params):
+        return os.path.join(self.root, f"{snapshot_key(params)}.json")
+
+    def get(self, params):
+        try:
+            with open(self._path(params), encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def get_by_key(self, key):
+        try:
+            with open(os.path.join(self.root, f"{key}.json"), encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def put(self, params, response):
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "response": response}, f, ensure_ascii=False)
+        os.replace(tmp, self._path(params))
+
+
+def pick_section_index(sections, section):
+    """Index of the requested section (with fallbacks), else of the first section."""
+    for fallback in SECTION_FALLBACKS.get(section, [section]):
+        for s in sections:
+            if fallback.lower() in s["line"].lower():
+                return s["index"]
+    if sections:
+        return sections[0].get("index")
+    return None
+
+
+_CITATION = re.compile(r"\[\d+\]|\[edit\]")
+
+
+class _TextCollector(HTMLParser):
+    """Text nodes in document order, like BeautifulSoup's get_text() (no script/style/comments)."""
+    SKIP = {"script", "style", "template"}
+    PRESERVE = {"pre", "textarea"}
+    ASCII_SPACES = " \n\t\x0c\r"
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self.partial = False   # last piece may continue (text split across feed() calls)
+        self._skipping = 0
+        self._open = []        # open tags; an end tag closes everything up to its start tag, as in bs4
+        self._preserving = 0   # open <pre> / <textarea>: whitespace is kept as is
+
+    def end_piece(self):
+        """The last text node is complete: collapse it like bs4 if it is only whitespace."""
+        if self.partial and not self._preserving and not self.pieces[-1].strip(self.ASCII_SPACES):
+            self.pieces[-1] = "\n" if "\n" in self.pieces[-1] else " "
+        self.partial = False
+
+    def handle_starttag(self, tag, attrs):
+        self.end_piece()
+        if tag in self.SKIP:
+            self._skipping += 1
+        self._open.append(tag)
+        if tag in self.PRESERVE:
+            self._preserving += 1
+
+    def handle_endtag(self, tag):
+        self.end_piece()
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+        if tag in self._open:
+            start = len(self._open) - 1 - self._open[::-1].index(tag)
+            self._preserving -= sum(t in self.PRESERVE for t in self._open[start:])
+            del self._open[start:]
+
+    def handle_startendtag(self, tag, attrs):
+        self.end_piece()
+
+    def handle_comment(self, data):
+        self.end_piece()
+
+    def handle_decl(self, decl):
+        self.end_piece()
+
+    def handle_pi(self, data):
+        self.end_piece()
+
+    def handle_data(self, data):
+        if self._skipping:
+            return
+        if self.partial and self.pieces:
+            self.pieces[-1] += data
+        else:
+            self.pieces.append(data)
+        self.partial = True
+
+
+class AnswerStream:
+    """
+    Incremental truncate_answer(prefix + cleaned section text).
+    feed() returns only text that is final (up to the last full stop seen),
+    so it can be sent right away; the pieces join to exactly the answer
+    section_text() returns. Parsing stops once the answer is known to run
+    past the limit.
+    """
+
+    def __init__(self, prefix: str, limit: int = MAX_ANSWER_CHARS):
+        self.limit = limit
+        self.done = False
+        self._parser = _TextCollector()
+        self._raw = ""        # text nodes joined with " ", not yet cleaned
+        self._text = prefix   # cleaned answer so far
+        self._seen = False    # any non-whitespace text yet
+        self._sent = 0
+
+    def _absorb(self, final=False):
+        pieces = self._parser.pieces
+        # The last text node may continue in the next slice of HTML
+        ready = len(pieces) if final or not self._parser.partial else len(pieces) - 1
+        if ready > 0:
+            joined = " ".join(pieces[:ready])
+            del pieces[:ready]
+            if self._seen:
+                self._raw += " " + joined
+            else:
+                self._raw = joined.lstrip()   # get_text().strip()
+                self._seen = bool(self._raw)
+        if final:
+            self._raw = self._raw.rstrip()
+            cut = len(self._raw)
+        else:
+            # Hold back trailing whitespace (stripped at the end) and an open "[":
+            # no citation match can cross either boundary
+            cut = len(self._raw.rstrip())
+            bracket = self._raw.rfind("[", 0, cut)
+            if bracket != -1 and "]" not in self._raw[bracket:cut]:
+                cut = bracket
+        if cut:
+            self._text += _CITATION.sub("", self._raw[:cut])
+            self._raw = self._raw[cut:]
+
+    def _emit(self, final=False) -> str:
+        text = self._text
+        if len(text) > self.limit:
+            # Everything that follows only extends the part past the limit
+            self.done = True
+            text = truncate_answer(text, self.limit)
+        elif not final:
+            text = text[:text.rfind(".") + 1]
+        piece = text[self._sent:]
+        self._sent = max(self._sent, len(text))
+        return piece
+
+    def feed(self, html: str) -> str:
+        out = []
+        for start in range(0, len(html), PARSE_SLICE):
+            if self.done:
+                break
+            self._parser.feed(html[start:start + PARSE_SLICE])
+            self._absorb()
+            out.append(self._emit())
+        return "".join(out)
+
+    def close(self) -> str:
+        if self.done:
+            return ""
+        self._parser.close()
+        self._parser.end_piece()
+        self._absorb(final=True)
+        self.done = True
+        return self._emit(final=True)
+
+
+def parse_slices(page: str, section: str, section_html: str):
+    """
+    Answer pieces for a section's HTML, one per PARSE_SLICE characters
+    parsed ("" when a slice completed no sentence); stops at the budget.
+    """
+    stream = AnswerStream(answer_prefix(page, section))
+    parse_time = 0.0
+    try:
+        for start in range(0, len(section_html), PARSE_SLICE):
+            began = time.perf_counter()
+            piece = stream.feed(section_html[start:start + PARSE_SLICE])
+            parse_time += time.perf_counter() - began
+            yield piece
+            if stream.done:
+                return
+        yield stream.close()
+    finally:
+        if metrics.ENABLED:
+            metrics.observe("wiki_parse", parse_time)
+
+
+def section_answer(page: str, section: str, section_html: str) -> str:
+    """The answer text for a section's HTML (prefix, cleaned, truncated)."""
+    return "".join(parse_slices(page, section, section_html))
+
+
+def answer_prefix(query: str, section: str) -> str:
+    if section == "Symptoms":
+        return f"Here are common symptoms of {query.capitalize()}:\n\n"
+    elif section == "Causes":
+        return f"Main causes and risk factors for {query.capitalize()}:\n\n"
+    elif section == "Treatment":
+        return f"Treatments and management strategies for {query.capitalize()}:\n\n"
+    return f"Overview of {query.capitalize()}:\n\n"
+
+
+def truncate_answer(response_text: str, limit: int = MAX_ANSWER_CHARS) -> str:
+    """Cut at the last full stop within the limit."""
+    if len(response_text) > limit:
+        last_period = response_text[:limit].rfind(".")
+        response_text = response_text[:last_period + 1] + "..." if last_period != -1 else response_text[:limit] + "..."
+    return response_text
+
+
+class WikipediaClient:
+    def __init__(self, api_url=API_URL, timeout=(3.05, 10), pool_size=10,
+                 cache_size=1024, ttl=6 * 3600, snapshots=None, record=False, offline=False):
+        """
+        :param timeout:   (connect, read) timeout in seconds for every API call
+        :param snapshots: optional SnapshotStore used when the network is unavailable
+        :param record:    also write every successful API response to `snapshots`
+        :param offline:   answer from `snapshots` only, never touch the network
+        """
+        self.api_url = api_url
+        self.timeout = timeout
+        self.snapshots = snapshots
+        self.record = record
+        self.offline = offline
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = "HealthChatBotAI/1.0 (wikipedia section client)"
+
+        self.section_index_cache = TTLCache(cache_size, ttl)
+        self.answer_cache = TTLCache(cache_size, ttl)
+
+    def _api(self, params):
+        """One API call: network (optionally recorded), else the snapshot store."""
+        if not self.offline:
+            try:
+                with metrics.stage("wiki_network"):
+                    response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+                if response.status_code == 200:
+                    data = response.json()
+                    if self.record and self.snapshots is not None:
+                        self.snapshots.put(params, data)
+                    return data
+                log.warning("Wikipedia API returned %s for %s", response.status_code, params)
+            except (requests.RequestException, ValueError) as e:
+                log.warning("Wikipedia API request failed: %s", e)
+        if self.snapshots is not None:
+            return self.snapshots.get(params)
+        return None
+
+    def sections(self, page: str):
+        """Section list of a page (cached); None if the API could not be reached."""
+        sections = self.section_index_cache.get(page, _NOT_FOUND)
+        if sections is not _NOT_FOUND:
+            return sections
+        data = self._api({"action": "parse", "page": page, "format": "json", "prop": "sections"})
+        if data is None:
+            return None
+        sections = data.get("parse", {}).get("sections", [])
+        self.section_index_cache.set(page, sections)
+        return sections
+
+    def section_html(self, page: str, section_number):
+        data = self._api({"action": "parse", "page": page, "format": "json",
+                          "prop": "text", "section": section_number})
+        if data is None:
+            return None
+        return data.get("parse", {}).get("text", {}).get("*", "")
+
+    def section_text(self, page: str, section: str):
+        """
+        Cleaned and truncated answer text for (page, section), or None.
+        Both hits and definitive misses are cached.
+        """
+        return "".join(self.stream_section_text(page, section)) or None
+
+    def stream_section_text(self, page: str, section: str):
+        """
+        section_text() as a generator of pieces, each sent as soon as the
+        parser has finished it; yields nothing when there is no answer.
+        """
+        key = (page, section)
+        answer = self.answer_cache.get(key, _NOT_FOUND)
+        if answer is not _NOT_FOUND:
+            if answer:
+                yield answer
+            return
+
+        sections = self.sections(page)
+        if sections is None:
+            return
+        section_number = pick_section_index(sections, section)
+        if not section_number:
+            self.answer_cache.set(key, None)
+            return
+
+        section_html = self.section_html(page, section_number)
+        if section_html is None:
+            return
+        pieces = []
+        for piece in parse_slices(page, section, section_html):
+            if piece:
+                pieces.append(piece)
+                yield piece
+        self.answer_cache.set(key, "".join(pieces))
+
+    def prewarm(self, pages, sections=SECTIONS):
+        """Fetch every (page, section) once, e.g. with record=True to fill the snapshot store."""
+        for page in pages:
+            for section in sections:
+                self.section_text(page, section)
+
+    def cache_stats(self) -> dict:
+        return {
+            "section_index": self.section_index_cache.stats(),
+            "answers": self.answer_cache.stats(),
+        }
+
+
+class AsyncWikipediaClient:
+    """
+    asyncio twin of WikipediaClient. Shares its caches, snapshot store and
+    settings, so sync and async requests hit the same cache entries.
+    """
+
+    def __init__(self, client: WikipediaClient, pool_size=20):
+        self.client = client
+        self.pool_size = pool_size
+        self._http = None
+        self._loop = None
+
+    def _session(self):
+        # httpx.AsyncClient is bound to the loop that created it
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            connect, read = self.client.timeout
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+                headers={"User-Agent": self.client.session.headers["User-Agent"]},
+            )
+            self._loop = loop
+        return self._http
+
+    async def _api(self, params):
+        client = self.client
+        if not client.offline:
+            try:
+                with metrics.stage("wiki_network"):
+                    response = await self._session().get(client.api_url, params=params)
+                if response.status_code == 200:
+                    data = response.json()
+                    if client.record and client.snapshots is not None:
+                        client.snapshots.put(params, data)
+                    return data
+                log.warning("Wikipedia API returned %s for %s", response.status_code, params)
+            except (httpx.HTTPError, ValueError) as e:
+                log.warning("Wikipedia API request failed: %s", e)
+        if client.snapshots is not None:
+            return client.snapshots.get(params)
+        return None
+
+    async def sections(self, page: str):
+        sections = self.client.section_index_cache.get(page, _NOT_FOUND)
+        if sections is not _NOT_FOUND:
+            return sections
+        data = await self._api({"action": "parse", "page": page, "format": "json", "prop": "sections"})
+        if data is None:
+            return None
+        sections = data.get("parse", {}).get("sections", [])
+        self.client.section_index_cache.set(page, sections)
+        return sections
+
+    async def section_html(self, page: str, section_number):
+        data = await self._api({"action": "parse", "page": page, "format": "json",
+                                "prop": "text", "section": section_number})
+        if data is None:
+            return None
+        return data.get("parse", {}).get("text", {}).get("*", "")
+
+    async def section_text(self, page: str, section: str):
+        """Same contract as WikipediaClient.section_text, without blocking the loop on I/O."""
+        return "".join([piece async for piece in self.stream_section_text(page, section)]) or None
+
+    async def stream_section_text(self, page: str, section: str):
+        """Async twin of WikipediaClient.stream_section_text."""
+        key = (page, section)
+        answer = self.client.answer_cache.get(key, _NOT_FOUND)
+        if answer is not _NOT_FOUND:
+            if answer:
+                yield answer
+            return
+
+        sections = await self.sections(page)
+        if sections is None:
+            return
+        section_number = pick_section_index(sections, section)
+        if not section_number:
+            self.client.answer_cache.set(key, None)
+            return
+
+        section_html = await self.section_html(page, section_number)
+        if section_html is None:
+            return
+        pieces = []
+        for piece in parse_slices(page, section, section_html):
+            if piece:
+                pieces.append(piece)
+                yield piece
+            else:
+                # Parsing is CPU work: let other requests run between slices
+                await asyncio.sleep(0)
+        self.client.answer_cache.set(key, "".join(pieces))
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+class _SnapshotHandler(BaseHTTPRequestHandler):
+    store = None
+
+    def do_GET(self):
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        response = self.store.get_by_key(snapshot_key(params))
+        if response is None:
+            # Same shape the real API uses for unknown pages
+            response = {"error": {"code": "missingtitle"}}
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("stub wikipedia: " + format, *args)
+
+
+def serve_snapshots(store: SnapshotStore, host="127.0.0.1", port=0):
+    """
+    Start a stub Wikipedia API replaying `store` in a background thread.
+    Returns (server, api_url); call server.shutdown() to stop it.
+    """
+    handler = type("SnapshotHandler", (_SnapshotHandler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/w/api.php"
+
+
+def _client_from_env():
+    snapshot_dir = os.environ.get("WIKI_SNAPSHOT_DIR", SNAPSHOT_DIR)
+    return WikipediaClient(
+        api_url=os.environ.get("WIKI_API_URL", API_URL),
+        snapshots=SnapshotStore(snapshot_dir),
+        offline=os.environ.get("WIKI_OFFLINE", "0") == "1",
+    )
+
+
+# Shared by every request of this process
+wiki_client = _client_from_env()
+async_wiki_client = AsyncWikipediaClient(wiki_client)
+metrics.register_gauge("cache_hit_ratio", lambda: wiki_client.section_index_cache.stats()["hit_ratio"],
+                       cache="wiki_section_index")
+metrics.register_gauge("cache_hit_ratio", lambda: wiki_client.answer_cache.stats()["hit_ratio"],
+                       cache="wiki_answers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wikipedia snapshot store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    prewarm = sub.add_parser("prewarm", help="record snapshots for the given pages")
+    prewarm.add_argument("pages", nargs="+")
+    serve = sub.add_parser("serve", help="replay snapshots as a stub API")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.snapshot_dir)
+    if args.command == "prewarm":
+        WikipediaClient(snapshots=store, record=True).prewarm(args.pages)
+        print(f"Recorded snapshots for {len(args.pages)} pages in {args.snapshot_dir}")
+    else:
+        server, url = serve_snapshots(store, args.host, args.port)
+        print(f"Replaying {args.snapshot_dir} at {url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
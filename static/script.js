@@ -6,6 +6,9 @@ const fileInput = document.getElementById("tumor-image");
 const API_TEXT  = "/chat";
 const API_IMAGE = "/brain/segment";
 
+/* ─── Сессия чата: сервер выдаёт id, браузер его запоминает ─── */
+let sessionId = localStorage.getItem("healthbot-session");
+
 /* ─── Создание пузырька ─── */
 function addBubble(txt, who = "bot", html = false) {
   const d = document.createElement("div");
@@ -43,18 +46,76 @@ form.addEventListener("submit", async (e) => {
   try {
     const res = await fetch(API_TEXT, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ message: msg }),
+      headers: { "Content-Type": "application/json", "Accept": "application/x-ndjson" },
+      body: JSON.stringify({ message: msg, session_id: sessionId, stream: true }),
     });
-    const data = await res.json();
-    loader.remove();
-    addBubble(data.answer || "No answer.", "bot");
+    if (!res.ok || !res.body) {
+      // Без потока (ошибка или старый браузер) — обычный JSON
+      const data = await res.json();
+      rememberSession(data.session_id);
+      loader.remove();
+      addBubble(data.answer || data.error || "No answer.", "bot");
+      return;
+    }
+    await renderStream(res.body, loader);
   } catch {
     loader.remove();
     addBubble("❌ Error connecting to server.", "bot");
   }
 });
 
+function rememberSession(id) {
+  if (id && id !== sessionId) {
+    sessionId = id;
+    localStorage.setItem("healthbot-session", sessionId);
+  }
+}
+
+/* ─── Потоковый ответ: по одному JSON-событию в строке (ack, chunk…, done) ─── */
+async function renderStream(body, loader) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let bubble = null;
+
+  const handle = (event) => {
+    if (event.type === "ack") {
+      rememberSession(event.session_id);
+    } else if (event.type === "chunk") {
+      // Первый фрагмент заменяет анимацию загрузки, следующие дописываются
+      if (!bubble) {
+        loader.remove();
+        bubble = document.createElement("div");
+        bubble.classList.add("bubble", "bot");
+        log.appendChild(bubble);
+      }
+      bubble.textContent += event.text;
+      log.scrollTop = log.scrollHeight;
+    } else if (event.type === "done") {
+      if (!bubble) {
+        loader.remove();
+        addBubble(event.answer || "No answer.", "bot");
+      } else if (event.answer && bubble.textContent !== event.answer) {
+        bubble.textContent = event.answer;
+      }
+    }
+  };
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop();
+    lines.filter((line) => line.trim()).forEach((line) => handle(JSON.parse(line)));
+  }
+  if (buffer.trim()) handle(JSON.parse(buffer));
+  if (!bubble && loader.isConnected) {
+    loader.remove();
+    addBubble("No answer.", "bot");
+  }
+}
+
 /* ─── Загрузка изображения ─── */
 fileInput.addEventListener("change", async () => {
   const f = fileInput.files[0];